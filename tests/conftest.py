@@ -0,0 +1,16 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import maya.cmds
+except ImportError:
+    # empty stand-ins so modules importing maya load headless, tests patch every Maya call they reach
+    for module_name in ['maya', 'maya.cmds', 'maya.mel', 'maya.api', 'maya.api.OpenMaya', 'maya.api.OpenMayaAnim']:
+        sys.modules[module_name] = types.ModuleType(module_name)
+
+        package_name, _, attribute_name = module_name.rpartition('.')
+        if package_name:
+            setattr(sys.modules[package_name], attribute_name, sys.modules[module_name])
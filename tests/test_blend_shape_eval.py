@@ -0,0 +1,128 @@
+import collections
+
+import numpy as np
+import pytest
+
+import tpRig.tpBlendShapeEval as tpBlendShapeEval
+
+
+def _grid_sheet(size, spacing, height, first_vertex):
+    x_grid, y_grid = np.meshgrid(np.arange(size) * spacing, np.arange(size) * spacing)
+    points = np.stack([x_grid.ravel(), y_grid.ravel(), np.full(size * size, height)], axis=1)
+
+    triangle_list = []
+    for row in range(size - 1):
+        for column in range(size - 1):
+            vertex = first_vertex + row * size + column
+            triangle_list += [[vertex, vertex + 1, vertex + size], [vertex + 1, vertex + size + 1, vertex + size]]
+
+    return points, np.array(triangle_list)
+
+
+@pytest.fixture(scope='module')
+def stacked_sheets():
+    # two sheets closer than half an edge length, like closed lips
+    size = 10
+    bottom_points, bottom_triangles = _grid_sheet(size, 0.1, 0.0, 0)
+    top_points, top_triangles = _grid_sheet(size, 0.1, 0.04, size * size)
+
+    return (np.concatenate([bottom_points, top_points]), np.concatenate([bottom_triangles, top_triangles]),
+            np.arange(size * size, 2 * size * size))
+
+
+def _random_target_dict(vertex_count, random_state):
+    target_dict = collections.OrderedDict()
+
+    for target_id in range(6):
+        vertex_ids = np.sort(random_state.choice(vertex_count, 40, replace=False))
+        target_dict['target{}_geo'.format(target_id)] = {
+            tpBlendShapeEval.TARGET_ITEM_INDEX: (vertex_ids, random_state.randn(40, 3) * 0.01)}
+
+        if target_id % 2 == 0:
+            vertex_ids = np.sort(random_state.choice(vertex_count, 25, replace=False))
+            target_dict['target{}_geo'.format(target_id)][5400] = (vertex_ids, random_state.randn(25, 3) * 0.01)
+
+    return target_dict
+
+
+def test_interpolate_target_deltas_between_in_betweens():
+    full_deltas = np.array([[0.0, 0.0, 1.0], [0.0, 2.0, 0.0]])
+    in_between_deltas = np.array([[1.0, 0.0, 0.0]])
+    item_dict = {6000: (np.array([0, 2]), full_deltas), 5500: (np.array([1]), in_between_deltas)}
+
+    assert np.allclose(tpBlendShapeEval.interpolate_target_deltas(item_dict, 0.5, 3),
+                       [[0, 0, 0], [1, 0, 0], [0, 0, 0]])
+    assert np.allclose(tpBlendShapeEval.interpolate_target_deltas(item_dict, 0.25, 3),
+                       [[0, 0, 0], [0.5, 0, 0], [0, 0, 0]])
+    assert np.allclose(tpBlendShapeEval.interpolate_target_deltas(item_dict, 0.75, 3),
+                       [[0, 0, 0.5], [0.5, 0, 0], [0, 1, 0]])
+    assert np.allclose(tpBlendShapeEval.interpolate_target_deltas(item_dict, 1.0, 3),
+                       [[0, 0, 1], [0, 0, 0], [0, 2, 0]])
+
+
+def test_evaluate_matches_per_target_interpolation(stacked_sheets):
+    base_points = stacked_sheets[0]
+    vertex_count = len(base_points)
+    random_state = np.random.RandomState(0)
+    target_dict = _random_target_dict(vertex_count, random_state)
+    target_scale = random_state.rand(len(target_dict), vertex_count)
+
+    evaluator = tpBlendShapeEval.BlendShapeEvaluator(base_points, target_dict, target_scale=target_scale)
+    weight_matrix = random_state.rand(12, len(target_dict)) * 1.6 - 0.3
+    weight_matrix[0] = 0.0
+    weight_matrix[1, 0] = 0.4
+
+    points = evaluator.evaluate(weight_matrix)
+
+    assert points.shape == (len(weight_matrix), vertex_count, 3)
+    assert np.allclose(points[0], base_points)
+    for batch_id, weights in enumerate(weight_matrix):
+        expected_points = base_points.copy()
+        for row, item_dict in enumerate(target_dict.values()):
+            expected_points += (tpBlendShapeEval.interpolate_target_deltas(item_dict, weights[row], vertex_count) *
+                                target_scale[row][:, None])
+
+        assert np.allclose(points[batch_id], expected_points)
+
+
+def test_analyze_reports_displacement_and_crossed_contacts(stacked_sheets):
+    base_points, triangles, top_ids = stacked_sheets
+    target_dict = collections.OrderedDict([
+        ('press_geo', {6000: (top_ids, np.tile([0.0, 0.0, -0.08], (len(top_ids), 1)))}),
+        ('lift_geo', {6000: (top_ids, np.tile([0.0, 0.0, 0.02], (len(top_ids), 1)))})])
+    evaluator = tpBlendShapeEval.BlendShapeEvaluator(base_points, target_dict, triangles)
+
+    weight_matrix = evaluator.get_weight_matrix([{}, {'press_geo': 0.25}, {'press_geo': 1.0}, {'lift_geo': 1.0}])
+    report_dict = evaluator.analyze(weight_matrix, chunk_size=3)
+
+    assert list(report_dict) == ['max_displacement', 'max_displacement_vertex', 'flipped_triangles',
+                                 'collapsed_triangles', 'crossed_contacts']
+    assert np.allclose(report_dict['max_displacement'], [0.0, 0.02, 0.08, 0.02])
+    assert set(report_dict['max_displacement_vertex'][1:].tolist()) <= set(top_ids.tolist())
+    assert report_dict['crossed_contacts'][0] == 0
+    assert report_dict['crossed_contacts'][1] == 0
+    assert report_dict['crossed_contacts'][2] > 0
+    assert report_dict['crossed_contacts'][3] == 0
+    assert report_dict['flipped_triangles'].tolist() == [0, 0, 0, 0]
+
+
+def test_analyze_reports_flipped_and_collapsed_triangles():
+    base_points = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    target_dict = {'fold_geo': {6000: (np.array([2]), np.array([[0.0, -2.0, 0.0]]))}}
+    evaluator = tpBlendShapeEval.BlendShapeEvaluator(base_points, target_dict, [[0, 1, 2]])
+
+    report_dict = evaluator.analyze([[0.0], [0.5], [1.0]])
+
+    assert report_dict['flipped_triangles'].tolist() == [0, 0, 1]
+    assert report_dict['collapsed_triangles'].tolist() == [0, 1, 0]
+
+
+def test_get_weight_matrix_rejects_unknown_targets(stacked_sheets):
+    evaluator = tpBlendShapeEval.BlendShapeEvaluator(
+        stacked_sheets[0], _random_target_dict(len(stacked_sheets[0]), np.random.RandomState(2)))
+
+    weight_matrix = evaluator.get_weight_matrix([{'target1_geo': 0.5}])
+    assert weight_matrix[0].tolist() == [0.0, 0.5, 0.0, 0.0, 0.0, 0.0]
+
+    with pytest.raises(RuntimeError):
+        evaluator.get_weight_matrix([{'missing_geo': 1.0}])
@@ -0,0 +1,196 @@
+import numpy as np
+import pytest
+
+import tpRig.tpSkinWeights as tpSkinWeights
+
+
+def _random_weight_matrix(vertex_count, influence_count, seed=0, zero_ratio=0.6):
+    random_state = np.random.RandomState(seed)
+    weight_matrix = random_state.rand(vertex_count, influence_count)
+    weight_matrix[random_state.rand(vertex_count, influence_count) < zero_ratio] = 0.0
+    weight_matrix[np.arange(vertex_count), random_state.randint(influence_count, size=vertex_count)] += 0.5
+
+    return weight_matrix / weight_matrix.sum(axis=1, keepdims=True)
+
+
+def _path_adjacency(vertex_count):
+    # vertices on a line, each connected to the previous and next one
+    neighbour_list = [[neighbour for neighbour in (vertex - 1, vertex + 1) if 0 <= neighbour < vertex_count]
+                      for vertex in range(vertex_count)]
+    offsets = np.cumsum([0] + [len(neighbours) for neighbours in neighbour_list])
+
+    return offsets, np.array(sum(neighbour_list, []), dtype=np.int64)
+
+
+# MATRIX CONVERSION
+
+def test_csr_round_trip():
+    weight_matrix = _random_weight_matrix(40, 7)
+
+    offsets, influence_indices, weights = tpSkinWeights.weight_matrix_to_csr(weight_matrix)
+
+    assert offsets[-1] == np.count_nonzero(weight_matrix)
+    assert influence_indices.dtype == np.uint16
+    assert np.allclose(tpSkinWeights.csr_to_weight_matrix(offsets, influence_indices, weights, 7), weight_matrix,
+                       atol=1e-7)
+
+
+def test_csr_threshold_drops_small_weights():
+    weight_matrix = np.array([[0.5, 0.001, 0.499], [0.0, 1.0, 0.0]])
+
+    offsets, influence_indices, weights = tpSkinWeights.weight_matrix_to_csr(weight_matrix, threshold_value=0.01)
+
+    assert offsets.tolist() == [0, 2, 3]
+    assert influence_indices.tolist() == [0, 2, 1]
+    assert np.allclose(weights, [0.5, 0.499, 1.0])
+
+
+def test_vertex_dict_to_rows_matches_vertex_dict_export():
+    weight_matrix = _random_weight_matrix(12, 5, seed=1)
+    influence_list = ['joint{}'.format(column) for column in range(5)]
+    vertex_dict = tpSkinWeights.weight_matrix_to_vertex_dict('body_geo', weight_matrix, influence_list)
+
+    vertex_ids, row_matrix, row_influence_list = tpSkinWeights.vertex_dict_to_rows(vertex_dict)
+
+    columns = [influence_list.index(influence) for influence in row_influence_list]
+    restored_matrix = np.zeros_like(weight_matrix)
+    restored_matrix[np.ix_(vertex_ids, columns)] = row_matrix
+
+    assert np.allclose(restored_matrix, weight_matrix, atol=1e-7)
+
+
+def test_vertex_dict_to_rows_reads_vertex_ids():
+    vertex_dict = {'body_geo.vtx[7]': [('a', 0.25), ('b', 0.75)], 'body_geo.vtx[2]': [('b', 1.0)]}
+
+    vertex_ids, row_matrix, influence_list = tpSkinWeights.vertex_dict_to_rows(vertex_dict)
+    row_dict = dict((vertex_id, dict(zip(influence_list, row)))
+                    for vertex_id, row in zip(vertex_ids.tolist(), row_matrix.tolist()))
+
+    assert sorted(influence_list) == ['a', 'b']
+    assert row_dict == {7: {'a': 0.25, 'b': 0.75}, 2: {'a': 0.0, 'b': 1.0}}
+
+
+# WEIGHT CONDITIONING
+
+def test_normalize_keeps_zero_rows_and_locked_columns():
+    weight_matrix = np.array([[1.0, 1.0, 2.0], [0.0, 0.0, 0.0], [0.4, 0.3, 0.9]])
+
+    normalized_matrix = tpSkinWeights.normalize_weight_matrix(weight_matrix)
+    assert np.allclose(normalized_matrix.sum(axis=1), [1.0, 0.0, 1.0])
+    assert np.allclose(normalized_matrix[0], [0.25, 0.25, 0.5])
+
+    locked_matrix = tpSkinWeights.normalize_weight_matrix(weight_matrix, locked_columns=[0])
+    assert np.allclose(locked_matrix[:, 0], weight_matrix[:, 0])
+    assert np.allclose(locked_matrix[2], [0.4, 0.15, 0.45])
+    assert np.allclose(weight_matrix[0], [1.0, 1.0, 2.0])
+
+
+def test_prune_skips_locked_columns():
+    weight_matrix = np.array([[0.004, 0.5, 0.496], [0.001, 0.002, 0.997]])
+
+    pruned_matrix = tpSkinWeights.prune_weight_matrix(weight_matrix, 0.005, locked_columns=[1])
+
+    assert pruned_matrix.tolist() == [[0.0, 0.5, 0.496], [0.0, 0.002, 0.997]]
+
+
+def test_limit_influences_keeps_largest_weights():
+    weight_matrix = _random_weight_matrix(60, 9, seed=2, zero_ratio=0.1)
+
+    limited_matrix = tpSkinWeights.limit_weight_matrix_influences(weight_matrix, max_influences=3)
+
+    assert np.count_nonzero(limited_matrix, axis=1).max() == 3
+    for row, limited_row in zip(weight_matrix, limited_matrix):
+        kept_columns = np.flatnonzero(limited_row)
+        assert np.allclose(limited_row[kept_columns], row[kept_columns])
+        assert row[kept_columns].min() >= np.sort(row)[-3]
+
+
+def test_limit_influences_breaks_ties_in_column_order():
+    weight_matrix = np.array([[0.2, 0.2, 0.2, 0.2, 0.2], [0.1, 0.3, 0.3, 0.3, 0.0]])
+
+    limited_matrix = tpSkinWeights.limit_weight_matrix_influences(weight_matrix, max_influences=2)
+
+    assert limited_matrix.tolist() == [[0.2, 0.2, 0.0, 0.0, 0.0], [0.0, 0.3, 0.3, 0.0, 0.0]]
+
+
+def test_limit_influences_counts_locked_columns():
+    weight_matrix = np.array([[0.1, 0.2, 0.3, 0.4], [0.0, 0.2, 0.3, 0.5]])
+
+    limited_matrix = tpSkinWeights.limit_weight_matrix_influences(weight_matrix, max_influences=2,
+                                                                  locked_columns=[0])
+
+    assert limited_matrix.tolist() == [[0.1, 0.0, 0.0, 0.4], [0.0, 0.0, 0.3, 0.5]]
+
+
+# QUANTIZATION
+
+def test_quantize_round_trip_within_error_budget():
+    weight_matrix = _random_weight_matrix(200, 6, seed=3)
+
+    quantized_matrix, quantization = tpSkinWeights.quantize_weight_matrix(weight_matrix)
+    restored_matrix = tpSkinWeights.dequantize_weight_matrix(quantized_matrix, quantization)
+
+    assert quantized_matrix.dtype == np.uint16
+    assert quantization['max_error'] <= tpSkinWeights.QUANTIZATION_ERROR_BUDGET
+    assert np.abs(restored_matrix - weight_matrix).max() <= tpSkinWeights.QUANTIZATION_ERROR_BUDGET
+    assert np.allclose(restored_matrix.sum(axis=1), 1.0)
+
+
+def test_dequantize_rejects_bad_data():
+    quantized_matrix, quantization = tpSkinWeights.quantize_weight_matrix(_random_weight_matrix(20, 4, seed=4))
+
+    corrupt_matrix = quantized_matrix.copy()
+    corrupt_matrix[5] //= 2
+    with pytest.raises(RuntimeError):
+        tpSkinWeights.dequantize_weight_matrix(corrupt_matrix, quantization)
+
+    over_budget = dict(quantization, max_error=10 * tpSkinWeights.QUANTIZATION_ERROR_BUDGET)
+    with pytest.raises(RuntimeError):
+        tpSkinWeights.dequantize_weight_matrix(quantized_matrix, over_budget)
+
+
+# WEIGHT SMOOTHING
+
+def test_smooth_relaxes_only_the_given_vertices():
+    offsets, neighbour_ids = _path_adjacency(5)
+    weight_matrix = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0], [1.0, 0.0], [1.0, 0.0]])
+
+    smoothed_matrix = tpSkinWeights.smooth_weight_matrix(weight_matrix, offsets, neighbour_ids, vertex_ids=[2],
+                                                         iterations=1, strength=0.5)
+
+    assert np.allclose(smoothed_matrix[2], [0.5, 0.5])
+    assert np.allclose(np.delete(smoothed_matrix, 2, axis=0), np.delete(weight_matrix, 2, axis=0))
+    assert np.allclose(weight_matrix[2], [0.0, 1.0])
+
+
+def test_smooth_keeps_uniform_weights_and_normalizes():
+    offsets, neighbour_ids = _path_adjacency(6)
+    uniform_matrix = np.tile([0.25, 0.75, 0.0], (6, 1))
+
+    assert np.allclose(tpSkinWeights.smooth_weight_matrix(uniform_matrix, offsets, neighbour_ids), uniform_matrix)
+
+    weight_matrix = _random_weight_matrix(6, 3, seed=5)
+    smoothed_matrix = tpSkinWeights.smooth_weight_matrix(weight_matrix, offsets, neighbour_ids, iterations=10,
+                                                         strength=1.0, locked_columns=[2])
+
+    assert np.allclose(smoothed_matrix.sum(axis=1), 1.0)
+    assert np.allclose(smoothed_matrix[:, 2], weight_matrix[:, 2])
+    assert smoothed_matrix[:, 0].std() < weight_matrix[:, 0].std()
+
+
+# WEIGHT MIRROR
+
+def test_mirror_swaps_vertices_and_influences():
+    # vertices 0 and 1 mirror 2 and 3, vertex 4 sits on the center line
+    weight_matrix = np.array([[0.7, 0.3, 0.0], [0.2, 0.0, 0.8], [0.0, 0.0, 1.0], [1.0, 0.0, 0.0], [0.5, 0.5, 0.0]])
+    mirror_ids = np.array([2, 3, 0, 1, 4])
+    mirror_columns, unmatched_influence_list = tpSkinWeights.get_influence_mirror_columns(
+        ['l_arm_jnt', 'ct_spine_jnt', 'r_arm_jnt'])
+
+    mirrored_matrix = tpSkinWeights.mirror_weight_matrix(weight_matrix, mirror_ids, mirror_columns,
+                                                         np.array([False, False, True, True, True]))
+
+    assert mirror_columns.tolist() == [2, 1, 0]
+    assert unmatched_influence_list == []
+    assert mirrored_matrix.tolist() == [[0.7, 0.3, 0.0], [0.2, 0.0, 0.8], [0.0, 0.3, 0.7], [0.8, 0.0, 0.2],
+                                        [0.0, 0.5, 0.5]]
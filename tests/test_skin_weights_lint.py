@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+
+import tpRig.tpSkinWeights as tpSkinWeights
+
+
+def _export_versioned(monkeypatch, dir_path, weight_matrix, influence_list):
+    monkeypatch.setattr(tpSkinWeights, 'get_skin_cluster', lambda geometry: 'skinCluster_' + geometry)
+    monkeypatch.setattr(tpSkinWeights, 'get_weight_matrix', lambda skin_cluster: (weight_matrix.copy(),
+                                                                                 list(influence_list)))
+    monkeypatch.setattr(tpSkinWeights, 'get_blend_weights', lambda skin_cluster: np.zeros(len(weight_matrix)))
+
+    return tpSkinWeights.export_versioned_skin_weights(['geoA'], str(dir_path), 'model')
+
+
+def test_lint_reads_versioned_export_through_its_chain(monkeypatch, tmp_path):
+    weight_matrix = np.random.RandomState(0).rand(50, 4)
+    weight_matrix /= weight_matrix.sum(axis=1, keepdims=True)
+
+    _export_versioned(monkeypatch, tmp_path, weight_matrix, ['a', 'b', 'c', 'd'])
+    assert any(file_name.endswith(tpSkinWeights.SPARSE_EXTENSION) for file_name in os.listdir(str(tmp_path)))
+
+    report = tpSkinWeights.lint_skin_weights_dirs([str(tmp_path)])
+
+    assert report['file_error_list'] == []
+    assert report['mesh_count'] == 1
+    assert report['passed']
+
+
+def test_lint_flags_versioned_export_faults(monkeypatch, tmp_path):
+    weight_matrix = np.random.RandomState(1).rand(50, 4)
+    weight_matrix /= weight_matrix.sum(axis=1, keepdims=True)
+    weight_matrix[3] = 0.0
+
+    _export_versioned(monkeypatch, tmp_path, weight_matrix, ['a', 'b', 'c', 'd'])
+    report = tpSkinWeights.lint_skin_weights_dirs([str(tmp_path)])
+
+    assert report['file_error_list'] == []
+    assert report['failed_mesh_list'] == ['geoA']
+    assert report['meshes'][0]['zero_weight']['vertex_ids'] == [3]
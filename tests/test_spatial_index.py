@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from tpRig.tpSpatialIndex import PointGrid
+
+
+@pytest.fixture(scope='module')
+def point_data():
+    random_state = np.random.RandomState(1)
+
+    # points on a sphere patch like a mesh surface, queries near it and far outside the grid
+    angles = random_state.rand(3000, 2) * np.pi
+    points = np.stack([np.sin(angles[:, 0]) * np.cos(angles[:, 1] * 2),
+                       np.sin(angles[:, 0]) * np.sin(angles[:, 1] * 2),
+                       np.cos(angles[:, 0])], axis=1)
+    query_points = np.concatenate([points[:300] + random_state.randn(300, 3) * 0.01,
+                                   random_state.randn(20, 3) * 5.0])
+    distances = np.linalg.norm(query_points[:, None] - points[None], axis=2)
+
+    return PointGrid(points), query_points, distances
+
+
+def test_nearest_matches_brute_force(point_data):
+    grid, query_points, distances = point_data
+
+    index_array, distance_array = grid.nearest(query_points, chunk_size=64)
+
+    assert np.array_equal(index_array, distances.argmin(axis=1))
+    assert np.allclose(distance_array, distances.min(axis=1))
+
+
+def test_k_nearest_matches_brute_force(point_data):
+    grid, query_points, distances = point_data
+
+    index_array, distance_array = grid.k_nearest(query_points, 8, chunk_size=64)
+
+    assert index_array.shape == (len(query_points), 8)
+    assert np.allclose(distance_array, np.sort(distances, axis=1)[:, :8])
+    assert np.allclose(distances[np.arange(len(query_points))[:, None], index_array], distance_array)
+
+
+def test_k_nearest_caps_k_to_point_count(point_data):
+    grid, query_points, distances = point_data
+
+    index_array, distance_array = grid.k_nearest(query_points[:2], len(grid.points) + 10)
+
+    assert index_array.shape == (2, len(grid.points))
+    assert np.allclose(distance_array, np.sort(distances[:2], axis=1))
+
+
+def test_within_radius_matches_brute_force(point_data):
+    grid, query_points, distances = point_data
+    radius = 0.05
+
+    offsets, index_array, distance_array = grid.within_radius(query_points, radius, chunk_size=64)
+
+    assert len(offsets) == len(query_points) + 1
+    for query_id in range(len(query_points)):
+        query_slice = slice(offsets[query_id], offsets[query_id + 1])
+
+        assert np.array_equal(np.sort(index_array[query_slice]), np.flatnonzero(distances[query_id] <= radius))
+        assert np.allclose(distance_array[query_slice], distances[query_id, index_array[query_slice]])
+        assert np.all(np.diff(distance_array[query_slice]) >= 0.0)
+
+
+def test_within_radius_without_queries(point_data):
+    grid = point_data[0]
+
+    offsets, index_array, distance_array = grid.within_radius(np.zeros((0, 3)), 0.1)
+
+    assert offsets.tolist() == [0]
+    assert len(index_array) == len(distance_array) == 0
@@ -15,11 +15,11 @@
 #-------------------------------------------------------------------------------
 
 from __future__ import division
-import maya.api.OpenMaya as om2
 import maya.OpenMaya as om
 import maya.cmds as cmds
 import maya.mel as mel
-import math
+
+import tpRig.tpMeshData as tpMeshData
 
 '''
 DEV LIST
@@ -953,14 +953,14 @@ def tp_buildCtrl(ctrl_type="circle", name="", sufix="_Ctrl", scale=1, spaced=1,
 
 # Not in use
 def mirror_vertex_selection(vert_list, mesh):
-    """ Mirror selection translation values and feeds to getClosest function"""
+    """ Mirror selection translation values and finds the nearest vertex of the closest face to each"""
     vert_list = cmds.filterExpand(vert_list, sm=31)
-    mirror_vert_list = []
+    vertPosList = cmds.xform(vert_list, q=1, t=1)
+    mirror_pos_list = [[vertPosList[i] * -1, vertPosList[i + 1], vertPosList[i + 2]]
+                       for i in range(0, len(vertPosList), 3)]
 
-    for vert in vert_list:
-        vertPos = cmds.xform(vert, q=1, t=1)
-        mirror_pos = [(vertPos[0] * -1), vertPos[1], vertPos[2]]
-        mirror_vert_list.append(getClosestVertex_v2(mesh, mirror_pos))
+    vertex_ids = tpMeshData.get_closest_face_vertex_ids(mesh, mirror_pos_list)
+    mirror_vert_list = ['{}.vtx[{}]'.format(mesh, vertex_id) for vertex_id in vertex_ids.tolist()]
     
     # cmds.select(mirror_vert_list, r=1)
 
@@ -971,35 +971,10 @@ def mirror_vertex_selection(vert_list, mesh):
 
 def getClosestVertex_v2(mayaMesh, pos=[0,0,0]):
     """ Returns the closest vertex given a mesh and a position [x,y,z] in world space.
-        Uses om2.MfnMesh.getClosestPoint() returned face ID and iterates through face's vertices."""
-
-    # Using MVector type to represent position
-    mVector = om2.MVector(pos) 
-    selectionList = om2.MSelectionList()
-    selectionList.add(mayaMesh)
-    dPath = selectionList.get_dag_path(0)
-    mMesh = om2.MFnMesh(dPath)
-    # Getting closest face ID
-    face_ID = mMesh.getClosestPoint(om2.MPoint(mVector), space=om2.MSpace.kWorld)[1]
-    # Face's vertices list
-    vert_list = cmds.ls(cmds.polyListComponentConversion('{}.f[{}]'.format(mayaMesh, face_ID), ff=True, tv=True), flatten=True)
-    
-    # Setting vertex [0] as the closest one
-    dist_01 = om2.MVector(cmds.xform(vert_list[0], t=True, ws=True, q=True))
-    smallestDist = math.sqrt((dist_01.x - pos[0])**2 + (dist_01.y - pos[1])**2 + (dist_01.z - pos[2])**2)
-    # Using distance squared to compare distance
-    closest = vert_list[0]
-
-    # Iterating from vertex [1]
-    for i in range(1, len(vert_list)) :
-        dist_02 = om2.MVector(cmds.xform(vert_list[i], t=True, ws=True, q=True))
-        eucDist = math.sqrt((dist_02.x - pos[0])**2 + (dist_02.y - pos[1])**2 + (dist_02.z - pos[2])**2)
-        
-        if eucDist <= smallestDist:
-            smallestDist = eucDist
-            closest = vert_list[i]
+        Nearest vertex of the closest face, see tpMeshData.get_closest_face_vertex_ids."""
+    vertex_id = tpMeshData.get_closest_face_vertex_ids(mayaMesh, [pos])[0]
 
-    return closest
+    return '{}.vtx[{}]'.format(mayaMesh, vertex_id)
 
 
 def mirrorSelection(selection):
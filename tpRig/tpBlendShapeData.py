@@ -0,0 +1,1189 @@
+import os
+import re
+import csv
+import json
+import itertools
+import collections
+
+import maya.cmds as cmds
+import maya.api.OpenMaya as om2
+import maya.api.OpenMayaAnim as om2Anim
+
+import numpy as np
+
+import tpRig.tpMeshData as tpMeshData
+import tpRig.tpBlendShapeEval as tpBlendShapeEval
+
+
+# Bulk blendShape readers and writers - target data goes in and out as NumPy arrays
+
+
+TARGET_WEIGHTS_PLUG = '{}.inputTarget[{}].inputTargetGroup[{}].targetWeights'
+
+# archive format and target items are shared with the offline evaluator
+DELTA_ARCHIVE_VERSION = tpBlendShapeEval.DELTA_ARCHIVE_VERSION
+DELTA_ARCHIVE_EXTENSION = '.npz'
+MANIFEST_SUFFIX = tpBlendShapeEval.MANIFEST_SUFFIX
+TARGET_ITEM_INDEX = tpBlendShapeEval.TARGET_ITEM_INDEX
+
+WEIGHT_MAP_LIBRARY_VERSION = 1
+WEIGHT_MAP_INDEX_FILE_NAME = 'weight_map_library.json'
+
+_weight_alias_pattern = re.compile(r'^weight\[(\d+)\]$')
+_map_name_pattern = re.compile(r'^[\w.-]+$')
+
+
+# BLENDSHAPE NODE ACCESS
+
+def get_blend_shape_node(geometry):
+    """
+    Returns the first blendShape in the history of the geometry, None if there is none.
+    :param geometry:
+    :return blend_shape_node:
+    """
+    blend_shape_list = cmds.ls(cmds.listHistory(geometry, pruneDagObjects=True) or [], type='blendShape')
+
+    return blend_shape_list[0] if blend_shape_list else None
+
+
+def get_blend_shape_geometry(blend_shape_node, geometry_index=0):
+    """
+    :param blend_shape_node:
+    :param geometry_index:
+    :return geometry: deformed shape at geometry_index
+    """
+    geometry_list = cmds.blendShape(blend_shape_node, query=True, geometry=True) or []
+    geometry_index_list = cmds.blendShape(blend_shape_node, query=True, geometryIndices=True) or []
+
+    if geometry_index not in geometry_index_list:
+        raise RuntimeError('{} has no geometry at index {}'.format(blend_shape_node, geometry_index))
+
+    return geometry_list[geometry_index_list.index(geometry_index)]
+
+
+def get_geometry_index(blend_shape_node, geometry):
+    """
+    :param blend_shape_node:
+    :param geometry: transform or shape
+    :return geometry_index: inputTarget index of the geometry on the node
+    """
+    shape = tpMeshData.get_mesh_dag_path(geometry).fullPathName()
+    geometry_list = cmds.blendShape(blend_shape_node, query=True, geometry=True) or []
+    geometry_index_list = cmds.blendShape(blend_shape_node, query=True, geometryIndices=True) or []
+
+    for node_geometry, geometry_index in zip(geometry_list, geometry_index_list):
+        if cmds.ls(node_geometry, long=True)[0] == shape:
+            return geometry_index
+
+    raise RuntimeError('{} does not deform {}'.format(blend_shape_node, geometry))
+
+
+def get_target_alias_dict(blend_shape_node):
+    """
+    Reads every target weight alias of the node in one query.
+    Targets without an alias are named after their attribute, ie. 'weight[3]'.
+
+    :param blend_shape_node:
+    :return target_alias_dict: {target_index: alias}, in target index order
+    """
+    target_index_list = cmds.getAttr('{}.weight'.format(blend_shape_node), multiIndices=True) or []
+    target_alias_dict = dict((target_index, 'weight[{}]'.format(target_index)) for target_index in target_index_list)
+
+    alias_list = cmds.aliasAttr(blend_shape_node, query=True) or []
+    for alias, attribute in zip(alias_list[::2], alias_list[1::2]):
+        weight_match = _weight_alias_pattern.match(attribute)
+
+        if weight_match:
+            target_alias_dict[int(weight_match.group(1))] = alias
+
+    return collections.OrderedDict(sorted(target_alias_dict.items()))
+
+
+# TARGET ADDITION
+
+def plan_blend_shape_targets(shape_group_list, geometry_list):
+    """
+    Works out, without editing the scene, which shapes become targets of which geometry.
+    A shape goes to every geometry whose name it contains, in shape group order.
+    Geometry without a blendShape gets a new '{geometry}_blendShape_node' (minus '_geo'),
+    other targets are appended after the last target index of the existing node.
+
+    :param shape_group_list: [[shape, ...], ...] ie. the children of each pose group
+    :param geometry_list:
+    :return plan: [{'geometry', 'blend_shape_node', 'create', 'targets': [(target_index, shape)]}]
+    """
+    plan = []
+
+    for geometry in geometry_list:
+        shape_list = [shape for shape_group in shape_group_list for shape in shape_group if geometry in shape]
+        if not shape_list:
+            continue
+
+        blend_shape_node = get_blend_shape_node(geometry)
+        create = not blend_shape_node
+
+        if create:
+            blend_shape_node = '{}_blendShape_node'.format(geometry.replace('_geo', ''))
+            first_target_index = 0
+        else:
+            target_alias_dict = get_target_alias_dict(blend_shape_node)
+            first_target_index = max(target_alias_dict.keys()) + 1 if target_alias_dict else 0
+
+        plan.append({
+            'geometry': geometry,
+            'blend_shape_node': blend_shape_node,
+            'create': create,
+            'targets': list(enumerate(shape_list, first_target_index))
+        })
+
+    return plan
+
+
+def apply_blend_shape_target_plan(plan):
+    """
+    Adds the targets of a plan_blend_shape_targets plan, one blendShape command per geometry.
+    :param plan:
+    :return blend_shape_node_list:
+    """
+    blend_shape_node_list = []
+
+    for geometry_plan in plan:
+        shape_list = [shape for _, shape in geometry_plan['targets']]
+
+        if geometry_plan['create']:
+            blend_shape_node = cmds.blendShape(shape_list + [geometry_plan['geometry']],
+                                               name=geometry_plan['blend_shape_node'])[0]
+        else:
+            blend_shape_node = geometry_plan['blend_shape_node']
+            cmds.blendShape(blend_shape_node,
+                            edit=True,
+                            target=[(geometry_plan['geometry'], target_index, shape, 1.0)
+                                    for target_index, shape in geometry_plan['targets']])
+
+        blend_shape_node_list.append(blend_shape_node)
+
+    return blend_shape_node_list
+
+
+def print_blend_shape_target_plan(plan):
+    for geometry_plan in plan:
+        print('[BlendShape Targets] {} - {} {} targets {}'.format(
+            geometry_plan['geometry'],
+            'create' if geometry_plan['create'] else 'edit',
+            geometry_plan['blend_shape_node'],
+            ', '.join('{}:{}'.format(target_index, shape) for target_index, shape in geometry_plan['targets'])))
+
+
+# TARGET CONNECTION
+
+def build_target_token_index(target_list):
+    """
+    Indexes target names by their '_' separated tokens, in any order.
+    :param target_list:
+    :return token_index: {sorted token tuple: [target, ...]}
+    """
+    token_index = collections.defaultdict(list)
+
+    for target in target_list:
+        token_index[tuple(sorted(target.split('_')))].append(target)
+
+    return token_index
+
+
+def match_pose_targets(pose_name_list, token_index, geometry_name):
+    """
+    Finds the targets of each pose on a geometry - the pose name plus any of the geometry
+    name tokens, ie. pose 'l_smile' matches 'l_smile_eyes_geo' or 'l_smile_geo' on 'eyes_geo'.
+    Only the geometry token subsets are looked up, so a pose costs the same whatever the target count.
+
+    :param pose_name_list:
+    :param token_index: see build_target_token_index
+    :param geometry_name:
+    :return pose_target_dict: {pose_name: [target, ...]} most geometry tokens first, unmatched poses left out
+    """
+    geometry_token_list = sorted(geometry_name.split('_'))
+    subset_list = sorted(set(subset for count in range(len(geometry_token_list) + 1)
+                             for subset in itertools.combinations(geometry_token_list, count)),
+                         key=len, reverse=True)
+
+    pose_target_dict = {}
+
+    for pose_name in pose_name_list:
+        pose_token_list = pose_name.split('_')
+        target_list = []
+
+        for subset in subset_list:
+            for target in token_index.get(tuple(sorted(pose_token_list + list(subset))), []):
+                if pose_name in target and target not in target_list:
+                    target_list.append(target)
+
+        if target_list:
+            pose_target_dict[pose_name] = target_list
+
+    return pose_target_dict
+
+
+def plan_pose_target_connections(pose_name_list, main_blend_shape_node, main_geometry, element_node_dict):
+    """
+    Pairs every element target with the main target of the same pose, without editing the scene.
+    Target aliases are read once per node.
+
+    :param pose_name_list:
+    :param main_blend_shape_node: node whose targets drive the others
+    :param main_geometry: geometry name the main target names are built from
+    :param element_node_dict: {element geometry name: blendShape node}
+    :return (connection_list, unmatched_dict): [(source plug, destination plug)], {geometry: [pose, ...]}
+    """
+    main_target_dict = match_pose_targets(
+        pose_name_list, build_target_token_index(get_target_alias_dict(main_blend_shape_node).values()), main_geometry)
+
+    connection_list = []
+    unmatched_dict = {main_geometry: [pose_name for pose_name in pose_name_list if pose_name not in main_target_dict]}
+
+    for element, blend_shape_node in sorted(element_node_dict.items()):
+        element_target_dict = match_pose_targets(
+            pose_name_list, build_target_token_index(get_target_alias_dict(blend_shape_node).values()), element)
+        unmatched_dict[element] = [pose_name for pose_name in pose_name_list if pose_name not in element_target_dict]
+
+        for pose_name in pose_name_list:
+            if pose_name not in main_target_dict or pose_name not in element_target_dict:
+                continue
+
+            source_plug = '{}.{}'.format(main_blend_shape_node, main_target_dict[pose_name][0])
+            connection_list.extend((source_plug, '{}.{}'.format(blend_shape_node, target))
+                                   for target in element_target_dict[pose_name])
+
+    return connection_list, unmatched_dict
+
+
+def connect_attribute_pairs(connection_list):
+    """
+    Makes every connection through one MDGModifier.
+    Destinations connected to another source are disconnected first, like connectAttr -force.
+    A destination listed more than once keeps its last source, as repeated connectAttr -force calls would.
+
+    :param connection_list: [(source plug, destination plug)]
+    :return:
+    """
+    plug_dict = {}
+    destination_dict = collections.OrderedDict()
+
+    for source, destination in connection_list:
+        if source not in plug_dict:
+            plug_dict[source] = _get_plug(source)
+
+        # aliases and index names of the same plug resolve to one destination
+        destination_plug = _get_plug(destination)
+        destination_dict.pop(destination_plug.name(), None)
+        destination_dict[destination_plug.name()] = (plug_dict[source], destination_plug)
+
+    modifier = om2.MDGModifier()
+
+    for source_plug, destination_plug in destination_dict.values():
+        if destination_plug.isDestination:
+            connected_plug = destination_plug.source()
+
+            if connected_plug == source_plug:
+                continue
+            modifier.disconnect(connected_plug, destination_plug)
+
+        modifier.connect(source_plug, destination_plug)
+
+    modifier.doIt()
+
+
+# WEIGHT MAPS
+
+def get_weight_map_matrix(blend_shape_node, target_index_list, geometry_index=0):
+    """
+    Reads the targetWeights map of each target with one ranged getAttr per target, so a matrix of
+    n targets costs n getAttr calls, each returning the whole map from C++.
+    targetWeights is a multi of floats, not a data attribute, so om2 can only read it one element
+    plug at a time, which is slower in Python than the ranged getAttr.
+    Unpainted vertices read as 1.0, the attribute default.
+
+    :param blend_shape_node:
+    :param target_index_list:
+    :param geometry_index:
+    :return weight_matrix: (targets x verts) float array
+    """
+    vertex_count = cmds.polyEvaluate(get_blend_shape_geometry(blend_shape_node, geometry_index), vertex=True)
+    weight_matrix = np.ones((len(target_index_list), vertex_count), dtype=np.float64)
+
+    for row, target_index in enumerate(target_index_list):
+        target_weights = np.atleast_1d(cmds.getAttr('{}[0:{}]'.format(
+            TARGET_WEIGHTS_PLUG.format(blend_shape_node, geometry_index, target_index), vertex_count - 1)))
+
+        if len(target_weights) != vertex_count:
+            raise RuntimeError('{} target {} has {} weights, expected {}'.format(
+                blend_shape_node, target_index, len(target_weights), vertex_count))
+
+        weight_matrix[row] = target_weights
+
+    return weight_matrix
+
+
+def set_weight_map_matrix(blend_shape_node, target_index_list, weight_matrix, geometry_index=0):
+    """
+    Writes one targetWeights map per row with one ranged setAttr per target, all rows in a single undo chunk.
+    A single MDGModifier would need one newPlugValueFloat per vertex and target from Python,
+    which is slower than the ranged setAttr per target.
+    :param blend_shape_node:
+    :param target_index_list:
+    :param weight_matrix: (len(target_index_list) x verts)
+    :param geometry_index:
+    :return:
+    """
+    weight_matrix = np.asarray(weight_matrix, dtype=np.float64)
+
+    if weight_matrix.shape[0] != len(target_index_list):
+        raise RuntimeError('{} weight rows for {} targets'.format(weight_matrix.shape[0], len(target_index_list)))
+
+    cmds.undoInfo(openChunk=True, chunkName='set_weight_map_matrix')
+    try:
+        for target_index, target_weights in zip(target_index_list, weight_matrix):
+            _set_target_weights(blend_shape_node, target_index, target_weights.tolist(), geometry_index)
+    finally:
+        cmds.undoInfo(closeChunk=True)
+
+
+def _set_target_weights(blend_shape_node, target_index, weight_list, geometry_index=0):
+    """
+    Sets a whole targetWeights map with one ranged setAttr.
+    :param blend_shape_node:
+    :param target_index:
+    :param weight_list: (verts,) python floats
+    :param geometry_index:
+    :return:
+    """
+    cmds.setAttr('{}[0:{}]'.format(
+        TARGET_WEIGHTS_PLUG.format(blend_shape_node, geometry_index, target_index), len(weight_list) - 1),
+        *weight_list)
+
+
+class WeightMapMatrix(object):
+    """
+    Every targetWeights map of a blendShape as one (targets x verts) array.
+    Operations act on target name lists in NumPy, apply() writes back only the changed targets.
+    """
+
+    def __init__(self, blend_shape_node, geometry_index=0):
+        self.blend_shape_node = blend_shape_node
+        self.geometry_index = geometry_index
+
+        self.target_index_list = []
+        self.target_list = []
+        self.weight_matrix = None
+        self._applied_matrix = None
+
+        self.reload()
+
+    def reload(self):
+        """
+        Reads all maps from the node, dropping unapplied changes.
+        :return:
+        """
+        target_alias_dict = get_target_alias_dict(self.blend_shape_node)
+
+        self.target_index_list = list(target_alias_dict.keys())
+        self.target_list = list(target_alias_dict.values())
+        self.weight_matrix = get_weight_map_matrix(self.blend_shape_node, self.target_index_list,
+                                                   self.geometry_index)
+        self._applied_matrix = self.weight_matrix.copy()
+
+    def reload_targets(self, target_list):
+        """
+        Re-reads only the given maps, ie. after they were painted.
+        :param target_list:
+        :return:
+        """
+        rows = self.rows(target_list)
+        target_weights = get_weight_map_matrix(self.blend_shape_node,
+                                               [self.target_index_list[row] for row in rows],
+                                               self.geometry_index)
+
+        self.weight_matrix[rows] = target_weights
+        self._applied_matrix[rows] = target_weights
+
+    def rows(self, target_list=None):
+        """
+        :param target_list: target aliases, None for all targets
+        :return row_array:
+        """
+        if target_list is None:
+            return np.arange(len(self.target_list))
+
+        missing_target_list = [target for target in target_list if target not in self.target_list]
+        if missing_target_list:
+            raise RuntimeError('{} has no targets {}'.format(self.blend_shape_node, missing_target_list))
+
+        return np.array([self.target_list.index(target) for target in target_list], dtype=np.int64)
+
+    def get(self, target):
+        return self.weight_matrix[self.rows([target])[0]].copy()
+
+    def set(self, target_list, weights):
+        """
+        :param target_list:
+        :param weights: scalar, (verts,) map or (targets x verts) matrix
+        :return:
+        """
+        self.weight_matrix[self.rows(target_list)] = weights
+
+    def copy(self, source_target, target_list):
+        self.set(target_list, self.get(source_target))
+
+    def invert(self, target_list=None):
+        rows = self.rows(target_list)
+        self.weight_matrix[rows] = 1.0 - self.weight_matrix[rows]
+
+    def multiply(self, target_list, weights):
+        self.weight_matrix[self.rows(target_list)] *= weights
+
+    def add(self, target_list, weights):
+        self.weight_matrix[self.rows(target_list)] += weights
+
+    def clamp(self, target_list=None, minimum=0.0, maximum=1.0):
+        rows = self.rows(target_list)
+        self.weight_matrix[rows] = np.clip(self.weight_matrix[rows], minimum, maximum)
+
+    def normalize(self, target_list=None):
+        """
+        Scales the maps so each vertex sums to 1 across the targets, vertices at 0 are left as they are.
+        :param target_list:
+        :return:
+        """
+        rows = self.rows(target_list)
+        target_weights = self.weight_matrix[rows]
+        vertex_sums = target_weights.sum(axis=0)
+
+        weighted_mask = vertex_sums > 0.0
+        target_weights[:, weighted_mask] /= vertex_sums[weighted_mask]
+        self.weight_matrix[rows] = target_weights
+
+    def changed_target_list(self):
+        changed_rows = np.flatnonzero((self.weight_matrix != self._applied_matrix).any(axis=1))
+
+        return [self.target_list[row] for row in changed_rows]
+
+    def apply(self):
+        """
+        Writes every changed target in one undo chunk, one ranged setAttr per changed target.
+        :return changed_target_list:
+        """
+        changed_target_list = self.changed_target_list()
+        if not changed_target_list:
+            return changed_target_list
+
+        rows = self.rows(changed_target_list)
+        set_weight_map_matrix(self.blend_shape_node, [self.target_index_list[row] for row in rows],
+                              self.weight_matrix[rows], self.geometry_index)
+        self._applied_matrix[rows] = self.weight_matrix[rows]
+
+        print('[Weight Maps] {} - {} targets written'.format(self.blend_shape_node, len(changed_target_list)))
+
+        return changed_target_list
+
+
+# WEIGHT MAP LIBRARY
+
+def save_weight_map(library_path, map_name, weights, mesh):
+    """
+    Stores a weight map as a float32 .npy file, registered in the library index
+    with the vertex count and topology hash of the mesh it was made for.
+
+    :param library_path: ie. Project.project_dir_dict['blend_shape_data'] + 'weight_maps/'
+    :param map_name: letters, digits, '_', '.' and '-'
+    :param weights: (verts,) map
+    :param mesh:
+    :return file_path:
+    """
+    if not _map_name_pattern.match(map_name):
+        raise RuntimeError('Invalid weight map name: {}'.format(map_name))
+
+    weights = np.asarray(weights, dtype=np.float32)
+    vertex_count, topology_hash = tpMeshData.get_topology_hash(mesh)
+
+    if weights.shape != (vertex_count,):
+        raise RuntimeError('Weight map {} has {} weights, {} has {} vertices'.format(
+            map_name, len(weights), mesh, vertex_count))
+
+    if not os.path.isdir(library_path):
+        os.makedirs(library_path)
+
+    file_name = '{}.npy'.format(map_name)
+    np.save(os.path.join(library_path, file_name), weights)
+
+    library_index = read_weight_map_index(library_path)
+    library_index['maps'][map_name] = {
+        'file': file_name,
+        'mesh': mesh,
+        'vertex_count': vertex_count,
+        'topology_hash': topology_hash
+    }
+
+    with open(os.path.join(library_path, WEIGHT_MAP_INDEX_FILE_NAME), 'w') as file_for_write:
+        json.dump(library_index, file_for_write, indent=4)
+
+    return os.path.join(library_path, file_name)
+
+
+def read_weight_map_index(library_path):
+    """
+    :param library_path:
+    :return library_index: {'version', 'maps': {map_name: {'file', 'mesh', 'vertex_count', 'topology_hash'}}}
+    """
+    index_path = os.path.join(library_path, WEIGHT_MAP_INDEX_FILE_NAME)
+
+    if not os.path.isfile(index_path):
+        return {'version': WEIGHT_MAP_LIBRARY_VERSION, 'maps': {}}
+
+    with open(index_path, 'r') as index_file:
+        library_index = json.load(index_file)
+
+    if library_index.get('version', 0) > WEIGHT_MAP_LIBRARY_VERSION:
+        raise RuntimeError('Unsupported weight map library version {} in {}'.format(
+            library_index['version'], index_path))
+
+    return library_index
+
+
+def load_weight_map(library_path, map_name, mesh):
+    """
+    Loads a stored weight map after checking it was made for the topology of mesh.
+    The file is read into memory and closed, so save_weight_map can overwrite it.
+
+    :param library_path:
+    :param map_name:
+    :param mesh:
+    :return weights: (verts,) float32 array
+    """
+    map_data = read_weight_map_index(library_path)['maps'].get(map_name)
+
+    if map_data is None:
+        raise RuntimeError('Weight map {} not found in {}'.format(map_name, library_path))
+
+    vertex_count, topology_hash = tpMeshData.get_topology_hash(mesh)
+
+    if map_data['vertex_count'] != vertex_count:
+        raise RuntimeError('Weight map {} was made for {} vertices, {} has {}'.format(
+            map_name, map_data['vertex_count'], mesh, vertex_count))
+    if map_data['topology_hash'] != topology_hash:
+        raise RuntimeError('Weight map {} was made for a different topology than {} ({})'.format(
+            map_name, mesh, map_data['mesh']))
+
+    weights = np.load(os.path.join(library_path, map_data['file']))
+
+    if weights.shape != (vertex_count,):
+        raise RuntimeError('Weight map file {} holds {} weights, expected {}'.format(
+            map_data['file'], weights.shape, vertex_count))
+
+    return weights
+
+
+def apply_weight_map(library_path, map_name, blend_shape_node, target_index_list, geometry_index=0):
+    """
+    Writes a stored weight map to every target of target_index_list in one undo chunk.
+    The map is converted to a list once and the same list is set on each target.
+
+    :param library_path:
+    :param map_name:
+    :param blend_shape_node:
+    :param target_index_list:
+    :param geometry_index:
+    :return:
+    """
+    weight_list = load_weight_map(library_path, map_name,
+                                  get_blend_shape_geometry(blend_shape_node, geometry_index)).tolist()
+
+    cmds.undoInfo(openChunk=True, chunkName='apply_weight_map')
+    try:
+        for target_index in target_index_list:
+            _set_target_weights(blend_shape_node, target_index, weight_list, geometry_index)
+    finally:
+        cmds.undoInfo(closeChunk=True)
+
+
+# TARGET DELTA ARCHIVE
+
+def get_target_item_index_list(blend_shape_node, target_index, geometry_index=0):
+    """
+    :param blend_shape_node:
+    :param target_index:
+    :param geometry_index:
+    :return item_index_list: TARGET_ITEM_INDEX for the full target, plus any in-between
+    """
+    return cmds.getAttr('{}.inputTarget[{}].inputTargetGroup[{}].inputTargetItem'.format(
+        blend_shape_node, geometry_index, target_index), multiIndices=True) or []
+
+
+def get_target_item_deltas(blend_shape_node, target_index, item_index, geometry_index=0):
+    """
+    Reads the stored sparse deltas of a target item.
+    Targets driven by a connected mesh are read as last evaluated.
+
+    :param blend_shape_node:
+    :param target_index:
+    :param item_index:
+    :param geometry_index:
+    :return (vertex_ids, deltas): (n,) int array and (n, 3) float array
+    """
+    points_object = _get_plug_data(_get_target_item_plug(
+        blend_shape_node, geometry_index, target_index, item_index, 'inputPointsTarget'))
+    components_object = _get_plug_data(_get_target_item_plug(
+        blend_shape_node, geometry_index, target_index, item_index, 'inputComponentsTarget'))
+
+    if points_object is None or components_object is None:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 3), dtype=np.float64)
+
+    deltas = np.array(om2.MFnPointArrayData(points_object).array(), dtype=np.float64).reshape(-1, 4)[:, :3]
+
+    component_list_data = om2.MFnComponentListData(components_object)
+    vertex_id_list = []
+    for index in range(component_list_data.length()):
+        vertex_id_list.extend(om2.MFnSingleIndexedComponent(component_list_data.get(index)).getElements())
+
+    vertex_ids = np.array(vertex_id_list, dtype=np.int64)
+
+    if len(vertex_ids) != len(deltas):
+        raise RuntimeError('{} target {} item {} has {} components for {} points'.format(
+            blend_shape_node, target_index, item_index, len(vertex_ids), len(deltas)))
+
+    return vertex_ids, deltas
+
+
+def export_target_delta_archive(geometry_list, file_path, threshold_value=1e-5):
+    """
+    Stores every blendShape target of the geometry as sparse (vertex ids, deltas) arrays,
+    in-betweens included, in one compressed .npz plus a json manifest.
+    The rest points and triangles are stored too, tpBlendShapeEval evaluates the archive without Maya.
+    Deltas shorter than threshold_value on every axis are dropped.
+
+    :param geometry_list:
+    :param file_path: path ending in .npz
+    :param threshold_value:
+    :return manifest_path:
+    """
+    arrays = {}
+    manifest_mesh_list = []
+
+    for mesh_number, geometry in enumerate(geometry_list):
+        blend_shape_node = get_blend_shape_node(geometry)
+
+        if not blend_shape_node:
+            print('[Target Delta Archive] {} has no blendShape, skipped'.format(geometry))
+            continue
+
+        geometry_index = get_geometry_index(blend_shape_node, geometry)
+        vertex_count, topology_hash = tpMeshData.get_topology_hash(geometry)
+        target_data_list = []
+
+        for target_index, target_name in get_target_alias_dict(blend_shape_node).items():
+            item_data_list = []
+
+            for item_index in get_target_item_index_list(blend_shape_node, target_index, geometry_index):
+                vertex_ids, deltas = get_target_item_deltas(blend_shape_node, target_index, item_index,
+                                                            geometry_index)
+                moved_mask = np.abs(deltas).max(axis=1) > threshold_value if len(deltas) else np.zeros(0, bool)
+
+                key = 'm{}_t{}_i{}'.format(mesh_number, target_index, item_index)
+                arrays['{}_ids'.format(key)] = vertex_ids[moved_mask].astype(np.int32)
+                arrays['{}_deltas'.format(key)] = deltas[moved_mask].astype(np.float32)
+                item_data_list.append({'item_index': item_index, 'key': key})
+
+            target_data_list.append({'name': target_name, 'index': target_index, 'items': item_data_list})
+
+        points_key = 'm{}_points'.format(mesh_number)
+        triangles_key = 'm{}_triangles'.format(mesh_number)
+        arrays[points_key] = get_base_points(blend_shape_node, geometry_index).astype(np.float32)
+        arrays[triangles_key] = tpMeshData.get_mesh_triangles(geometry).astype(np.int32)
+
+        manifest_mesh_list.append({
+            'mesh': geometry,
+            'blend_shape_node': blend_shape_node,
+            'vertex_count': vertex_count,
+            'topology_hash': topology_hash,
+            'points_key': points_key,
+            'triangles_key': triangles_key,
+            'targets': target_data_list
+        })
+
+    np.savez_compressed(file_path, **arrays)
+
+    manifest_path = os.path.splitext(file_path)[0] + MANIFEST_SUFFIX
+    with open(manifest_path, 'w') as file_for_write:
+        json.dump({'format': 'blend_shape_deltas',
+                   'version': DELTA_ARCHIVE_VERSION,
+                   'meshes': manifest_mesh_list}, file_for_write, indent=4)
+
+    print('[Target Delta Archive] {} meshes, {} targets exported to {}'.format(
+        len(manifest_mesh_list), sum(len(mesh_data['targets']) for mesh_data in manifest_mesh_list), file_path))
+
+    return manifest_path
+
+
+def read_target_delta_archive(file_path):
+    """
+    Reads an archive written by export_target_delta_archive, see tpBlendShapeEval.read_target_delta_archive.
+    :param file_path: path ending in .npz
+    :return archive_dict:
+    """
+    return tpBlendShapeEval.read_target_delta_archive(file_path)
+
+
+def import_target_delta_archive(file_path, geometry_list=None):
+    """
+    Writes archived targets straight into inputPointsTarget/inputComponentsTarget,
+    no target mesh is created. Targets are matched by alias, new ones are appended
+    after the last target index, and all target data is set by a single MDGModifier.
+    Unaliased targets ('weight[N]') are matched by their archived index and stay unaliased.
+    Items of an updated target missing from the archive (ie. removed in-betweens) are deleted.
+    The blendShape node is created when the geometry has none.
+
+    Every mesh is checked against the archive before the scene is touched. Node creation,
+    weights and aliases go into one undo chunk that is undone if the import fails.
+
+    :param file_path:
+    :param geometry_list: archived meshes to import, None for all of them
+    :return import_report: {mesh: {'blend_shape_node', 'updated_targets', 'added_targets'}}
+    """
+    archive_dict = read_target_delta_archive(file_path)
+    import_mesh_list = []
+
+    for geometry, mesh_data in archive_dict.items():
+        if geometry_list is not None and geometry not in geometry_list:
+            continue
+
+        if not cmds.objExists(geometry):
+            print('[Target Delta Archive] {} not found in the scene, skipped'.format(geometry))
+            continue
+
+        if tpMeshData.get_topology_hash(geometry) != (mesh_data['vertex_count'], mesh_data['topology_hash']):
+            raise RuntimeError('{} topology does not match the archived mesh in {}'.format(geometry, file_path))
+
+        import_mesh_list.append((geometry, mesh_data))
+
+    modifier = om2.MDGModifier()
+    import_report = {}
+
+    cmds.undoInfo(openChunk=True, chunkName='import_target_delta_archive')
+    try:
+        for geometry, mesh_data in import_mesh_list:
+            import_report[geometry] = _import_mesh_targets(modifier, geometry, mesh_data)
+
+        modifier.doIt()
+    except Exception:
+        cmds.undoInfo(closeChunk=True)
+        cmds.undo()
+        raise
+
+    cmds.undoInfo(closeChunk=True)
+
+    for geometry, geometry_report in import_report.items():
+        print('[Target Delta Archive] {} - {} targets updated, {} added'.format(
+            geometry_report['blend_shape_node'],
+            len(geometry_report['updated_targets']),
+            len(geometry_report['added_targets'])))
+
+    return import_report
+
+
+def _import_mesh_targets(modifier, geometry, mesh_data):
+    # creates the node and target weights, the item data is only queued on modifier
+    blend_shape_node = get_blend_shape_node(geometry)
+    if not blend_shape_node:
+        blend_shape_node = cmds.blendShape(geometry, name=mesh_data['blend_shape_node'])[0]
+
+    geometry_index = get_geometry_index(blend_shape_node, geometry)
+    target_alias_dict = get_target_alias_dict(blend_shape_node)
+    target_index_dict = dict((alias, target_index) for target_index, alias in target_alias_dict.items())
+    next_target_index = max(target_alias_dict.keys()) + 1 if target_alias_dict else 0
+
+    updated_target_list = []
+    added_target_list = []
+
+    for target_name, item_dict in mesh_data['targets'].items():
+        weight_match = _weight_alias_pattern.match(target_name)
+
+        if target_name in target_index_dict:
+            target_index = target_index_dict[target_name]
+            updated_target_list.append(target_name)
+
+            for item_index in get_target_item_index_list(blend_shape_node, target_index, geometry_index):
+                if item_index not in item_dict:
+                    modifier.removeMultiInstance(_get_target_item_plug(
+                        blend_shape_node, geometry_index, target_index, item_index), True)
+        else:
+            # unaliased targets go back to their archived index when it is free
+            archived_index = mesh_data['target_indices'].get(
+                target_name, int(weight_match.group(1)) if weight_match else None)
+
+            if weight_match and archived_index not in target_alias_dict:
+                target_index = archived_index
+            else:
+                target_index = next_target_index
+            target_alias_dict[target_index] = target_name
+            next_target_index = max(next_target_index, target_index + 1)
+            added_target_list.append(target_name)
+
+            weight_plug = '{}.weight[{}]'.format(blend_shape_node, target_index)
+            cmds.setAttr(weight_plug, 0.0)
+            if not weight_match:
+                cmds.aliasAttr(target_name, weight_plug)
+
+        for item_index, (vertex_ids, deltas) in item_dict.items():
+            _add_target_item_data(modifier, blend_shape_node, geometry_index, target_index, item_index,
+                                  vertex_ids, deltas)
+
+    return {
+        'blend_shape_node': blend_shape_node,
+        'updated_targets': updated_target_list,
+        'added_targets': added_target_list
+    }
+
+
+def _add_target_item_data(modifier, blend_shape_node, geometry_index, target_index, item_index, vertex_ids, deltas):
+    component_fn = om2.MFnSingleIndexedComponent()
+    component_object = component_fn.create(om2.MFn.kMeshVertComponent)
+    component_fn.addElements(vertex_ids.tolist())
+
+    component_list_fn = om2.MFnComponentListData()
+    component_list_object = component_list_fn.create()
+    component_list_fn.add(component_object)
+
+    points_object = om2.MFnPointArrayData().create(om2.MPointArray(deltas.tolist()))
+
+    modifier.newPlugValue(_get_target_item_plug(blend_shape_node, geometry_index, target_index, item_index,
+                                                'inputPointsTarget'), points_object)
+    modifier.newPlugValue(_get_target_item_plug(blend_shape_node, geometry_index, target_index, item_index,
+                                                'inputComponentsTarget'), component_list_object)
+
+
+def _get_target_item_plug(blend_shape_node, geometry_index, target_index, item_index, attribute_name=None):
+    # walking the plug tree creates missing array elements, a plug path string would not
+    selection_list = om2.MSelectionList()
+    selection_list.add(blend_shape_node)
+    node_fn = om2.MFnDependencyNode(selection_list.getDependNode(0))
+
+    plug = node_fn.findPlug('inputTarget', False).elementByLogicalIndex(geometry_index)
+    plug = plug.child(node_fn.attribute('inputTargetGroup')).elementByLogicalIndex(target_index)
+    plug = plug.child(node_fn.attribute('inputTargetItem')).elementByLogicalIndex(item_index)
+
+    if attribute_name is None:
+        return plug
+
+    return plug.child(node_fn.attribute(attribute_name))
+
+
+def _get_plug(plug_path):
+    selection_list = om2.MSelectionList()
+    selection_list.add(plug_path)
+
+    return selection_list.getPlug(0)
+
+
+def _get_plug_data(plug):
+    try:
+        data_object = plug.asMObject()
+    except RuntimeError:
+        return None
+
+    return None if data_object.isNull() else data_object
+
+
+# TARGET EXTRACTION
+
+def get_base_points(blend_shape_node, geometry_index=0):
+    """
+    Object space points of the geometry going into the blendShape, before any target.
+    :param blend_shape_node:
+    :param geometry_index:
+    :return points: (vertex_count, 3) array
+    """
+    mesh_object = _get_plug('{}.input[{}].inputGeometry'.format(blend_shape_node, geometry_index)).asMObject()
+
+    return np.array(om2.MFnMesh(mesh_object).getPoints(), dtype=np.float64).reshape(-1, 4)[:, :3]
+
+
+def get_base_weights(blend_shape_node, vertex_count, geometry_index=0):
+    base_weights = cmds.getAttr('{}.inputTarget[{}].baseWeights[0:{}]'.format(
+        blend_shape_node, geometry_index, vertex_count - 1))
+
+    return np.atleast_1d(np.array(base_weights, dtype=np.float64))
+
+
+def get_target_items(blend_shape_node, target_index, geometry_index=0):
+    """
+    :return item_dict: {item_index: (vertex_ids, deltas)} full target and in-betweens
+    """
+    return dict((item_index, get_target_item_deltas(blend_shape_node, target_index, item_index, geometry_index))
+                for item_index in get_target_item_index_list(blend_shape_node, target_index, geometry_index))
+
+
+def extract_targets_from_deltas(blend_shape_node, target_list=None, adjustment_target_list=None,
+                                include_inbetweens=True, geometry_index=0, group_name='shapes_grp',
+                                model_geometry=None):
+    """
+    Rebuilds target meshes from the stored deltas instead of evaluating the deformer per target.
+    Each mesh is the blendShape input points, plus the adjustment targets at their current weight,
+    plus the target at 1 - scaled by its weight map, the base weights and the envelope.
+    In-betweens are extracted as '{target}_inbetween_{weight * 1000}_extract'.
+    Deformers after the blendShape are not applied.
+
+    :param blend_shape_node:
+    :param target_list: target aliases, None for every target but the adjustments
+    :param adjustment_target_list: targets kept active at their current weight
+    :param include_inbetweens:
+    :param geometry_index:
+    :param group_name: group created for the extracted meshes
+    :param model_geometry: mesh whose topology and uvs the extracted meshes copy,
+                           defaults to the deformed geometry, must have the same vertex count
+    :return mesh_list: extracted mesh transforms
+    """
+    adjustment_target_list = adjustment_target_list or []
+    target_index_dict = dict((alias, target_index)
+                             for target_index, alias in get_target_alias_dict(blend_shape_node).items())
+
+    if target_list is None:
+        target_list = [alias for alias in target_index_dict if alias not in adjustment_target_list]
+        target_list.sort(key=target_index_dict.get)
+
+    missing_target_list = [target for target in target_list + adjustment_target_list
+                           if target not in target_index_dict]
+    if missing_target_list:
+        raise RuntimeError('{} has no targets {}'.format(blend_shape_node, missing_target_list))
+
+    geometry = model_geometry or get_blend_shape_geometry(blend_shape_node, geometry_index)
+    rest_points = get_base_points(blend_shape_node, geometry_index)
+    vertex_count = len(rest_points)
+
+    if cmds.polyEvaluate(geometry, vertex=True) != vertex_count:
+        raise RuntimeError('{} does not have the {} vertices of {}'.format(geometry, vertex_count, blend_shape_node))
+
+    # per vertex scale of every delta: weight map * base weights * envelope
+    target_index_list = [target_index_dict[target] for target in adjustment_target_list + target_list]
+    weight_matrix = get_weight_map_matrix(blend_shape_node, target_index_list, geometry_index)
+    weight_matrix *= get_base_weights(blend_shape_node, vertex_count, geometry_index)
+    weight_matrix *= cmds.getAttr('{}.envelope'.format(blend_shape_node))
+
+    for row, target in enumerate(adjustment_target_list):
+        target_weight = cmds.getAttr('{}.{}'.format(blend_shape_node, target))
+        item_dict = get_target_items(blend_shape_node, target_index_dict[target], geometry_index)
+
+        rest_points += (tpBlendShapeEval.interpolate_target_deltas(item_dict, target_weight, vertex_count) *
+                        weight_matrix[row, :, None])
+
+    mesh_name_list = []
+    moved_points_list = []
+
+    for row, target in enumerate(target_list, len(adjustment_target_list)):
+        item_dict = get_target_items(blend_shape_node, target_index_dict[target], geometry_index)
+
+        for item_index, (vertex_ids, deltas) in sorted(item_dict.items()):
+            if item_index != TARGET_ITEM_INDEX and not include_inbetweens:
+                continue
+
+            if item_index == TARGET_ITEM_INDEX:
+                mesh_name_list.append('{}_extract'.format(target))
+            else:
+                mesh_name_list.append('{}_inbetween_{}_extract'.format(target, item_index - 5000))
+
+            moved_points_list.append(
+                (vertex_ids, rest_points[vertex_ids] + deltas * weight_matrix[row, vertex_ids, None]))
+
+    group = cmds.group(name=group_name, empty=True)
+    mesh_list = _create_target_meshes(geometry, rest_points, moved_points_list, mesh_name_list, group)
+
+    print('[Extract Targets] {} - {} meshes extracted'.format(blend_shape_node, len(mesh_list)))
+
+    return mesh_list
+
+
+def get_blend_shape_evaluator(blend_shape_node, geometry_index=0):
+    """
+    Offline evaluator of the blendShape as it is in the scene, weight maps,
+    base weights and envelope baked into the target deltas.
+    :param blend_shape_node:
+    :param geometry_index:
+    :return evaluator: tpBlendShapeEval.BlendShapeEvaluator
+    """
+    alias_dict = get_target_alias_dict(blend_shape_node)
+    target_dict = collections.OrderedDict(
+        (alias, get_target_items(blend_shape_node, target_index, geometry_index))
+        for target_index, alias in alias_dict.items())
+    base_points = get_base_points(blend_shape_node, geometry_index)
+
+    target_scale = get_weight_map_matrix(blend_shape_node, list(alias_dict), geometry_index)
+    target_scale *= get_base_weights(blend_shape_node, len(base_points), geometry_index)
+    target_scale *= cmds.getAttr('{}.envelope'.format(blend_shape_node))
+
+    return tpBlendShapeEval.BlendShapeEvaluator(
+        base_points, target_dict,
+        triangles=tpMeshData.get_mesh_triangles(get_blend_shape_geometry(blend_shape_node, geometry_index)),
+        target_scale=target_scale)
+
+
+def _create_target_meshes(source_geometry, rest_points, moved_points_list, mesh_name_list, parent):
+    # topology and uvs are read once, each mesh copies the rest points and moves only its vertices
+    source_fn = om2.MFnMesh(tpMeshData.get_mesh_dag_path(source_geometry))
+    polygon_counts, polygon_vertices = source_fn.getVertices()
+    u_values, v_values = source_fn.getUVs()
+    uv_counts, uv_ids = source_fn.getAssignedUVs()
+    rest_point_array = om2.MPointArray(rest_points.tolist())
+
+    selection_list = om2.MSelectionList()
+    selection_list.add(parent)
+    parent_object = selection_list.getDependNode(0)
+
+    dag_modifier = om2.MDagModifier()
+    transform_list = []
+    for mesh_name in mesh_name_list:
+        transform = dag_modifier.createNode('transform', parent_object)
+        dag_modifier.renameNode(transform, mesh_name)
+        transform_list.append(transform)
+    dag_modifier.doIt()
+
+    mesh_list = []
+    shape_list = []
+
+    for transform, mesh_name, (vertex_ids, moved_points) in zip(transform_list, mesh_name_list, moved_points_list):
+        point_array = om2.MPointArray(rest_point_array)
+        for vertex_id, moved_point in zip(vertex_ids.tolist(), moved_points.tolist()):
+            point_array[vertex_id] = om2.MPoint(moved_point)
+
+        mesh_fn = om2.MFnMesh()
+        shape = mesh_fn.create(point_array, polygon_counts, polygon_vertices, u_values, v_values, transform)
+        if len(uv_ids):
+            mesh_fn.assignUVs(uv_counts, uv_ids)
+        om2.MFnDependencyNode(shape).setName('{}Shape'.format(mesh_name))
+
+        mesh_list.append(om2.MFnDagNode(transform).fullPathName())
+        shape_list.append(om2.MFnDagNode(shape).fullPathName())
+
+    cmds.sets(shape_list, edit=True, forceElement='initialShadingGroup')
+
+    return mesh_list
+
+
+# CAPTURE ANIMATION
+
+def read_capture_csv(file_path, channel_list=None, frame_column=None, chunk_size=4096):
+    """
+    Streams a capture csv (header row of channel names, one row per frame) in chunks of rows,
+    keeping only the requested columns as float arrays.
+
+    :param file_path:
+    :param channel_list: header names to read, None for every column but frame_column
+    :param frame_column: header name of a frame number column, None to number rows from 0
+    :param chunk_size: rows parsed at a time
+    :return (channel_list, frames, value_matrix): value_matrix is (frames x channels)
+    """
+    with open(file_path, 'r') as csv_file:
+        reader = csv.reader(csv_file, delimiter=',')
+        header = [name.strip() for name in next(reader)]
+
+        if channel_list is None:
+            channel_list = [name for name in header if name and name != frame_column]
+
+        missing_channel_list = [name for name in channel_list + ([frame_column] if frame_column else [])
+                                if name not in header]
+        if missing_channel_list:
+            raise RuntimeError('{} has no columns {}'.format(file_path, missing_channel_list))
+
+        column_list = [header.index(name) for name in channel_list]
+        if frame_column:
+            column_list.append(header.index(frame_column))
+
+        chunk_list = []
+        while True:
+            row_list = [row for row in itertools.islice(reader, chunk_size) if row]
+            if not row_list:
+                break
+
+            chunk_list.append(np.array([[row[column] for column in column_list] for row in row_list],
+                                       dtype=np.float64))
+
+    value_matrix = np.concatenate(chunk_list) if chunk_list else np.zeros((0, len(column_list)))
+
+    if frame_column:
+        return channel_list, value_matrix[:, -1], value_matrix[:, :-1]
+
+    return channel_list, np.arange(len(value_matrix), dtype=np.float64), value_matrix
+
+
+def import_capture_csv(file_path, blend_shape_node_list, prefix='', suffix='', start_frame=0, frame_column=None):
+    """
+    Keys per-frame capture data on blendShape targets named prefix + channel + suffix.
+    The csv is read once for all nodes, each target gets its whole animCurve in one
+    addKeys call, a curve already keying the target is replaced. The current time is never changed.
+    Targets driven by anything else than an animCurve are left alone and reported.
+
+    :param file_path:
+    :param blend_shape_node_list:
+    :param prefix:
+    :param suffix:
+    :param start_frame: frame of the first row, added to frame_column values when given
+    :param frame_column: see read_capture_csv
+    :return import_report: {'frame_count', 'keyed_targets', 'driven_targets', 'missing_channels'}
+    """
+    node_alias_list = [(blend_shape_node, set(get_target_alias_dict(blend_shape_node).values()))
+                       for blend_shape_node in blend_shape_node_list]
+
+    with open(file_path, 'r') as csv_file:
+        header = [name.strip() for name in next(csv.reader(csv_file, delimiter=','))]
+
+    channel_list = [name for name in header if name and name != frame_column and
+                    any(prefix + name + suffix in alias_set for _, alias_set in node_alias_list)]
+    missing_channel_list = [name for name in header if name and name != frame_column and name not in channel_list]
+
+    channel_list, frames, value_matrix = read_capture_csv(file_path, channel_list, frame_column)
+
+    # one time array shared by every curve
+    time_unit = om2.MTime.uiUnit()
+    time_array = om2.MTimeArray([om2.MTime(frame, time_unit) for frame in (frames + start_frame).tolist()])
+
+    keyed_target_list = []
+    driven_target_list = []
+
+    for blend_shape_node, alias_set in node_alias_list:
+        for column, channel in enumerate(channel_list):
+            target = prefix + channel + suffix
+            if target not in alias_set:
+                continue
+
+            target_plug = '{}.{}'.format(blend_shape_node, target)
+
+            if _set_anim_curve_keys(_get_plug(target_plug), time_array, value_matrix[:, column]):
+                keyed_target_list.append(target_plug)
+            else:
+                driven_target_list.append(target_plug)
+
+    print('[Capture Import] {} frames, {} targets keyed, {} driven targets skipped, {} unknown channels'.format(
+        len(frames), len(keyed_target_list), len(driven_target_list), len(missing_channel_list)))
+
+    return {
+        'frame_count': len(frames),
+        'keyed_targets': keyed_target_list,
+        'driven_targets': driven_target_list,
+        'missing_channels': missing_channel_list
+    }
+
+
+def _set_anim_curve_keys(plug, time_array, values):
+    # replaces the keys of the animCurve on plug, creating it if the plug is free
+    if plug.isDestination:
+        source_node = plug.source().node()
+
+        if not source_node.hasFn(om2.MFn.kAnimCurve):
+            return False
+
+        anim_curve_fn = om2Anim.MFnAnimCurve(source_node)
+    else:
+        anim_curve_fn = om2Anim.MFnAnimCurve()
+        anim_curve_fn.create(plug, om2Anim.MFnAnimCurve.kAnimCurveTU)
+
+    anim_curve_fn.addKeys(time_array, om2.MDoubleArray(values.tolist()),
+                          om2Anim.MFnAnimCurve.kTangentLinear, om2Anim.MFnAnimCurve.kTangentLinear,
+                          False)
+
+    return True
@@ -0,0 +1,392 @@
+"""
+Offline blendShape evaluation, pure NumPy so it runs without a Maya session.
+
+Targets are sparse (vertex ids, deltas) items, the full target plus any in-between,
+as read from a blendShape node by tpBlendShapeData or from a target delta archive.
+A batch of weight vectors turns into per item coefficients, the entries of every
+item active in a combination are scaled and summed per vertex with one bincount,
+no target is evaluated on its own.
+"""
+from __future__ import division
+
+import os
+import json
+import itertools
+import collections
+
+import numpy as np
+
+
+DELTA_ARCHIVE_VERSION = 1
+MANIFEST_SUFFIX = '.manifest.json'
+
+# inputTargetItem index of the full target, in-betweens sit at 5000 + weight * 1000
+TARGET_ITEM_INDEX = 6000
+
+# contact pairs closer than this fraction of the mean edge length are checked for crossing
+CONTACT_EDGE_RATIO = 0.5
+
+# triangles shrinking below this fraction of their rest area count as collapsed
+COLLAPSE_AREA_RATIO = 1e-3
+
+
+# TARGET NAMING
+
+def get_control_target_name(control_name):
+    """
+    Target driven by a face control, as connect_face_controls_to_blend_shape_targets connects them.
+    :param control_name: 'l_brow_up_ctrl'
+    :return target_name: 'l_brow_up_geo'
+    """
+    return '{}_geo'.format(control_name.replace('_ctrl', ''))
+
+
+def get_control_combination_list(control_combination_list):
+    """
+    :param control_combination_list: [{control_name: parameter value}]
+    :return combination_list: [{target_name: weight}]
+    """
+    return [dict((get_control_target_name(control_name), value) for control_name, value in combination.items())
+            for combination in control_combination_list]
+
+
+def get_target_combination_list(target_list, order=2, weight=1.0):
+    """
+    Every combination of order targets at weight, for sweeping the shape library.
+    :param target_list:
+    :param order: targets active together
+    :param weight:
+    :return combination_list: [{target_name: weight}]
+    """
+    return [dict((target, weight) for target in combination)
+            for combination in itertools.combinations(target_list, order)]
+
+
+# TARGET DELTA ARCHIVE
+
+def read_target_delta_archive(file_path):
+    """
+    Reads an archive written by tpBlendShapeData.export_target_delta_archive.
+    Archives written before the rest shape was stored give None base_points and triangles.
+
+    :param file_path: path ending in .npz
+    :return archive_dict: {mesh: {'blend_shape_node', 'vertex_count', 'topology_hash', 'base_points', 'triangles',
+                                  'targets': OrderedDict(name: {item_index: (vertex_ids, deltas)}),
+                                  'target_indices': {name: archived target index}}}
+    """
+    with open(os.path.splitext(file_path)[0] + MANIFEST_SUFFIX, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if manifest.get('version', 0) > DELTA_ARCHIVE_VERSION:
+        raise RuntimeError('Unsupported target delta archive version {} in {}'.format(manifest['version'], file_path))
+
+    archive_dict = collections.OrderedDict()
+    with np.load(file_path) as arrays:
+        for mesh_data in manifest['meshes']:
+            target_dict = collections.OrderedDict()
+            target_index_dict = {}
+
+            for target_data in mesh_data['targets']:
+                if 'index' in target_data:
+                    target_index_dict[target_data['name']] = target_data['index']
+
+                target_dict[target_data['name']] = dict(
+                    (item_data['item_index'], (arrays['{}_ids'.format(item_data['key'])].astype(np.int64),
+                                               arrays['{}_deltas'.format(item_data['key'])].astype(np.float64)))
+                    for item_data in target_data['items'])
+
+            base_points = triangles = None
+            if 'points_key' in mesh_data:
+                base_points = arrays[mesh_data['points_key']].astype(np.float64)
+                triangles = arrays[mesh_data['triangles_key']].astype(np.int64)
+
+            archive_dict[mesh_data['mesh']] = {
+                'blend_shape_node': mesh_data['blend_shape_node'],
+                'vertex_count': mesh_data['vertex_count'],
+                'topology_hash': mesh_data['topology_hash'],
+                'base_points': base_points,
+                'triangles': triangles,
+                'targets': target_dict,
+                'target_indices': target_index_dict
+            }
+
+    return archive_dict
+
+
+def interpolate_target_deltas(item_dict, target_weight, vertex_count):
+    """
+    Dense deltas of a target at target_weight, linear between its in-betweens,
+    the full target and the rest shape at weight 0, extrapolated past the end items.
+
+    :param item_dict: {item_index: (vertex_ids, deltas)}
+    :param target_weight:
+    :param vertex_count:
+    :return deltas: (vertex_count, 3) array
+    """
+    item_index_list = sorted(item_dict)
+    coefficients = _item_coefficients(item_index_list, np.array([target_weight], dtype=np.float64))[0]
+
+    deltas = np.zeros((vertex_count, 3))
+    for item_index, coefficient in zip(item_index_list, coefficients):
+        vertex_ids, item_deltas = item_dict[item_index]
+        deltas[vertex_ids] += coefficient * item_deltas
+
+    return deltas
+
+
+# EVALUATION
+
+class BlendShapeEvaluator(object):
+    """
+    Deformed points of a blendShape for batches of weight vectors.
+    Only the blendShape is evaluated - envelope and weight maps are baked into the deltas
+    with target_scale, deformers before and after it are not applied.
+    """
+
+    def __init__(self, base_points, target_dict, triangles=None, target_scale=None):
+        """
+        :param base_points: (vertex_count, 3) rest points
+        :param target_dict: OrderedDict(name: {item_index: (vertex_ids, deltas)})
+        :param triangles: (triangle_count, 3) vertex ids, needed by the intersection checks
+        :param target_scale: (target_count, vertex_count) per vertex target scale, weight maps and base weights
+        """
+        self.base_points = np.asarray(base_points, dtype=np.float64)[:, :3]
+        self.vertex_count = len(self.base_points)
+        self.target_list = list(target_dict)
+        self.triangles = None if triangles is None else np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        self._target_index_dict = dict((target, row) for row, target in enumerate(self.target_list))
+
+        # one entry per (item, vertex), grouped by item
+        self._target_item_lists = [sorted(target_dict[target]) for target in self.target_list]
+        entry_vertex_list, entry_delta_list = [], []
+
+        for row, target in enumerate(self.target_list):
+            for item_index in self._target_item_lists[row]:
+                vertex_ids, deltas = target_dict[target][item_index]
+                deltas = np.asarray(deltas, dtype=np.float64).reshape(-1, 3)
+
+                if target_scale is not None:
+                    deltas = deltas * np.asarray(target_scale)[row, vertex_ids, None]
+
+                entry_vertex_list.append(np.asarray(vertex_ids, dtype=np.int64))
+                entry_delta_list.append(deltas)
+
+        self._item_entry_count = np.array([len(vertex_ids) for vertex_ids in entry_vertex_list], dtype=np.int64)
+        self._item_entry_start = np.cumsum(self._item_entry_count) - self._item_entry_count
+        self._entry_vertex_ids = np.concatenate(entry_vertex_list) if entry_vertex_list else np.zeros(0, np.int64)
+        self._entry_deltas = np.concatenate(entry_delta_list) if entry_delta_list else np.zeros((0, 3))
+
+        self._contact_pairs = None
+
+    @classmethod
+    def from_archive(cls, file_path, mesh=None):
+        """
+        :param file_path: target delta archive
+        :param mesh: archived mesh name, defaults to the first one
+        :return evaluator:
+        """
+        archive_dict = read_target_delta_archive(file_path)
+
+        if not archive_dict:
+            raise RuntimeError('No mesh stored in {}'.format(file_path))
+
+        mesh_data = archive_dict[mesh] if mesh else list(archive_dict.values())[0]
+
+        if mesh_data['base_points'] is None:
+            raise RuntimeError('{} has no rest points, export the archive again to evaluate it'.format(file_path))
+
+        return cls(mesh_data['base_points'], mesh_data['targets'], mesh_data['triangles'])
+
+    def get_weight_matrix(self, combination_list):
+        """
+        :param combination_list: [{target_name: weight}], unlisted targets are 0
+        :return weight_matrix: (combination_count, target_count) array
+        """
+        weight_matrix = np.zeros((len(combination_list), len(self.target_list)))
+        missing_target_set = set()
+
+        for row, combination in enumerate(combination_list):
+            for target, weight in combination.items():
+                if target in self._target_index_dict:
+                    weight_matrix[row, self._target_index_dict[target]] = weight
+                else:
+                    missing_target_set.add(target)
+
+        if missing_target_set:
+            raise RuntimeError('Targets not found {}'.format(sorted(missing_target_set)))
+
+        return weight_matrix
+
+    def evaluate(self, weight_matrix):
+        """
+        Whole batch at once, memory grows with batch_count * stored deltas - see analyze for chunking.
+        :param weight_matrix: (batch_count, target_count) array, or a single weight vector
+        :return points: (batch_count, vertex_count, 3) array
+        """
+        return self.evaluate_deltas(weight_matrix) + self.base_points
+
+    def evaluate_deltas(self, weight_matrix):
+        weight_matrix = np.atleast_2d(np.asarray(weight_matrix, dtype=np.float64))
+
+        if weight_matrix.shape[1] != len(self.target_list):
+            raise RuntimeError('Expected {} target weights, got {}'.format(len(self.target_list),
+                                                                           weight_matrix.shape[1]))
+
+        deltas = np.zeros((len(weight_matrix), self.vertex_count, 3))
+
+        if not len(self._entry_deltas):
+            return deltas
+
+        # only the (combination, item) pairs with a non zero coefficient are expanded to their entries
+        coefficients = self._get_item_coefficients(weight_matrix)
+        pair_batch_ids, pair_item_ids = np.nonzero(coefficients)
+        pair_entry_count = self._item_entry_count[pair_item_ids]
+        pair_start = np.cumsum(pair_entry_count) - pair_entry_count
+
+        entry_ids = (np.repeat(self._item_entry_start[pair_item_ids] - pair_start, pair_entry_count) +
+                     np.arange(pair_entry_count.sum()))
+        entry_coefficients = np.repeat(coefficients[pair_batch_ids, pair_item_ids], pair_entry_count)
+        flat_vertex_ids = (np.repeat(pair_batch_ids, pair_entry_count) * self.vertex_count +
+                           self._entry_vertex_ids[entry_ids])
+
+        for axis in range(3):
+            axis_deltas = np.bincount(flat_vertex_ids, entry_coefficients * self._entry_deltas[entry_ids, axis],
+                                      minlength=deltas.shape[0] * self.vertex_count)
+            deltas[:, :, axis] = axis_deltas.reshape(-1, self.vertex_count)
+
+        return deltas
+
+    def analyze(self, weight_matrix, chunk_size=32, contact_ratio=CONTACT_EDGE_RATIO):
+        """
+        Per combination QA measures, evaluated chunk_size combinations at a time.
+        Intersection heuristics need triangles:
+        'flipped_triangles' turned over against their rest normal,
+        'collapsed_triangles' shrunk to a near zero area,
+        'crossed_contacts' vertex pairs that nearly touch at rest (lips, lids) and passed through each other.
+
+        :param weight_matrix: (batch_count, target_count) array
+        :param chunk_size:
+        :param contact_ratio: contact distance as a fraction of the mean edge length
+        :return report_dict: {measure: (batch_count,) array}
+        """
+        weight_matrix = np.atleast_2d(np.asarray(weight_matrix, dtype=np.float64))
+        report_dict = collections.OrderedDict(
+            (name, []) for name in ['max_displacement', 'max_displacement_vertex', 'flipped_triangles',
+                                    'collapsed_triangles', 'crossed_contacts'])
+
+        if self.triangles is not None:
+            rest_normals = _triangle_normals(self.base_points[None], self.triangles)[0]
+            rest_areas = np.linalg.norm(rest_normals, axis=1)
+            first_ids, second_ids, contact_normals, contact_sides = self._get_contacts(contact_ratio)
+
+        for start in range(0, len(weight_matrix), chunk_size):
+            deltas = self.evaluate_deltas(weight_matrix[start:start + chunk_size])
+            displacement = np.linalg.norm(deltas, axis=2)
+            report_dict['max_displacement'].append(displacement.max(axis=1))
+            report_dict['max_displacement_vertex'].append(displacement.argmax(axis=1))
+
+            if self.triangles is None:
+                continue
+
+            points = deltas + self.base_points
+            normals = _triangle_normals(points, self.triangles)
+            report_dict['flipped_triangles'].append(np.count_nonzero(_dot(normals, rest_normals) < 0.0, axis=1))
+            report_dict['collapsed_triangles'].append(
+                np.count_nonzero(np.linalg.norm(normals, axis=2) < COLLAPSE_AREA_RATIO * rest_areas, axis=1))
+
+            # side of the second vertex against the first one's rest normal
+            sides = _dot(points[:, second_ids] - points[:, first_ids], contact_normals)
+            report_dict['crossed_contacts'].append(np.count_nonzero(sides * contact_sides < 0.0, axis=1))
+
+        return collections.OrderedDict(
+            (name, np.concatenate(value_list) if value_list else None) for name, value_list in report_dict.items())
+
+    def _get_item_coefficients(self, weight_matrix):
+        return np.concatenate([_item_coefficients(item_index_list, weight_matrix[:, row])
+                               for row, item_index_list in enumerate(self._target_item_lists)], axis=1)
+
+    def _get_contacts(self, contact_ratio):
+        # vertex pairs closer than the contact distance sharing no triangle, with the side they sit on at rest
+        if self._contact_pairs is None or self._contact_pairs[0] != contact_ratio:
+            edges = np.sort(np.concatenate([self.triangles[:, [0, 1]], self.triangles[:, [1, 2]],
+                                            self.triangles[:, [2, 0]]]), axis=1)
+            mean_edge_length = np.linalg.norm(self.base_points[edges[:, 0]] - self.base_points[edges[:, 1]],
+                                              axis=1).mean()
+            first_ids, second_ids = _close_point_pairs(self.base_points, contact_ratio * mean_edge_length)
+
+            edge_keys = np.unique(edges[:, 0] * self.vertex_count + edges[:, 1])
+            pair_keys = first_ids * self.vertex_count + second_ids
+            edge_position = np.minimum(np.searchsorted(edge_keys, pair_keys), len(edge_keys) - 1)
+            open_mask = edge_keys[edge_position] != pair_keys
+            first_ids, second_ids = first_ids[open_mask], second_ids[open_mask]
+
+            vertex_normals = _vertex_normals(self.base_points, self.triangles)[first_ids]
+            contact_sides = _dot(self.base_points[second_ids] - self.base_points[first_ids], vertex_normals)
+
+            self._contact_pairs = (contact_ratio, (first_ids, second_ids, vertex_normals, contact_sides))
+
+        return self._contact_pairs[1]
+
+
+def _item_coefficients(item_index_list, weights):
+    # piecewise linear hat functions over the item weights, the rest shape is an implicit item at weight 0
+    item_weights = (np.array(item_index_list, dtype=np.float64) - 5000.0) / 1000.0
+    knot_weights = np.append(item_weights, 0.0)
+    order = np.argsort(knot_weights, kind='stable')
+    sorted_weights = knot_weights[order]
+
+    coefficients = np.zeros((len(weights), len(knot_weights)))
+    if len(item_index_list):
+        segment = np.clip(np.searchsorted(sorted_weights, weights) - 1, 0, len(sorted_weights) - 2)
+        blend = (weights - sorted_weights[segment]) / (sorted_weights[segment + 1] - sorted_weights[segment])
+
+        rows = np.arange(len(weights))
+        coefficients[rows, order[segment]] = 1.0 - blend
+        coefficients[rows, order[segment + 1]] = blend
+
+    return coefficients[:, :-1]
+
+
+def _close_point_pairs(points, distance):
+    # cells of size distance, every pair in the same or a neighbour cell is tested once (first id < second id)
+    cells = np.floor((points - points.min(axis=0)) / distance).astype(np.int64)
+    cell_count = cells.max(axis=0) + 3
+    cell_keys = ((cells[:, 0] + 1) * cell_count[1] + cells[:, 1] + 1) * cell_count[2] + cells[:, 2] + 1
+
+    order = np.argsort(cell_keys, kind='stable')
+    sorted_keys = cell_keys[order]
+
+    first_list, second_list = [], []
+    for offset in itertools.product([-1, 0, 1], repeat=3):
+        offset_key = (offset[0] * cell_count[1] + offset[1]) * cell_count[2] + offset[2]
+        start = np.searchsorted(sorted_keys, cell_keys + offset_key, side='left')
+        count = np.searchsorted(sorted_keys, cell_keys + offset_key, side='right') - start
+
+        first_ids = np.repeat(np.arange(len(points)), count)
+        second_ids = order[np.repeat(start - np.cumsum(count) + count, count) + np.arange(count.sum())]
+
+        pair_mask = (first_ids < second_ids) & (np.linalg.norm(points[first_ids] - points[second_ids], axis=1)
+                                                < distance)
+        first_list.append(first_ids[pair_mask])
+        second_list.append(second_ids[pair_mask])
+
+    return np.concatenate(first_list), np.concatenate(second_list)
+
+
+def _triangle_normals(points, triangles):
+    # area weighted, points is (batch_count, vertex_count, 3)
+    corners = points[:, triangles]
+
+    return 0.5 * np.cross(corners[:, :, 1] - corners[:, :, 0], corners[:, :, 2] - corners[:, :, 0])
+
+
+def _vertex_normals(points, triangles):
+    triangle_normals = _triangle_normals(points[None], triangles)[0]
+    vertex_normals = np.stack([np.bincount(triangles.ravel(), np.repeat(triangle_normals[:, axis], 3),
+                                           minlength=len(points)) for axis in range(3)], axis=1)
+
+    return vertex_normals / np.maximum(np.linalg.norm(vertex_normals, axis=1), 1e-12)[:, None]
+
+
+def _dot(vector_a, vector_b):
+    return np.einsum('...i,...i->...', vector_a, vector_b)
@@ -0,0 +1,346 @@
+import hashlib
+import collections
+
+import maya.cmds as cmds
+import maya.api.OpenMaya as om2
+
+import numpy as np
+
+import tpRig.tpSpatialIndex as tpSpatialIndex
+
+
+# Bulk mesh readers - each function is a single API pass returning NumPy arrays
+
+
+# symmetry tables kept, least recently used dropped first - an edited mesh adds one per edit
+SYMMETRY_TABLE_CACHE_SIZE = 16
+
+# {(mesh, axis, tolerance, points digest): (mirror_ids, matched)}
+_symmetry_table_cache = collections.OrderedDict()
+
+# adjacency tables kept, least recently used dropped first - one per topology
+ADJACENCY_CACHE_SIZE = 16
+
+# {(vertex_count, topology digest): (offsets, neighbour_ids)}
+_adjacency_cache = collections.OrderedDict()
+
+# vertex grids kept, least recently used dropped first - a deforming mesh adds one per pose
+VERTEX_INDEX_CACHE_SIZE = 16
+
+# {(mesh, world_space, vertex count, polygon count, world matrix, vertex ids digest): PointGrid}
+_vertex_index_cache = collections.OrderedDict()
+
+
+def get_mesh_dag_path(mesh):
+    """
+    Returns the MDagPath of the mesh shape, transform or shape name accepted.
+    Open Maya 2 function
+    :param mesh:
+    :return dag_path:
+    """
+    selection_list = om2.MSelectionList()
+    selection_list.add(mesh)
+    dag_path = selection_list.getDagPath(0)
+
+    if dag_path.hasFn(om2.MFn.kTransform):
+        dag_path.extendToShape()
+
+    return dag_path
+
+
+def get_mesh_points(mesh, world_space=True):
+    """
+    Returns every vertex position of the mesh.
+    :param mesh:
+    :param world_space:
+    :return points: (vertex_count, 3) array
+    """
+    space = om2.MSpace.kWorld if world_space else om2.MSpace.kObject
+    point_array = om2.MFnMesh(get_mesh_dag_path(mesh)).getPoints(space)
+
+    return np.array(point_array, dtype=np.float64).reshape(-1, 4)[:, :3]
+
+
+def get_component_vertex_ids(component_list):
+    """
+    Resolves a component selection ('mesh.vtx[0:10]', faces, edges...) to vertex ids.
+    All components must belong to the same mesh.
+
+    :param component_list:
+    :return (mesh, vertex_ids): mesh shape full path, sorted unique vertex ids
+    """
+    vertex_list = cmds.polyListComponentConversion(component_list, toVertex=True)
+
+    selection_list = om2.MSelectionList()
+    for vertex in vertex_list:
+        selection_list.add(vertex)
+
+    mesh_set = set()
+    vertex_id_list = []
+
+    for index in range(selection_list.length()):
+        dag_path, components = selection_list.getComponent(index)
+        mesh_set.add(dag_path.fullPathName())
+        vertex_id_list.extend(om2.MFnSingleIndexedComponent(components).getElements())
+
+    if len(mesh_set) != 1:
+        raise RuntimeError('Components must belong to a single mesh, got {}'.format(sorted(mesh_set)))
+
+    return mesh_set.pop(), np.unique(np.array(vertex_id_list, dtype=np.int64))
+
+
+def get_mesh_triangles(mesh):
+    """
+    Returns the triangulation Maya uses for the mesh faces.
+    :param mesh:
+    :return triangles: (triangle_count, 3) vertex id array
+    """
+    triangle_vertices = om2.MFnMesh(get_mesh_dag_path(mesh)).getTriangles()[1]
+
+    return np.array(triangle_vertices, dtype=np.int64).reshape(-1, 3)
+
+
+def get_symmetry_table(mesh, axis=0, tolerance=None):
+    """
+    Mirror vertex of every vertex across the object space plane axis = 0.
+    Found with one batched PointGrid query and cached per mesh and point
+    positions, repeated mirrors of an unchanged mesh skip the search.
+    The points are read and hashed once, the grid is built from them directly.
+
+    :param mesh:
+    :param axis: 0, 1 or 2 for the x, y or z axis
+    :param tolerance: largest mirror distance accepted, defaults to 0.1% of the bounding box diagonal
+    :return (mirror_ids, matched): mirror_ids[vertex] is the mirror vertex id,
+            vertices without a match within tolerance are flagged False in matched
+    """
+    points = get_mesh_points(mesh, world_space=False)
+    cache_key = (get_mesh_dag_path(mesh).fullPathName(), axis, tolerance,
+                 hashlib.sha1(points.tobytes()).hexdigest())
+
+    symmetry_table = _symmetry_table_cache.pop(cache_key, None)
+
+    if symmetry_table is None:
+        mirror_points = points.copy()
+        mirror_points[:, axis] *= -1.0
+        mirror_ids, distance = tpSpatialIndex.PointGrid(points).nearest(mirror_points)
+
+        if tolerance is None:
+            tolerance = 1e-3 * np.linalg.norm(points.max(axis=0) - points.min(axis=0))
+
+        symmetry_table = (mirror_ids, distance <= tolerance)
+
+    _symmetry_table_cache[cache_key] = symmetry_table
+    while len(_symmetry_table_cache) > SYMMETRY_TABLE_CACHE_SIZE:
+        _symmetry_table_cache.popitem(last=False)
+
+    return symmetry_table
+
+
+def get_mesh_polygons(mesh):
+    """
+    Returns the polygon vertex lists of the mesh.
+    :param mesh:
+    :return (polygon_counts, polygon_vertices): vertex count of every polygon, their vertex ids flattened
+    """
+    polygon_counts, polygon_vertices = om2.MFnMesh(get_mesh_dag_path(mesh)).getVertices()
+
+    return np.array(polygon_counts, dtype=np.int64), np.array(polygon_vertices, dtype=np.int64)
+
+
+def get_mesh_edges(mesh):
+    """
+    Returns every edge of the mesh, built from the polygon vertex lists in one pass.
+    :param mesh:
+    :return edges: (edge_count, 2) vertex id array, lower id first
+    """
+    return _polygon_edges(*get_mesh_polygons(mesh))
+
+
+def get_topology_hash(mesh):
+    """
+    Digest of the polygon vertex lists, equal for meshes sharing a topology whatever their points.
+    :param mesh:
+    :return (vertex_count, topology_hash):
+    """
+    vertex_count = om2.MFnMesh(get_mesh_dag_path(mesh)).numVertices
+
+    return vertex_count, _topology_hash(*get_mesh_polygons(mesh))
+
+
+def get_vertex_adjacency(mesh):
+    """
+    Neighbour vertices of every vertex in CSR form, cached per topology -
+    meshes sharing a topology, or the same mesh after it deformed, reuse it.
+
+    :param mesh:
+    :return (offsets, neighbour_ids): neighbours of vertex v are neighbour_ids[offsets[v]:offsets[v + 1]]
+    """
+    polygon_counts, polygon_vertices = get_mesh_polygons(mesh)
+    vertex_count = om2.MFnMesh(get_mesh_dag_path(mesh)).numVertices
+    cache_key = (vertex_count, _topology_hash(polygon_counts, polygon_vertices))
+
+    adjacency = _adjacency_cache.pop(cache_key, None)
+
+    if adjacency is None:
+        edges = _polygon_edges(polygon_counts, polygon_vertices)
+
+        # both directions, sorted by source vertex
+        source_ids = np.concatenate([edges[:, 0], edges[:, 1]])
+        target_ids = np.concatenate([edges[:, 1], edges[:, 0]])
+        order = np.argsort(source_ids, kind='stable')
+
+        offsets = np.zeros(vertex_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source_ids, minlength=vertex_count), out=offsets[1:])
+
+        adjacency = (offsets, target_ids[order])
+
+    _adjacency_cache[cache_key] = adjacency
+    while len(_adjacency_cache) > ADJACENCY_CACHE_SIZE:
+        _adjacency_cache.popitem(last=False)
+
+    return adjacency
+
+
+def get_vertex_index(mesh, world_space=True, vertex_ids=None, check_points=False):
+    """
+    PointGrid over the mesh vertices, cached by mesh, vertex and polygon counts,
+    and the world matrix for world space grids - a cache hit reads no points.
+    Deforming the points keeps the key, pass check_points to compare them against the cached grid
+    and rebuild it when they moved, ie. for one batched query after a mesh was edited.
+
+    :param mesh:
+    :param world_space:
+    :param vertex_ids: restricts the grid to these vertices, grid indices then index vertex_ids
+    :param check_points: re-read the points and rebuild the grid if they changed
+    :return point_grid: tpSpatialIndex.PointGrid
+    """
+    dag_path = get_mesh_dag_path(mesh)
+    mesh_fn = om2.MFnMesh(dag_path)
+    vertex_ids_hash = None
+
+    if vertex_ids is not None:
+        vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+        vertex_ids_hash = hashlib.sha1(vertex_ids.tobytes()).hexdigest()
+
+    cache_key = (dag_path.fullPathName(), world_space, mesh_fn.numVertices, mesh_fn.numPolygons,
+                 tuple(dag_path.inclusiveMatrix()) if world_space else None, vertex_ids_hash)
+
+    point_grid = _vertex_index_cache.pop(cache_key, None)
+
+    if point_grid is None or check_points:
+        points = get_mesh_points(mesh, world_space)
+        if vertex_ids is not None:
+            points = points[vertex_ids]
+
+        if point_grid is None or not np.array_equal(point_grid.points, points):
+            point_grid = tpSpatialIndex.PointGrid(points)
+
+    _vertex_index_cache[cache_key] = point_grid
+    while len(_vertex_index_cache) > VERTEX_INDEX_CACHE_SIZE:
+        _vertex_index_cache.popitem(last=False)
+
+    return point_grid
+
+
+def get_closest_vertex_ids(mesh, query_points, world_space=True, check_points=False):
+    """
+    Closest vertex of the mesh for every query point.
+    :param mesh:
+    :param query_points: (query_count, 3) positions
+    :param world_space: space of the query points
+    :param check_points: see get_vertex_index
+    :return (vertex_ids, distance_array):
+    """
+    return get_vertex_index(mesh, world_space, check_points=check_points).nearest(_as_points(query_points))
+
+
+def get_k_closest_vertex_ids(mesh, query_points, k, world_space=True, check_points=False):
+    """
+    k closest vertices of the mesh for every query point, closest first.
+    :param mesh:
+    :param query_points: (query_count, 3) positions
+    :param k: capped to the vertex count
+    :param world_space:
+    :param check_points: see get_vertex_index
+    :return (vertex_ids, distance_array): (query_count, k) arrays
+    """
+    return get_vertex_index(mesh, world_space, check_points=check_points).k_nearest(_as_points(query_points), k)
+
+
+def get_vertex_ids_in_radius(mesh, query_points, radius, world_space=True, check_points=False):
+    """
+    Vertices of the mesh within radius of every query point, closest first.
+    :param mesh:
+    :param query_points: (query_count, 3) positions
+    :param radius:
+    :param world_space:
+    :param check_points: see get_vertex_index
+    :return (offsets, vertex_ids, distance_array): the vertices of query q are vertex_ids[offsets[q]:offsets[q + 1]]
+    """
+    return get_vertex_index(mesh, world_space, check_points=check_points).within_radius(
+        _as_points(query_points), radius)
+
+
+def get_closest_component_vertex_ids(component_list, query_points, world_space=True, check_points=False):
+    """
+    Closest vertex among the components for every query point, e.g. restricted to an edge loop.
+    :param component_list: components of a single mesh
+    :param query_points: (query_count, 3) positions
+    :param world_space:
+    :param check_points: see get_vertex_index
+    :return (mesh, vertex_ids, distance_array): mesh shape full path, closest vertex ids
+    """
+    mesh, component_vertex_ids = get_component_vertex_ids(component_list)
+    closest_index, distance_array = get_vertex_index(mesh, world_space, component_vertex_ids,
+                                                     check_points).nearest(_as_points(query_points))
+
+    return mesh, component_vertex_ids[closest_index], distance_array
+
+
+def get_closest_face_vertex_ids(mesh, query_points, world_space=True):
+    """
+    Vertex of the closest face nearest to every query point - the closest point on the surface is found first,
+    so on thin or folded geometry (lips, lids) the vertex comes from the surface the point is on,
+    not from the facing one. Reads only the vertices of the closest faces, no grid is built.
+
+    :param mesh:
+    :param query_points: (query_count, 3) positions
+    :param world_space: space of the query points
+    :return vertex_ids: (query_count,) array
+    """
+    space = om2.MSpace.kWorld if world_space else om2.MSpace.kObject
+    mesh_fn = om2.MFnMesh(get_mesh_dag_path(mesh))
+    query_points = _as_points(query_points)
+    vertex_ids = np.empty(len(query_points), dtype=np.int64)
+
+    for query_id, query_point in enumerate(query_points.tolist()):
+        face_id = mesh_fn.getClosestPoint(om2.MPoint(query_point), space)[1]
+        face_vertex_ids = list(mesh_fn.getPolygonVertices(face_id))
+        face_points = np.array([list(mesh_fn.getPoint(vertex_id, space))[:3] for vertex_id in face_vertex_ids])
+
+        vertex_ids[query_id] = face_vertex_ids[np.linalg.norm(face_points - query_point, axis=1).argmin()]
+
+    return vertex_ids
+
+
+def _as_points(query_points):
+    return np.asarray(query_points, dtype=np.float64).reshape(-1, 3)
+
+
+def _topology_hash(polygon_counts, polygon_vertices):
+    topology_hash = hashlib.sha1(polygon_counts.tobytes())
+    topology_hash.update(polygon_vertices.tobytes())
+
+    return topology_hash.hexdigest()
+
+
+def _polygon_edges(polygon_counts, polygon_vertices):
+    # every polygon vertex connects to the next one, the last wraps to the first
+    polygon_start = np.cumsum(polygon_counts) - polygon_counts
+    next_position = np.arange(1, len(polygon_vertices) + 1)
+    next_position[polygon_start + polygon_counts - 1] = polygon_start
+
+    edges = np.sort(np.stack([polygon_vertices, polygon_vertices[next_position]], axis=1), axis=1)
+    edge_keys = np.unique(edges[:, 0] * (polygon_vertices.max() + 1) + edges[:, 1])
+
+    return np.stack(np.divmod(edge_keys, polygon_vertices.max() + 1), axis=1)
@@ -1,3 +1,5 @@
+import re
+
 
 class NameConvention:
 
@@ -94,5 +96,15 @@ class NameConvention:
     def cluster_handle(self):
         return self.clusterHandle
 
-
-
+    def mirror_side(self, name):
+        """
+        Swaps the left and right side tokens of a name, 'l_arm_01_jnt' -> 'r_arm_01_jnt'.
+        Tokens are matched between '_', namespace ':' and path '|' separators,
+        names without side token come back unchanged.
+        :param name:
+        :return mirror_name:
+        """
+        side_swap_dict = {self.left: self.right, self.right: self.left}
+        side_pattern = r'(?<![^_:|])({}|{})(?![^_:|])'.format(re.escape(self.left), re.escape(self.right))
+
+        return re.sub(side_pattern, lambda match: side_swap_dict[match.group(1)], name)
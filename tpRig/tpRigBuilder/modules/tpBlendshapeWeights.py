@@ -2,11 +2,14 @@ import os
 import maya.cmds as cmds
 import tpRig.tpRigBuilder.tpModule as tpModule
 reload(tpModule)
+import tpRig.tpRigBuilder.tpProject as tpProject
+import tpRig.tpBlendShapeData as tpBlendShapeData
+reload(tpBlendShapeData)
 
 
 def build_module_object(module_name='', parent_action_name='root', background_color=None):
     module_group_name = 'BlendShape Tools'
-    module_name = 'BlendShape Target Invert'
+    module_name = 'BlendShape Target Weights'
 
     blendshape_module_object = tpModule.Module(  # Freaking confusing, must change
         module_name=module_group_name,
@@ -19,22 +22,24 @@ def build_module_object(module_name='', parent_action_name='root', background_co
         tpModule.Action(module_name, module_group_name),
         tpModule.Action('Load Geometry Selection', module_name, blendshape_tool_obj.load_geometry_selection),
         tpModule.Action('Clear Geometry Selection', module_name, blendshape_tool_obj.clear_geometry_selection),
-        tpModule.Action('Clear Weights List', module_name, blendshape_tool_obj.clear_stored_weight_list),
-        tpModule.Action('Invert Weights', module_name, blendshape_tool_obj.invert_weights),
-        tpModule.Action('Offset Target Index +5', module_name, blendshape_tool_obj.offset_target_index_five_positive),
-        tpModule.Action('Offset Target Index -5', module_name, blendshape_tool_obj.offset_target_index_five_negative),
-        tpModule.Action('Get Target Weights', module_name),
-        tpModule.Action('Get Target 00', 'Get Target Weights', blendshape_tool_obj.copy_target_00),
-        tpModule.Action('Get Target 01', 'Get Target Weights', blendshape_tool_obj.copy_target_01),
-        tpModule.Action('Get Target 02', 'Get Target Weights', blendshape_tool_obj.copy_target_02),
-        tpModule.Action('Get Target 03', 'Get Target Weights', blendshape_tool_obj.copy_target_03),
-        tpModule.Action('Get Target 04', 'Get Target Weights', blendshape_tool_obj.copy_target_04),
-        tpModule.Action('Set Target Weights', module_name),
-        tpModule.Action('Set Target 00', 'Set Target Weights', blendshape_tool_obj.set_target_00),
-        tpModule.Action('Set Target 01', 'Set Target Weights', blendshape_tool_obj.set_target_01),
-        tpModule.Action('Set Target 02', 'Set Target Weights', blendshape_tool_obj.set_target_02),
-        tpModule.Action('Set Target 03', 'Set Target Weights', blendshape_tool_obj.set_target_03),
-        tpModule.Action('Set Target 04', 'Set Target Weights', blendshape_tool_obj.set_target_04),
+        tpModule.Action('Stored Weights', module_name),
+        tpModule.Action('Get Target Weights', 'Stored Weights', blendshape_tool_obj.copy_target_weights),
+        tpModule.Action('Set Target Weights', 'Stored Weights', blendshape_tool_obj.set_target_weights),
+        tpModule.Action('Add To Target Weights', 'Stored Weights', blendshape_tool_obj.add_target_weights),
+        tpModule.Action('Multiply Target Weights', 'Stored Weights', blendshape_tool_obj.multiply_target_weights),
+        tpModule.Action('Invert Stored Weights', 'Stored Weights', blendshape_tool_obj.invert_stored_weights),
+        tpModule.Action('Clear Stored Weights', 'Stored Weights', blendshape_tool_obj.clear_stored_weights),
+        tpModule.Action('Weight Map Library', module_name),
+        tpModule.Action('Save Stored Weights To Library', 'Weight Map Library',
+                        blendshape_tool_obj.save_stored_weights_to_library),
+        tpModule.Action('Load Library Map To Stored Weights', 'Weight Map Library',
+                        blendshape_tool_obj.load_library_map_to_stored_weights),
+        tpModule.Action('List Library Maps', 'Weight Map Library', blendshape_tool_obj.list_library_maps),
+        tpModule.Action('Edit Target Weights', module_name),
+        tpModule.Action('Invert Targets', 'Edit Target Weights', blendshape_tool_obj.invert_target_weights),
+        tpModule.Action('Clamp Targets', 'Edit Target Weights', blendshape_tool_obj.clamp_target_weights),
+        tpModule.Action('Normalize Across Targets', 'Edit Target Weights',
+                        blendshape_tool_obj.normalize_target_weights),
     ]
 
     blendshape_module_object.add_action_list(action_list)
@@ -42,137 +47,135 @@ def build_module_object(module_name='', parent_action_name='root', background_co
     return blendshape_module_object
 
 
-class BlendShapeWeights:
+class BlendShapeWeights(tpProject.Project):
+    """
+    Edits blendShape target weight maps through tpBlendShapeData.WeightMapMatrix.
+    Targets are picked by selecting their weight channels in the channel box,
+    'Get Target Weights' stores the first one, the other actions apply to all of them.
+    Stored weights can be kept in the project weight map library.
+    """
 
     def __init__(self):
+        super(BlendShapeWeights, self).__init__()
         self._geometry_transform = ''
-        self._geometry_vertex_count = 0
-        self._target_weight_list = []
-        self._blendshape_node = ''
-        self._target_index_offset = 0
+        self._weight_map_matrix = None
+        self._stored_weights = None
+        self._library_path = os.path.join(self.project_dir_dict['blend_shape_data'], 'weight_maps/')
 
     def load_geometry_selection(self):
         self._geometry_transform = cmds.ls(selection=True)[0]
-        self._geometry_vertex_count = cmds.polyEvaluate(self._geometry_transform, vertex=True)
 
-        self._blendshape_node = cmds.ls(
-            cmds.listHistory(self._geometry_transform, allConnections=True), type='blendShape')[0]
-        if not self._blendshape_node:
+        blendshape_node = tpBlendShapeData.get_blend_shape_node(self._geometry_transform)
+        if not blendshape_node:
             raise RuntimeError("No blendShape node found connected to the selected mesh")
 
+        self._weight_map_matrix = tpBlendShapeData.WeightMapMatrix(blendshape_node)
+        print('[BlendShape Weights] {} - {} targets loaded'.format(
+            blendshape_node, len(self._weight_map_matrix.target_list)))
+
     def clear_geometry_selection(self):
         self._geometry_transform = ''
-        self._geometry_vertex_count = 0
-        self._blendshape_node = ''
-
-    def clear_stored_weight_list(self):
-        self._target_weight_list = []
-
-    def invert_weights(self):
-        invert_weight_list = []
-
-        for weight in self._target_weight_list:
-            invert_weight_list.append(1 - weight)
-
-        self._target_weight_list = invert_weight_list
-
-    def offset_target_index_five_positive(self):
-        self._target_index_offset = self._target_index_offset + 5
-        print('[BlendShape Weights] Target Index now starts at {}'.format(self._target_index_offset))
-
-    def offset_target_index_five_negative(self):
-        if self._target_index_offset >= 5:
-            self._target_index_offset = self._target_index_offset - 5
-        else:
-            self._target_index_offset = 0
-        print('[BlendShape Weights] Target Index now starts at {}'.format(self._target_index_offset))
-
-    def copy_target_00(self):
-        target_index = 0 + self._target_index_offset
-        self._target_weight_list = get_target_weights_list(
-            self._blendshape_node,
-            target_index,
-            self._geometry_vertex_count)
-
-    def copy_target_01(self):
-        target_index = 1 + self._target_index_offset
-        self._target_weight_list = get_target_weights_list(
-            self._blendshape_node,
-            target_index,
-            self._geometry_vertex_count)
-
-    def copy_target_02(self):
-        target_index = 2 + self._target_index_offset
-        self._target_weight_list = get_target_weights_list(
-            self._blendshape_node,
-            target_index,
-            self._geometry_vertex_count)
-
-    def copy_target_03(self):
-        target_index = 3 + self._target_index_offset
-        self._target_weight_list = get_target_weights_list(
-            self._blendshape_node,
-            target_index,
-            self._geometry_vertex_count)
-
-    def copy_target_04(self):
-        target_index = 4 + self._target_index_offset
-        self._target_weight_list = get_target_weights_list(
-            self._blendshape_node,
-            target_index,
-            self._geometry_vertex_count)
-
-    def set_target_00(self):
-        target_index = 0 + self._target_index_offset
-        set_target_weights_list(
-            self._blendshape_node,
-            target_index,
-            self._target_weight_list)
-
-    def set_target_01(self):
-        target_index = 1 + self._target_index_offset
-        set_target_weights_list(
-            self._blendshape_node,
-            target_index,
-            self._target_weight_list)
-
-    def set_target_02(self):
-        target_index = 2 + self._target_index_offset
-        set_target_weights_list(
-            self._blendshape_node,
-            target_index,
-            self._target_weight_list)
-
-    def set_target_03(self):
-        target_index = 3 + self._target_index_offset
-        set_target_weights_list(
-            self._blendshape_node,
-            target_index,
-            self._target_weight_list)
-
-    def set_target_04(self):
-        target_index = 4 + self._target_index_offset
-        set_target_weights_list(
-            self._blendshape_node,
-            target_index,
-            self._target_weight_list)
-
-
-def get_target_weights_list(blendshape_node, target_index, geo_vertex_count):
-    target_weight_list = cmds.getAttr(
-        '{}.inputTarget[0].inputTargetGroup[{}].targetWeights[0:{}]'.format(
-            blendshape_node,
-            target_index,
-            geo_vertex_count - 1))
-
-    return target_weight_list
-
-
-def set_target_weights_list(blendshape_node, target_index, target_weights_list):
-    cmds.setAttr(
-        '{}.inputTarget[0].inputTargetGroup[{}].targetWeights[0:{}]'.format(
-            blendshape_node,
-            target_index,
-            len(target_weights_list) - 1),
-        *target_weights_list)
+        self._weight_map_matrix = None
+
+    def clear_stored_weights(self):
+        self._stored_weights = None
+
+    def invert_stored_weights(self):
+        self._stored_weights = 1.0 - self._get_stored_weights()
+
+    def copy_target_weights(self):
+        target = self._get_selected_target_list()[0]
+        self._weight_map_matrix.reload_targets([target])
+        self._stored_weights = self._weight_map_matrix.get(target)
+        print('[BlendShape Weights] Stored {} weights'.format(target))
+
+    def set_target_weights(self):
+        self._edit_selected_targets('set', self._get_stored_weights())
+
+    def add_target_weights(self):
+        self._edit_selected_targets('add', self._get_stored_weights())
+
+    def multiply_target_weights(self):
+        self._edit_selected_targets('multiply', self._get_stored_weights())
+
+    def invert_target_weights(self):
+        self._edit_selected_targets('invert')
+
+    def clamp_target_weights(self):
+        self._edit_selected_targets('clamp')
+
+    def normalize_target_weights(self):
+        self._edit_selected_targets('normalize')
+
+    def save_stored_weights_to_library(self):
+        stored_weights = self._get_stored_weights()
+        map_name = _prompt_map_name('Save Weight Map')
+
+        if map_name:
+            tpBlendShapeData.save_weight_map(self._library_path, map_name, stored_weights, self._get_geometry())
+            print('[BlendShape Weights] Saved weight map {}'.format(map_name))
+
+    def load_library_map_to_stored_weights(self):
+        geometry = self._get_geometry()
+        map_name = _prompt_map_name('Load Weight Map')
+
+        if map_name:
+            self._stored_weights = tpBlendShapeData.load_weight_map(self._library_path, map_name, geometry)
+            print('[BlendShape Weights] Stored weight map {}'.format(map_name))
+
+    def list_library_maps(self):
+        for map_name, map_data in sorted(tpBlendShapeData.read_weight_map_index(self._library_path)['maps'].items()):
+            print('[BlendShape Weights] {} - {} ({} vertices)'.format(map_name, map_data['mesh'],
+                                                                      map_data['vertex_count']))
+
+    def _get_geometry(self):
+        if not self._weight_map_matrix:
+            raise RuntimeError('No geometry loaded, use Load Geometry Selection first')
+
+        return tpBlendShapeData.get_blend_shape_geometry(self._weight_map_matrix.blend_shape_node,
+                                                         self._weight_map_matrix.geometry_index)
+
+    def _edit_selected_targets(self, operation_name, *args):
+        target_list = self._get_selected_target_list()
+
+        # the targets may have been painted since the last action
+        self._weight_map_matrix.reload_targets(target_list)
+        getattr(self._weight_map_matrix, operation_name)(target_list, *args)
+        self._weight_map_matrix.apply()
+
+    def _get_stored_weights(self):
+        if self._stored_weights is None:
+            raise RuntimeError('No weights stored, use Get Target Weights first')
+
+        return self._stored_weights
+
+    def _get_selected_target_list(self):
+        if not self._weight_map_matrix:
+            raise RuntimeError('No geometry loaded, use Load Geometry Selection first')
+
+        selected_attribute_list = (
+            (cmds.channelBox('mainChannelBox', query=True, selectedMainAttributes=True) or []) +
+            (cmds.channelBox('mainChannelBox', query=True, selectedHistoryAttributes=True) or []))
+        target_list = [attribute for attribute in selected_attribute_list
+                       if attribute in self._weight_map_matrix.target_list]
+
+        if not target_list:
+            raise RuntimeError('Select {} target channels in the channel box'.format(
+                self._weight_map_matrix.blend_shape_node))
+
+        return target_list
+
+
+def _prompt_map_name(title):
+    result = cmds.promptDialog(
+        title=title,
+        message='Enter Name:',
+        button=['OK', 'Cancel'],
+        defaultButton='OK',
+        cancelButton='Cancel',
+        dismissString='Cancel')
+
+    if result == 'OK':
+        return cmds.promptDialog(query=True, text=True)
 
+    return None
@@ -1,6 +1,5 @@
 import os
 import glob
-import math
 
 import maya.mel as mel
 import maya.cmds as mc
@@ -9,6 +8,10 @@ import maya.cmds as cmds
 import tpRig.tpRigBuilder.tpModule as tpModule
 import tpRig.tpRigUtils as tpUtils
 reload(tpUtils)
+import tpRig.tpSkinWeights as tpSkinWeights
+reload(tpSkinWeights)
+import tpRig.tpMeshData as tpMeshData
+reload(tpMeshData)
 import tpRig.tpControl.tpControl as tpCtrl
 reload(tpCtrl)
 import tpRig.tpRigBuilder.tpProject as tpProject
@@ -76,7 +79,7 @@ class PostBuildUtils(tpProject.Project):
     def om_export_model_geo_skin_weights(self):
         """
         Queries all geometry in 'model_geo_grp'
-        Exports skin weights file using om_export_skin_weights.
+        Exports a new skin weights version, see tpSkinWeights.export_versioned_skin_weights.
         :return:
         """
         file_name = self.project_data_file_dict['model_geo_skin_weights']
@@ -85,14 +88,14 @@ class PostBuildUtils(tpProject.Project):
         geometry_list = [child for child in all_children if mc.listRelatives(child, type='shape')]
         skinned_geo_list = [geo for geo in geometry_list if mel.eval('findRelatedSkinCluster "{}"'.format(geo))]
 
-        self.om_export_skin_weights(skinned_geo_list,
-                                    self.project_dir_dict['skin_clusters_model'],
-                                    file_name)
+        tpSkinWeights.export_versioned_skin_weights(skinned_geo_list,
+                                                    self.project_dir_dict['skin_clusters_model'],
+                                                    file_name)
 
     def om_export_template_geo_skin_weights(self):
         """
         Queries all geometry in 'template_geo_grp'
-        Exports skin weights file using om_export_skin_weights.
+        Exports a new skin weights version, see tpSkinWeights.export_versioned_skin_weights.
         :return:
         """
         file_name = self.project_data_file_dict['template_geo_skin_weights']
@@ -101,9 +104,9 @@ class PostBuildUtils(tpProject.Project):
         geometry_list = [child for child in all_children if mc.listRelatives(child, type='shape')]
         skinned_geo_list = [geo for geo in geometry_list if mel.eval('findRelatedSkinCluster "{}"'.format(geo))]
 
-        self.om_export_skin_weights(skinned_geo_list,
-                                    self.project_dir_dict['skin_clusters_template'],
-                                    file_name)
+        tpSkinWeights.export_versioned_skin_weights(skinned_geo_list,
+                                                    self.project_dir_dict['skin_clusters_template'],
+                                                    file_name)
 
     def om_export_system_skin_weights(self):
         """
@@ -121,6 +124,23 @@ class PostBuildUtils(tpProject.Project):
                                         self.project_dir_dict['skin_clusters_system'],
                                         file_name)
 
+    def lint_skin_weights(self):
+        """
+        Lints the exported weights of every skin_clusters_* directory,
+        the json report is written to the skin_clusters_root directory.
+        :return:
+        """
+        dir_path_list = [dir_data.values()[0] for dir_data in self.project_dir_dict_list
+                         if dir_data.keys()[0].startswith('skin_clusters_') and 'skin_clusters_root' not in dir_data]
+        report_path = os.path.join(self.project_dir_dict['skin_clusters_root'], tpSkinWeights.LINT_REPORT_FILE_NAME)
+
+        report = tpSkinWeights.lint_skin_weights_dirs(dir_path_list, report_path)
+
+        for mesh in report['failed_mesh_list']:
+            print('[Skin Weights Lint] {} failed'.format(mesh))
+
+        return report
+
     def rename_skin_cluster_nodes(self):
         """
         Queries all skinclusters in the scene and name it according to the transform node name
@@ -293,6 +313,54 @@ class PostBuildUtils(tpProject.Project):
     def add_missing_influences(self):
         add_unexisting_influences_a_to_b(self.vertex_set_b, self.vertex_set_a)
 
+    def sync_selection_influences(self):
+        """
+        Select the reference skinned mesh first, then the meshes to bring up to its influences.
+        :return:
+        """
+        mesh_list = mc.ls(selection=True, objectsOnly=True)
+
+        if len(mesh_list) < 2:
+            print('Please select the reference mesh, then the meshes to sync')
+            return
+
+        tpSkinWeights.sync_mesh_influences(mesh_list[1:], mesh_list[0])
+
+    def weights_from_selection_barycentric(self):
+        """
+        Select the source skinned mesh first, then the meshes receiving weights.
+        :return:
+        """
+        mesh_list = mc.ls(selection=True, objectsOnly=True)
+
+        if len(mesh_list) < 2:
+            print('Please select the source mesh, then the target meshes')
+            return
+
+        for target_mesh in mesh_list[1:]:
+            tpSkinWeights.transfer_barycentric_weights(target_mesh, mesh_list[0])
+
+    def mirror_selection_weights_positive_x(self):
+        mirror_selection_skin_weights(positive_to_negative=True)
+
+    def mirror_selection_weights_negative_x(self):
+        mirror_selection_skin_weights(positive_to_negative=False)
+
+    def smooth_selection_weights(self):
+        smooth_selection_skin_weights(iterations=5, strength=0.5)
+
+    def relax_selection_weights(self):
+        smooth_selection_skin_weights(iterations=20, strength=0.25)
+
+    def limit_selection_influences_four(self):
+        condition_selection_skin_weights(max_influences=4)
+
+    def limit_selection_influences_eight(self):
+        condition_selection_skin_weights(max_influences=8)
+
+    def prune_selection_small_weights(self):
+        condition_selection_skin_weights(max_influences=None)
+
 
 def get_top_hierarchy_node(item_list):
     top_node_list = []
@@ -330,50 +398,30 @@ def find_closest_vertex(reference_vertex, vertex_list):
     Finds closest vertex to reference vertex in provided list
 
     :reference_vertex: vertex to be compared to all vertex in provided list
-    :vertex_list: list to compare with reference_vertex
+    :vertex_list: list to compare with reference_vertex, vertices of a single mesh
 
     :return: vertex with smallest distance from reference_vertex from provided vertex_list
     """
-
-    vertex_distance_dict = {}
     # get reference vertex position
     ref_vert_pos = cmds.xform(reference_vertex, query=True, translation=True, worldSpace=True)
 
-    for vertex in vertex_list:
-        # gets the position of correct vertex in list
-        position = cmds.xform(vertex, query=True, translation=True, worldSpace=True)
-        # finds euclidean distance between the two points
-        distance = math.sqrt((ref_vert_pos[0] - position[0]) ** 2 + (ref_vert_pos[1] - position[1]) ** 2 + (
-                ref_vert_pos[2] - position[2]) ** 2)
+    # one query of the grid over the listed vertices, cached per mesh pose
+    closest_vertex_id = tpMeshData.get_closest_component_vertex_ids(vertex_list, [ref_vert_pos])[1][0]
 
-        # updates dictionary with information
-        vertex_distance_dict.update({distance: vertex})
-
-    # finds smallest value on listed distances
-    closest_distance = min(vertex_distance_dict.keys())
-
-    return vertex_distance_dict[closest_distance]
+    return '{}.vtx[{}]'.format(vertex_list[0].split('.')[0], closest_vertex_id)
 
 
 def weights_from_list_b_to_a_closest(list_a, list_b):
     """
-    Loops through all vertices in list A, finds the closest vertex in list B
+    For all vertices in list A, finds the closest vertex in list B
     and copies the weights from B to A.
-
-    Both vertex list must be in the same mesh.
+    Runs as one batched closest point query and a single skin weights write,
+    see tpSkinWeights.transfer_closest_vertex_weights.
 
     :list_a: List of vertices to get new skin weights
     :list_b: List of vertices to provide the skinning information
     """
-
-    for vertex in list_a:
-        closest_in_b = find_closest_vertex(vertex, list_b)
-
-        cmds.select(closest_in_b, r=True)
-        mel.eval('artAttrSkinWeightCopy')
-
-        cmds.select(vertex, r=True)
-        mel.eval('artAttrSkinWeightPaste')
+    tpSkinWeights.transfer_closest_vertex_weights(list_a, list_b)
 
     print("[Copy Skin Weights From List A to B] Process Completed - Success")
 
@@ -385,47 +433,99 @@ def weights_from_list_b_to_a_closest(list_a, list_b):
 
 
 def add_unexisting_influences_a_to_b(vert_list_a, vert_list_b):
-    influence_list_b = []
-    for vertex in vert_list_b:
-        skincluster = mel.eval('findRelatedSkinCluster {};'.format(vertex.split('.')[0]))
-        influence_query_list = cmds.skinPercent(skincluster, vertex, query=True, transform=None)
-
-        for influence in influence_query_list:
-            if influence not in influence_list_b:
-                influence_list_b.append(influence)
-
-    influence_list_a = []
-    for vertex in vert_list_a:
-        skincluster = mel.eval('findRelatedSkinCluster {};'.format(vertex.split('.')[0]))
-        influence_query_list = cmds.skinPercent(skincluster, vertex, query=True, transform=None)
-
-        for influence in influence_query_list:
-            if influence not in influence_list_a:
-                influence_list_a.append(influence)
-
-    unexisting_influences = [influence for influence in influence_list_a if influence not in influence_list_b]
+    """
+    Adds to the skinCluster of list B every influence weighting list A
+    that it does not have yet, see tpSkinWeights.sync_component_influences.
 
+    :vert_list_a: List of vertices providing the influences
+    :vert_list_b: List of vertices of the mesh receiving the influences
+    """
     print(
         "[add_unexisting_influences_a_to_b] Adding Unexistent Influences to '{}'".format(vert_list_b[0].split('.')[0]))
 
-    b_skin_cluster = mel.eval('findRelatedSkinCluster {};'.format(vert_list_b[0].split('.')[0]))
-    for influence in unexisting_influences:
-        cmds.skinCluster(
-            b_skin_cluster,
-            edit=True,
-            useGeometry=True,
-            dropoffRate=4,
-            polySmoothness=0,
-            nurbsSamples=10,
-            lockWeights=True,
-            weight=0,
-            addInfluence=influence)
+    unexisting_influences = tpSkinWeights.sync_component_influences(vert_list_b, vert_list_a)
 
     print("[add_unexisting_influences_a_to_b] Process Successful")
 
     return unexisting_influences
 
 
+def condition_selection_skin_weights(max_influences=4, threshold_value=0.005):
+    """
+    Prunes, limits influences and normalizes the skin weights of the selected geometry.
+    Influences locked in the scene are kept as they are.
+    :param max_influences: None to only prune
+    :param threshold_value:
+    :return:
+    """
+    geometry_list = mc.ls(selection=True, objectsOnly=True)
+
+    if not geometry_list:
+        print('Please select skinned geometry')
+        return
+
+    for geometry in geometry_list:
+        skin_cluster = tpSkinWeights.get_skin_cluster(geometry)
+
+        if not skin_cluster:
+            print('[Condition Skin Weights] {} has no skinCluster'.format(geometry))
+            continue
+
+        tpSkinWeights.condition_skin_cluster(skin_cluster,
+                                             max_influences=max_influences,
+                                             threshold_value=threshold_value)
+
+
+def mirror_selection_skin_weights(positive_to_negative=True):
+    """
+    Mirrors the skin weights of the selected symmetric meshes across X,
+    influences swap sides through their l_/r_ name tokens.
+    :param positive_to_negative: +X side onto -X side, or the other way
+    :return:
+    """
+    mesh_list = mc.ls(selection=True, objectsOnly=True)
+
+    if not mesh_list:
+        print('Please select skinned geometry')
+        return
+
+    for mesh in mesh_list:
+        if not tpSkinWeights.get_skin_cluster(mesh):
+            print('[Mirror Skin Weights] {} has no skinCluster'.format(mesh))
+            continue
+
+        tpSkinWeights.mirror_skin_weights(mesh, axis=0, positive_to_negative=positive_to_negative)
+
+
+def smooth_selection_skin_weights(iterations=5, strength=0.5, max_influences=4):
+    """
+    Smooths the skin weights of the selected components, or of whole meshes when objects are selected.
+    Influences locked in the scene are kept as they are.
+    :param iterations:
+    :param strength:
+    :param max_influences:
+    :return:
+    """
+    selection_list = mc.ls(selection=True)
+
+    if not selection_list:
+        print('Please select skinned geometry or components')
+        return
+
+    # one smooth per mesh, components grouped by their node
+    component_dict = {}
+    for item in selection_list:
+        component_dict.setdefault(item.split('.')[0], []).append(item)
+
+    for node, component_list in component_dict.items():
+        if not tpSkinWeights.get_skin_cluster(node):
+            print('[Smooth Skin Weights] {} has no skinCluster'.format(node))
+            continue
+
+        tpSkinWeights.smooth_skin_weights(component_list, iterations=iterations, strength=strength,
+                                          max_influences=max_influences)
+
+
 def build_module_object(module_name='Post-Build Utilities', parent_action_name='root', background_color=None):
     post_utils_obj = PostBuildUtils()
 
@@ -450,6 +550,7 @@ def build_module_object(module_name='Post-Build Utilities', parent_action_name='
                         post_utils_obj.om_export_template_geo_skin_weights),
         tpModule.Action('OM Export System Weights', 'Skin Tools',
                         post_utils_obj.om_export_system_skin_weights),
+        tpModule.Action('Lint Exported Skin Weights', 'Skin Tools', post_utils_obj.lint_skin_weights),
 
         tpModule.Action('Import And Assign Arnold Shaders', 'Post-Build Utilities',
                         post_utils_obj.assign_arnold_shaders),
@@ -458,7 +559,30 @@ def build_module_object(module_name='Post-Build Utilities', parent_action_name='
         tpModule.Action('Register Set A', 'Transfer Weights Set B to A', post_utils_obj.register_set_a),
         tpModule.Action('Register Set B', 'Transfer Weights Set B to A', post_utils_obj.register_set_b),
         tpModule.Action('Transfer Missing Weights', 'Transfer Weights Set B to A',
-                        post_utils_obj.add_missing_influences)
+                        post_utils_obj.add_missing_influences),
+
+        tpModule.Action('Sync Influences From First Selected', 'Skin Tools',
+                        post_utils_obj.sync_selection_influences),
+        tpModule.Action('Transfer Weights Barycentric', 'Skin Tools',
+                        post_utils_obj.weights_from_selection_barycentric),
+
+        tpModule.Action('Mirror Weights', 'Skin Tools'),
+        tpModule.Action('Mirror Selection +X to -X', 'Mirror Weights',
+                        post_utils_obj.mirror_selection_weights_positive_x),
+        tpModule.Action('Mirror Selection -X to +X', 'Mirror Weights',
+                        post_utils_obj.mirror_selection_weights_negative_x),
+
+        tpModule.Action('Smooth Weights', 'Skin Tools'),
+        tpModule.Action('Smooth Selection', 'Smooth Weights', post_utils_obj.smooth_selection_weights),
+        tpModule.Action('Relax Selection', 'Smooth Weights', post_utils_obj.relax_selection_weights),
+
+        tpModule.Action('Condition Weights', 'Skin Tools'),
+        tpModule.Action('Limit Selection to 4 Influences', 'Condition Weights',
+                        post_utils_obj.limit_selection_influences_four),
+        tpModule.Action('Limit Selection to 8 Influences', 'Condition Weights',
+                        post_utils_obj.limit_selection_influences_eight),
+        tpModule.Action('Prune Selection Small Weights', 'Condition Weights',
+                        post_utils_obj.prune_selection_small_weights)
     ]
 
     post_utils_mod_obj.add_action_list(action_list)
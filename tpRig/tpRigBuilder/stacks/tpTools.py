@@ -10,6 +10,7 @@ import tpRig.tpRigBuilder.tpUtilities as tpUtils
 
 import tpRig.tpRigBuilder.modules.tpBlendshapeWeights as tpBlendShapeWeights
 import tpRig.tpRigBuilder.modules.tpLocatorTools as tpLocator
+import tpRig.tpMeshData as tpMeshData
 
 reload(tpUtilities)
 reload(tpProject)
@@ -751,32 +752,19 @@ class TransferSelection:
 def selection_transfer_closest_point(source_geo_vtx_list, target_geo):
     """
     Transfers selection from mesh A to mesh B based on the closest point
-    to each vertex.
+    to each vertex, the nearest vertex of the closest target face like closestPointOnMesh.closestVertexIndex.
     :return:
     """
-    # Get node names
-    source_vtx_list_expanded = cmds.filterExpand(source_geo_vtx_list, sm=31)
-    source_geo = source_vtx_list_expanded[0].split('.')[0]
-    source_geo_shape = cmds.listRelatives(source_geo, type='shape')[0]
-
-    # Create closestPointOnMesh node and make connections
-    target_geo_shape = cmds.listRelatives(target_geo, type='shape')[0]
-    closest_point_node = cmds.createNode("closestPointOnMesh")
-    cmds.connectAttr(target_geo_shape + ".worldMesh[0]", closest_point_node + ".inMesh")
+    # Get source vertex positions
+    source_geo_shape, source_vtx_ids = tpMeshData.get_component_vertex_ids(source_geo_vtx_list)
+    position_array = tpMeshData.get_mesh_points(source_geo_shape)[source_vtx_ids]
 
     # Create list
-    closest_vert_list = []
-
-    for vert in source_vtx_list_expanded:
-        position = cmds.xform(vert, query=True, translation=True, worldSpace=True)
-        cmds.setAttr(closest_point_node + '.inPosition', position[0], position[1], position[2])
-
-        closest_vert_index = cmds.getAttr(closest_point_node + ".closestVertexIndex")
-        closest_vert = "{}.vtx[{}]".format(target_geo, closest_vert_index)
-        closest_vert_list.append(closest_vert)
+    closest_vert_index_array = tpMeshData.get_closest_face_vertex_ids(target_geo, position_array)
+    closest_vert_list = ['{}.vtx[{}]'.format(target_geo, closest_vert_index)
+                         for closest_vert_index in closest_vert_index_array.tolist()]
 
     cmds.select(closest_vert_list)
-    cmds.delete(closest_point_node)
 
 
 def mgear_select_guide_children():
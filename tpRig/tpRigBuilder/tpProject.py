@@ -48,7 +48,8 @@ class Project(tpBuildable.Buildable):
             'model_geo_skin_weights': 'model_geo_skin_weights',
             'template_geo_skin_weights': 'template_geo_skin_weights',
             'system_geo_skin_weights': 'system_geo_skin_weights',
-            'control_shape': 'control_shape_data'
+            'control_shape': 'control_shape_data',
+            'blend_shape_targets': 'blend_shape_targets'
         }
 
         self.not_found_dir_dict = []
@@ -1,12 +1,14 @@
+import os
 import maya.cmds as cmds
-import maya.mel as mel
-import maya.OpenMaya as OpenMaya
-import maya.OpenMayaAnim as OpenMayaAnim
 import maya.api.OpenMaya as om2
 import math
 
 import tpRig.tpRigUtils as tpUtils
 reload(tpUtils)
+import tpRig.tpSkinWeights as tpSkinWeights
+reload(tpSkinWeights)
+import tpRig.tpBlendShapeData as tpBlendShapeData
+reload(tpBlendShapeData)
 import tpRig.tpControl.tpControl as tpCtrl
 reload(tpCtrl)
 import tpRig.tpRigBuilder.tpProject as tpProject
@@ -32,7 +34,15 @@ class Utilities(tpProject.Project):
 
         self.register_build_method('Import Blend Shapes FBX', 'Pre-Build Utils', self.import_all_shapes)
         self.register_build_method('Add BlendShape Targets', 'Pre-Build Utils', self.blend_shape_add_targets)
+        self.register_build_method('Print BlendShape Targets Plan', 'Pre-Build Utils',
+                                   self.print_blend_shape_targets_plan)
+        self.register_build_method('Import BlendShape Delta Archive', 'Pre-Build Utils',
+                                   self.import_blend_shape_delta_archive)
+        self.register_build_method('Export BlendShape Delta Archive', 'Pre-Build Utils',
+                                   self.export_blend_shape_delta_archive)
         self.register_build_method('Connect BlendShape Controls', 'Pre-Build Utils', self.connect_blend_shapes_control)
+        self.register_build_method('Print BlendShape Connections Plan', 'Pre-Build Utils',
+                                   self.print_blend_shape_connections_plan)
         self.register_build_method('Create Curve From A to B', 'Pre-Build Utils', self.create_curve_from_a_to_b)
 
         self.register_build_method('Curve Distribute Tools', 'Pre-Build Utils')
@@ -149,46 +159,73 @@ class Utilities(tpProject.Project):
     def import_all_shapes(self):
         tpUtils.import_shapes(self.project_dir_dict['blend_shapes'])
 
-    def blend_shape_add_targets(self):
+    def export_blend_shape_delta_archive(self):
+        """
+        Stores the targets of every head element blendShape as sparse deltas in the project
+        blend_shape_data directory, see tpBlendShapeData.export_target_delta_archive.
+        :return manifest_path:
+        """
+        head_element_list = cmds.listRelatives(self.head_model_geo_grp, children=True, type='transform')
+
+        return tpBlendShapeData.export_target_delta_archive(head_element_list, self._get_delta_archive_path())
+
+    def import_blend_shape_delta_archive(self):
+        """
+        Builds the head element blendShape targets from the project delta archive,
+        in place of importing the sculpt meshes and adding them as targets.
+        :return import_report:
+        """
+        archive_path = self._get_delta_archive_path()
+
+        if not os.path.isfile(archive_path):
+            print('[Import BlendShape Delta Archive] No archive found at {}'.format(archive_path))
+            return
+
+        return tpBlendShapeData.import_target_delta_archive(archive_path)
+
+    def _get_delta_archive_path(self):
+        return os.path.join(self.project_dir_dict['blend_shape_data'],
+                            self.project_data_file_dict['blend_shape_targets'] +
+                            tpBlendShapeData.DELTA_ARCHIVE_EXTENSION)
+
+    def blend_shape_add_targets(self, dry_run=False):
         """
         Add blendShape targets from imported geometry .mb file
         Method created specifically for Bob project, please check out hierarchy structure
         on bob blendShape template geo file.
-        :return:
+        Targets are planned up front and added with one blendShape command per head element,
+        see tpBlendShapeData.plan_blend_shape_targets.
+
+        :param dry_run: only print and return the plan
+        :return plan:
         """
         blend_shape_geo_grp = 'blend_shape_template_geo_grp'
         shapes_grp_list = cmds.listRelatives(blend_shape_geo_grp, children=True, type='transform')
         head_model_grp_children = cmds.listRelatives(self.head_model_geo_grp, children=True, type='transform')
 
-        for index, shape_group in enumerate(shapes_grp_list):
-            shape_group_children = cmds.listRelatives(shape_group, children=True, type='transform')
-
-            for shape in shape_group_children:
-                for head_element_geo in head_model_grp_children:
-                    if head_element_geo in shape:
-                        if index == 0:
-                            cmds.blendShape(shape, head_element_geo,
-                                            name='{}_blendShape_node'.format(head_element_geo.replace('_geo', '')))
-                        else:
-                            item_history_list = cmds.listHistory(head_element_geo)
-                            blendshape_node = cmds.ls(item_history_list, type='blendShape')[0]
-                            blendshape_weights_list = cmds.blendShape(blendshape_node, q=True, weight=True)
-                            blendshape_weights_len = len(blendshape_weights_list)
-
-                            cmds.blendShape(blendshape_node,
-                                            edit=True,
-                                            target=(head_element_geo,
-                                                  blendshape_weights_len,
-                                                  shape,
-                                                  1.0))
-
-    def connect_blend_shapes_control(self):
+        shape_group_list = [cmds.listRelatives(shape_group, children=True, type='transform') or []
+                            for shape_group in shapes_grp_list]
+        plan = tpBlendShapeData.plan_blend_shape_targets(shape_group_list, head_model_grp_children)
+
+        tpBlendShapeData.print_blend_shape_target_plan(plan)
+        if not dry_run:
+            tpBlendShapeData.apply_blend_shape_target_plan(plan)
+
+        return plan
+
+    def print_blend_shape_targets_plan(self):
+        self.blend_shape_add_targets(dry_run=True)
+
+    def connect_blend_shapes_control(self, dry_run=False):
         """
         There is one blendShape node for each geo element of the head ex. head, eyes, eyelashes etc...
         All geo elements blendShape node has a corresponding
         Connects targets on head blendShape node to corresponding targets in all other geometry elements
+        Poses are matched to targets by name tokens, see tpBlendShapeData.plan_pose_target_connections,
+        and every connection is made in one batch.
 
-        :return:
+        :param dry_run: only print and return the connection plan
+        :return connection_list: [(head target plug, element target plug)]
         """
         blendshape_geo_grp = 'blend_shape_template_geo_grp'
         blendshape_geo_grp_children = cmds.listRelatives(blendshape_geo_grp, children=True)
@@ -198,65 +235,39 @@ class Utilities(tpProject.Project):
         # declaring information about the output model geo
         # the one receiving blendShapes
         model_geo = 'head_model_geo'
-        model_geo_name_list = model_geo.split('_')
         model_geo_grp = 'head_model_geo_grp'
         model_geo_grp_children = cmds.listRelatives(model_geo_grp, children=True)
 
         main_blendshape_node = 'head_model_blendShape_node'
-        main_blendshape_weight_list = cmds.blendShape(main_blendshape_node, q=True, weight=True)
-        main_blendshape_target_name_list = [cmds.aliasAttr('{}.w[{}]'.format(main_blendshape_node, weight), q=True)
-                                            for weight in range(len(main_blendshape_weight_list))]
-        main_blnd_relationship_dict = {}
-
-        # looping through pose names to find a match in head geo blendShape targets
-        for pose_name in pose_name_list:
-            # the name of the target is composed of the pose + geo name
-            # splitting both pose name and geo name and suming into single list
-            pose_name_split_list = pose_name.split('_')
-            all_names_list = pose_name_split_list + model_geo_name_list
-
-            # Looping through head geo targets
-            for main_target_name in main_blendshape_target_name_list:
-                if pose_name in main_target_name:
-                    # splitting current target name
-                    main_target_name_list = main_target_name.split('_')
-
-                    # removing all names that match on the target name
-                    # getting either an empty list, or a list with names left
-                    for name in all_names_list:
-                        if name in main_target_name_list:
-                            main_target_name_list.remove(name)
-
-                    # if there is nothing left on the list, the names match
-                    # target gets added to dict
-                    if not main_target_name_list:
-                        main_blnd_relationship_dict.update({pose_name: main_target_name})
 
+        element_node_dict = {}
         for model_geo_element in model_geo_grp_children:
-            if model_geo_element != model_geo:
-                element_name_list = model_geo_element.split('_')
-                element_history_list = cmds.listHistory(model_geo_element)
-
-                blendshape_node = cmds.ls(element_history_list, type='blendShape')[0]
-                blendshape_weight_list = cmds.blendShape(blendshape_node, q=True, weight=True)
-                blendshape_target_name_list = [cmds.aliasAttr('{}.w[{}]'.format(blendshape_node, weight), q=True)
-                                               for weight in range(len(blendshape_weight_list))]
-
-                for pose_name in pose_name_list:
-                    pose_name_split_list = pose_name.split('_')
-                    for target_name in blendshape_target_name_list:
-                        target_name_list = target_name.split('_')
-                        all_names_list = pose_name_split_list + element_name_list
-
-                        if pose_name in target_name:
-                            for name in all_names_list:
-                                if name in target_name_list:
-                                    target_name_list.remove(name)
-
-                            if not target_name_list:
-                                cmds.connectAttr('{}.{}'.format(main_blendshape_node,
-                                                                main_blnd_relationship_dict[pose_name]),
-                                               '{}.{}'.format(blendshape_node, target_name), force=True)
+            if model_geo_element == model_geo:
+                continue
+
+            blendshape_node = tpBlendShapeData.get_blend_shape_node(model_geo_element)
+            if blendshape_node:
+                element_node_dict[model_geo_element] = blendshape_node
+            else:
+                print('[Connect BlendShape Controls] {} has no blendShape'.format(model_geo_element))
+
+        connection_list, unmatched_dict = tpBlendShapeData.plan_pose_target_connections(
+            pose_name_list, main_blendshape_node, model_geo, element_node_dict)
+
+        for geometry, unmatched_pose_list in sorted(unmatched_dict.items()):
+            if unmatched_pose_list:
+                print('[Connect BlendShape Controls] {} has no target for {}'.format(geometry, unmatched_pose_list))
+
+        if dry_run:
+            for source_plug, destination_plug in connection_list:
+                print('[Connect BlendShape Controls] {} -> {}'.format(source_plug, destination_plug))
+        else:
+            tpBlendShapeData.connect_attribute_pairs(connection_list)
+
+        return connection_list
+
+    def print_blend_shape_connections_plan(self):
+        self.connect_blend_shapes_control(dry_run=True)
 
     def connect_eye_shapes_to_controls(self):
         """
@@ -337,16 +348,19 @@ class Utilities(tpProject.Project):
     def om_export_skin_weights(self,
                                geo_list=None,
                                dir_path=None,
-                               file_name=None):
+                               file_name=None,
+                               quantize=False):
         """
         Open Maya method to export skin cluster weights from geometry list.
         If no list is provided, selection will be used to query the list.
         if no dir_path id provided, the method will prompt the user with a dialog to specify the path.
+        Writes one file per geometry plus a manifest, see tpSkinWeights.export_influence_weights.
 
         :param geo_list:
         :param dir_path:
         :param file_name:
-        :return:
+        :param quantize: uint16 fixed-point weights, smaller files within tpSkinWeights.QUANTIZATION_ERROR_BUDGET
+        :return manifest_path:
         """
         # skinCluster node name
         if not geo_list:
@@ -364,76 +378,24 @@ class Utilities(tpProject.Project):
             file_name = file_name_and_extension.split('.')[0]
             dir_path = file_path.replace(file_name_and_extension, '')
 
-        skin_data = {}
-
-        for geometry in geo_list:
-            skin_cluster_node = mel.eval('findRelatedSkinCluster "{}"'.format(geometry))
+        return tpSkinWeights.export_influence_weights(geo_list, dir_path, file_name, quantize=quantize)
 
-            if not skin_cluster_node:
-                continue
-
-            # defining the data dictionary
-            data = {
-                'weights': {},
-                'blendWeights': [],
-                'name': skin_cluster_node,
-            }
-
-            # get skinCluster MObject
-            selection_list = OpenMaya.MSelectionList()
-            selection_list.add(skin_cluster_node)
-            m_object = OpenMaya.MObject()
-            selection_list.getDependNode(0, m_object)
-            fn_skin_cluster = OpenMayaAnim.MFnSkinCluster(m_object)
-
-            # get dagPath and member components of skinned shape
-            fn_set = OpenMaya.MFnSet(fn_skin_cluster.deformerSet())
-            members = OpenMaya.MSelectionList()
-            fn_set.getMembers(members, False)
-            dag_path = OpenMaya.MDagPath()
-            components = OpenMaya.MObject()
-            members.getDagPath(0, dag_path, components)
-
-            # get current skinCluster weights
-            weights = OpenMaya.MDoubleArray()
-            util = OpenMaya.MScriptUtil()
-            util.createFromInt(0)
-            p_u_int = util.asUintPtr()
-            fn_skin_cluster.getWeights(dag_path, components, weights, p_u_int)
-
-            # assemble final dictionary to export
-            influence_paths = OpenMaya.MDagPathArray()
-            num_influences = fn_skin_cluster.influenceObjects(influence_paths)
-            num_components_per_influence = weights.length() / num_influences
-
-            for ii in range(influence_paths.length()):
-                influence_name = influence_paths[ii].partialPathName()
-
-                data['weights'][influence_name] = \
-                    [weights[jj * num_influences + ii] for jj in range(num_components_per_influence)]
-
-            # add blend weights to dictionary
-            blend_weights = OpenMaya.MDoubleArray()
-            fn_skin_cluster.getBlendWeights(dag_path, components, blend_weights)
-            data['blendWeights'] = [blend_weights[i] for i in range(blend_weights.length())]
-
-            skin_data.update({geometry: data})
-
-        tpUtils.export_dict_as_json(skin_data, file_name, dir_path)
-
-    def om_import_skin_weights(self, dir_path=None, file_name=None):
+    def om_import_skin_weights(self, dir_path=None, file_name=None, bind_from_data=True):
         """
         Open Maya Method.
         General import skin weights method.
         If no directory and file name is provided, the script will prompt the user with a file dialog.
+        file_name is resolved through its export manifest, see tpSkinWeights.list_export_files,
+        a manifest picked in the dialog is expanded to the files it lists.
 
         :param dir_path:
         :param file_name:
-        :return:
+        :param bind_from_data: see om_import_skin_weights_data
+        :return import_report_list: one tpSkinWeights.import_influence_weights report per geometry
         """
 
         if dir_path and file_name:
-            import_path_file = '{}{}.json'.format(dir_path, file_name)
+            import_path_file_list = tpSkinWeights.list_export_files(dir_path, file_name)
 
         else:
             # pop up file dialog and prompt user
@@ -449,79 +411,56 @@ class Utilities(tpProject.Project):
                 print('[OM Import Skin Weights] No file was selected')
                 return
 
-            import_path_file = import_path_file_list[0]
+            if import_path_file_list[0].endswith(tpSkinWeights.MANIFEST_SUFFIX):
+                import_path_file_list = tpSkinWeights.read_manifest_file_list(import_path_file_list[0])
 
-        # defining the data dictionary
-        skin_weights_file_data = tpUtils.read_json_file(import_path_file)
+        # files are decoded on background threads while the previous one is applied
+        import_report_list = []
+        for import_path_file, skin_weights_file_data in tpSkinWeights.iter_decoded_files(import_path_file_list):
+            import_report_list.extend(self.om_import_skin_weights_data(skin_weights_file_data, bind_from_data))
+
+        return import_report_list
+
+    def om_import_skin_weights_data(self, skin_weights_file_data, bind_from_data=True):
+        """
+        Applies decoded skin weights data (see tpSkinWeights.read_influence_weights_file).
+        Creates the skinCluster on each geometry and imports its weights.
+
+        :param skin_weights_file_data:
+        :param bind_from_data: bind on the first influence and write the stored weights once,
+                               False lets Maya solve bind weights before they are overwritten
+        :return import_report_list: one tpSkinWeights.import_influence_weights report per geometry
+        """
+        import_report_list = []
 
         for geo_name in skin_weights_file_data:
             geo_skin_data = skin_weights_file_data[geo_name]
-            node = geo_skin_data['name']
-            joints = geo_skin_data['weights'].keys()
-            cmds.skinCluster(joints,
-                             geo_name,
-                             toSelectedBones=True,
-                             normalizeWeights=2,  # interactive
-                             name=geo_skin_data['name'])
-
-            # get skinCluster MObject
-            selection_list = OpenMaya.MSelectionList()
-            selection_list.add(node)
-            m_object = OpenMaya.MObject()
-            selection_list.getDependNode(0, m_object)
-            fn = OpenMayaAnim.MFnSkinCluster(m_object)
-
-            # get geometry components
-            fn_set = OpenMaya.MFnSet(fn.deformerSet())
-            members = OpenMaya.MSelectionList()
-            fn_set.getMembers(members, False)
-            dag_path = OpenMaya.MDagPath()
-            components = OpenMaya.MObject()
-            members.getDagPath(0, dag_path, components)
-
-            # get current weights
-            weights = OpenMaya.MDoubleArray()
-            util = OpenMaya.MScriptUtil()
-            util.createFromInt(0)
-            p_u_int = util.asUintPtr()
-            fn.getWeights(dag_path, components, weights, p_u_int)
-
-            influence_paths = OpenMaya.MDagPathArray()
-            num_influences = fn.influenceObjects(influence_paths)
-            num_components_per_influence = weights.length() / num_influences
-
-            # Keep track of which imported influences aren't used
-            unused_imports = []
-
-            # Keep track of which existing influences don't get anything imported
-            no_match = [influence_paths[ii].partialPathName() for ii in range(influence_paths.length())]
-
-            for imported_influence, imported_weights in geo_skin_data['weights'].items():
-                for joint_index in range(influence_paths.length()):
-                    influence_name = influence_paths[joint_index].partialPathName()
-
-                    if influence_name == imported_influence:
-                        # Store the imported weights into the MDoubleArray
-                        for jj in range(num_components_per_influence):
-                            weights.set(imported_weights[jj], jj * num_influences + joint_index)
-                        no_match.remove(influence_name)
-                        break
-                    else:
-                        unused_imports.append(imported_influence)
-
-            influence_indices = OpenMaya.MIntArray(num_influences)
-
-            for influence_index in range(num_influences):
-                influence_indices.set(influence_index, influence_index)
-
-            fn.setWeights(dag_path, components, influence_indices, weights, False)
-
-            # import blend weights
-            blend_weights = OpenMaya.MDoubleArray(len(skin_weights_file_data[geo_name]['blendWeights']))
-            for i, w in enumerate(skin_weights_file_data[geo_name]['blendWeights']):
-                blend_weights.set(w, i)
-
-            fn.setBlendWeights(dag_path, components, blend_weights)
+
+            if bind_from_data:
+                import_report = tpSkinWeights.bind_influence_weights(geo_name,
+                                                                     geo_skin_data['weights'],
+                                                                     geo_skin_data['blendWeights'],
+                                                                     name=geo_skin_data['name'],
+                                                                     normalizeWeights=2)  # interactive
+            else:
+                node = geo_skin_data['name']
+                joints = geo_skin_data['weights'].keys()
+                cmds.skinCluster(joints,
+                                 geo_name,
+                                 toSelectedBones=True,
+                                 normalizeWeights=2,  # interactive
+                                 name=geo_skin_data['name'])
+
+                import_report = tpSkinWeights.import_influence_weights(node,
+                                                                       geo_skin_data['weights'],
+                                                                       geo_skin_data['blendWeights'])
+            import_report_list.append(import_report)
+
+            if import_report['unmatched_influences']:
+                print('[OM Import Skin Weights] {} - Influences not in skinCluster: {}'.format(
+                    geo_name, import_report['unmatched_influences']))
+
+        return import_report_list
 
     def create_fk_controls(self):
         """
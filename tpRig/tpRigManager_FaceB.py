@@ -2,7 +2,6 @@ import os
 import glob
 
 import maya.cmds as cmds
-import math
 
 import maya.cmds as mc
 import maya.mel as mel
@@ -16,6 +15,10 @@ import tpRig.tpFaceRig.tpMouth.tpMouthOutput as tpMouthOutput
 
 import tpRig.tpRigUtils as tpUtils
 reload(tpUtils)
+import tpRig.tpSkinWeights as tpSkinWeights
+reload(tpSkinWeights)
+import tpRig.tpMeshData as tpMeshData
+reload(tpMeshData)
 import tpRig.tpControl.tpControl as tpCtrl
 reload(tpCtrl)
 
@@ -321,37 +324,27 @@ class tpRig(tpUtilities.Utilities):
         skin_manager.import_weights_from_file()
 
     def _om_import_model_geo_skin_weights(self):
-        dir_path = self.project_dir_dict['skin_clusters_model']
-        file_list = glob.glob('{dir}/*.json'.format(dir=dir_path))
-
-        for file in file_list:
-            norm_path = os.path.normpath(file)
-            file_name_and_extension = norm_path.split("\\")[-1]
-            file_name = file_name_and_extension.split('.')[0]
-
-            self.om_import_skin_weights(dir_path=dir_path, file_name=file_name)
+        self._om_import_skin_weights_dir(self.project_dir_dict['skin_clusters_model'])
 
     def _om_import_template_geo_skin_weights(self):
-        dir_path = self.project_dir_dict['skin_clusters_template']
-        file_list = glob.glob('{dir}/*.json'.format(dir=dir_path))
-
-        for file in file_list:
-            norm_path = os.path.normpath(file)
-            file_name_and_extension = norm_path.split("\\")[-1]
-            file_name = file_name_and_extension.split('.')[0]
-
-            self.om_import_skin_weights(dir_path=dir_path, file_name=file_name)
+        self._om_import_skin_weights_dir(self.project_dir_dict['skin_clusters_template'])
 
     def _om_import_system_geo_skin_weights(self):
-        dir_path = self.project_dir_dict['skin_clusters_system']
-        file_list = glob.glob('{dir}/*.json'.format(dir=dir_path))
+        self._om_import_skin_weights_dir(self.project_dir_dict['skin_clusters_system'])
 
-        for file in file_list:
-            norm_path = os.path.normpath(file)
-            file_name_and_extension = norm_path.split("\\")[-1]
-            file_name = file_name_and_extension.split('.')[0]
+    def _om_import_skin_weights_dir(self, dir_path):
+        """
+        Imports every skin weights file in dir_path.
+        The next files are decoded and validated on background threads
+        while the current one is applied to its skinCluster.
+        :param dir_path:
+        :return:
+        """
+        file_list = tpSkinWeights.list_skin_weights_files(dir_path)
 
-            self.om_import_skin_weights(dir_path=dir_path, file_name=file_name)
+        for file_path, skin_weights_file_data in tpSkinWeights.iter_decoded_files(file_list):
+            self.om_import_skin_weights_data(skin_weights_file_data)
+            print('[OM Import Skin Weights] {}'.format(os.path.basename(file_path)))
 
     def _camera_fit_view(self):
         mc.select(clear=True)
@@ -766,50 +759,30 @@ def find_closest_vertex(reference_vertex, vertex_list):
     Finds closest vertex to reference vertex in provided list
 
     :reference_vertex: vertex to be compared to all vertex in provided list
-    :vertex_list: list to compare with reference_vertex
+    :vertex_list: list to compare with reference_vertex, vertices of a single mesh
 
     :return: vertex with smallest distance from reference_vertex from provided vertex_list
     """
-
-    vertex_distance_dict = {}
     # get reference vertex position
     ref_vert_pos = cmds.xform(reference_vertex, query=True, translation=True, worldSpace=True)
 
-    for vertex in vertex_list:
-        # gets the position of correct vertex in list
-        position = cmds.xform(vertex, query=True, translation=True, worldSpace=True)
-        # finds euclidean distance between the two points
-        distance = math.sqrt((ref_vert_pos[0] - position[0]) ** 2 + (ref_vert_pos[1] - position[1]) ** 2 + (
-                    ref_vert_pos[2] - position[2]) ** 2)
-
-        # updates dictionary with information
-        vertex_distance_dict.update({distance: vertex})
-
-    # finds smallest value on listed distances
-    closest_distance = min(vertex_distance_dict.keys())
+    # one query of the grid over the listed vertices, cached per mesh pose
+    closest_vertex_id = tpMeshData.get_closest_component_vertex_ids(vertex_list, [ref_vert_pos])[1][0]
 
-    return vertex_distance_dict[closest_distance]
+    return '{}.vtx[{}]'.format(vertex_list[0].split('.')[0], closest_vertex_id)
 
 
 def weights_from_list_b_to_a_closest(list_a, list_b):
     """
-    Loops through all vertices in list A, finds the closest vertex in list B
+    For all vertices in list A, finds the closest vertex in list B
     and copies the weights from B to A.
-
-    Both vertex list must be in the same mesh.
+    Runs as one batched closest point query and a single skin weights write,
+    see tpSkinWeights.transfer_closest_vertex_weights.
 
     :list_a: List of vertices to get new skin weights
     :list_b: List of vertices to provide the skinning information
     """
-
-    for vertex in list_a:
-        closest_in_b = find_closest_vertex(vertex, list_b)
-
-        cmds.select(closest_in_b, r=True)
-        mel.eval('artAttrSkinWeightCopy')
-
-        cmds.select(vertex, r=True)
-        mel.eval('artAttrSkinWeightPaste')
+    tpSkinWeights.transfer_closest_vertex_weights(list_a, list_b)
 
     print("[Copy Skin Weights From List A to B] Process Completed - Success")
 
@@ -821,41 +794,17 @@ def weights_from_list_b_to_a_closest(list_a, list_b):
 
 
 def add_unexisting_influences_a_to_b(vert_list_a, vert_list_b):
-    influence_list_b = []
-    for vertex in vert_list_b:
-        skincluster = mel.eval('findRelatedSkinCluster {};'.format(vertex.split('.')[0]))
-        influence_query_list = cmds.skinPercent(skincluster, vertex, query=True, transform=None)
-
-        for influence in influence_query_list:
-            if influence not in influence_list_b:
-                influence_list_b.append(influence)
-
-    influence_list_a = []
-    for vertex in vert_list_a:
-        skincluster = mel.eval('findRelatedSkinCluster {};'.format(vertex.split('.')[0]))
-        influence_query_list = cmds.skinPercent(skincluster, vertex, query=True, transform=None)
-
-        for influence in influence_query_list:
-            if influence not in influence_list_a:
-                influence_list_a.append(influence)
-
-    unexisting_influences = [influence for influence in influence_list_a if influence not in influence_list_b]
+    """
+    Adds to the skinCluster of list B every influence weighting list A
+    that it does not have yet, see tpSkinWeights.sync_component_influences.
 
+    :vert_list_a: List of vertices providing the influences
+    :vert_list_b: List of vertices of the mesh receiving the influences
+    """
     print(
         "[add_unexisting_influences_a_to_b] Adding Unexistent Influences to '{}'".format(vert_list_b[0].split('.')[0]))
 
-    b_skin_cluster = mel.eval('findRelatedSkinCluster {};'.format(vert_list_b[0].split('.')[0]))
-    for influence in unexisting_influences:
-        cmds.skinCluster(
-            b_skin_cluster,
-            edit=True,
-            useGeometry=True,
-            dropoffRate=4,
-            polySmoothness=0,
-            nurbsSamples=10,
-            lockWeights=True,
-            weight=0,
-            addInfluence=influence)
+    unexisting_influences = tpSkinWeights.sync_component_influences(vert_list_b, vert_list_a)
 
     print("[add_unexisting_influences_a_to_b] Process Successful")
 
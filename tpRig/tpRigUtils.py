@@ -5,6 +5,12 @@ import maya.api.OpenMaya as om2
 
 import glob
 import json
+import os
+
+import numpy as np
+
+import tpRig.tpSkinWeights as tpSkinWeights
+import tpRig.tpBlendShapeData as tpBlendShapeData
 
 
 # GENERAL TOOLS
@@ -138,47 +144,41 @@ def create_follicle(input_surface, scale_grp='', u_val=0.5, v_val=0.5, hide=0, n
     return follicle
 
 
+def get_geo_vertex_weight_matrix(skin_cluster, threshold_value=0.001):
+    """
+    Reads the skin weights of every vertex with a single MFnSkinCluster.getWeights call.
+    Weights below threshold_value are zeroed, same as skinPercent ignoreBelow.
+
+    :param skin_cluster:
+    :param threshold_value:
+    :return (weight_matrix, influence_list): weight_matrix shape is (vertex_count, influence_count)
+    """
+    weight_matrix, influence_list = tpSkinWeights.get_weight_matrix(skin_cluster)
+    weight_matrix[weight_matrix < threshold_value] = 0.0
+
+    return weight_matrix, influence_list
+
+
 def get_geo_vertex_weights(geo_name, skin_cluster, threshold_value=0.001):
     """
     Gets the skin percentage in each vertex of the mesh and
     returns in a dictionary.
+    Dictionary view over get_geo_vertex_weight_matrix, kept for callers
+    that expect {'mesh.vtx[N]': [(influence, weight), ...]}.
 
     :param geo_name:
     :param skin_cluster:
     :param threshold_value:
     :return:
     """
-    # remember to filterExpand list before passing it in
-    vertex_dict = {}
+    weight_matrix, influence_list = get_geo_vertex_weight_matrix(skin_cluster, threshold_value)
 
-    vertex_count = mc.polyEvaluate(geo_name, vertex=True)
-    vertex_list = ['{}.vtx[{}]'.format(geo_name, vertex_id) for vertex_id in range(vertex_count)]
-
-    for vertex in vertex_list:
-        influence_value_list = mc.skinPercent(
-            skin_cluster,
-            vertex,
-            query=True,
-            value=True,
-            ignoreBelow=threshold_value
-        )
-
-        influence_name_list = mc.skinPercent(
-            skin_cluster,
-            vertex,
-            transform=None,
-            query=True,
-            ignoreBelow=threshold_value
-        )
-
-        vertex_dict[vertex] = zip(influence_name_list, influence_value_list)
-
-    return vertex_dict
+    return tpSkinWeights.weight_matrix_to_vertex_dict(geo_name, weight_matrix, influence_list)
 
 
 class SkinWeightsManager:
 
-    def __init__(self, dir_path, geo_list):
+    def __init__(self, dir_path, geo_list, bind_from_data=True):
         """
         data structure
         {mesh:
@@ -186,30 +186,57 @@ class SkinWeightsManager:
             influence_list: ['joint1', 'joint2', ...],
             vertex_influence_dict: {influence(joint): weight, ...}
 
+        Files are read by extension, '.json' for the legacy dictionary
+        and '.npz' for the sparse CSR format (see tpSkinWeights).
+
+        Missing skinClusters are created with tpSkinWeights.bind_skin_cluster when
+        bind_from_data is on, skipping the bind weights solve the import overwrites.
+
         :param dir_path:
         :param geo_list:
+        :param bind_from_data:
         """
         self.dir_path = dir_path
         self.geo_list = geo_list
+        self.bind_from_data = bind_from_data
         self.file_name = None
 
         self.file_list_in_path = None
 
+        self.reader_dict = {
+            '.json': read_json_file,
+            tpSkinWeights.SPARSE_EXTENSION: tpSkinWeights.read_sparse_skin_weights
+        }
+
     def import_weights_from_file(self):
-        self.file_list_in_path = glob.glob('{dir}/*.json'.format(dir=self.dir_path))
+        self.file_list_in_path = [file_path for file_path in sorted(glob.glob('{dir}/*'.format(dir=self.dir_path)))
+                                  if os.path.splitext(file_path)[1] in self.reader_dict
+                                  and not file_path.endswith(tpSkinWeights.MANIFEST_SUFFIX)]
 
         # iterate through all skin_weights file in directory
         for file in self.file_list_in_path:
-            skin_data_dict = read_json_file(file)
+            skin_data_dict = self.reader_dict[os.path.splitext(file)[1]](file)
 
             # in the file - go through the data for each mesh
             for mesh_name in skin_data_dict:
                 skin_cluster_name = skin_data_dict[mesh_name]['skin_cluster_name']
                 influence_list = skin_data_dict[mesh_name]['influence_list']
-                vertex_weights = skin_data_dict[mesh_name]['vertex_weights']
+
+                # bind from data - a full matrix is written by the bind itself
+                if not mc.objExists(skin_cluster_name) and self.bind_from_data:
+                    tpSkinWeights.bind_skin_cluster(mesh_name,
+                                                    influence_list,
+                                                    skin_data_dict[mesh_name].get('weight_matrix'),
+                                                    skin_data_dict[mesh_name].get('blend_weights'),
+                                                    name=skin_cluster_name,
+                                                    skinMethod=0,
+                                                    normalizeWeights=1)
+
+                    if 'weight_matrix' in skin_data_dict[mesh_name]:
+                        continue
 
                 # bind influences to mesh
-                if not mc.objExists(skin_cluster_name):
+                elif not mc.objExists(skin_cluster_name):
                     mc.skinCluster(influence_list,
                                    mesh_name,
                                    name=skin_cluster_name,
@@ -218,11 +245,31 @@ class SkinWeightsManager:
                                    skinMethod=0,
                                    normalizeWeights=1)
 
-                set_skin_percentage_from_data(skin_cluster_name, vertex_weights)
+                if 'weight_matrix' in skin_data_dict[mesh_name]:
+                    set_skin_weight_matrix_from_data(skin_cluster_name,
+                                                     skin_data_dict[mesh_name]['weight_matrix'],
+                                                     influence_list)
+                    tpSkinWeights.set_blend_weights(skin_cluster_name, skin_data_dict[mesh_name]['blend_weights'])
+                else:
+                    set_skin_percentage_from_data(skin_cluster_name, skin_data_dict[mesh_name]['vertex_weights'])
 
-    def export_selection_skin_weights(self, file_name):
+    def export_selection_skin_weights(self, file_name, file_format='json', quantize=False):
+        """
+        Exports skin weights for every geo in geo_list.
+        :param file_name:
+        :param file_format: 'json' (legacy dictionary) or 'npz' (sparse CSR arrays + JSON manifest)
+        :param quantize: npz only, uint16 fixed-point weights (see tpSkinWeights.quantize_weight_matrix)
+        :return:
+        """
         self.file_name = file_name
 
+        if file_format == 'npz':
+            self._export_selection_sparse_skin_weights(quantize)
+            return
+
+        if quantize:
+            raise RuntimeError('Quantized skin weights are only written in the npz format')
+
         # declare main dictionary
         output_dictionary = {}
 
@@ -244,6 +291,26 @@ class SkinWeightsManager:
         # do function export
         export_dict_as_json(output_dictionary, self.file_name, self.dir_path)
 
+    def _export_selection_sparse_skin_weights(self, quantize=False):
+        skin_data_list = []
+
+        for geo in self.geo_list:
+            skin_cluster = mel.eval('findRelatedSkinCluster "{}"'.format(geo))
+            weight_matrix, influence_list = tpSkinWeights.get_weight_matrix(skin_cluster)
+
+            skin_data_list.append({
+                'mesh': geo,
+                'skin_cluster_name': skin_cluster,
+                'influence_list': influence_list,
+                'weight_matrix': weight_matrix,
+                'blend_weights': tpSkinWeights.get_blend_weights(skin_cluster)
+            })
+
+        tpSkinWeights.export_sparse_skin_weights(
+            skin_data_list,
+            '{dir}{file}{ext}'.format(dir=self.dir_path, file=self.file_name, ext=tpSkinWeights.SPARSE_EXTENSION),
+            quantize=quantize)
+
 
 def export_selected_geo_weights(data_dict, file_path):
 
@@ -263,20 +330,31 @@ def set_skin_percentage_from_data(skin_cluster_name, vertex_influence_weight_dic
     """
     Import skin_cluster to individual geo pieces.
     skin_cluster must exist already.
+    Builds the weight matrix in memory and writes it with a single setWeights call.
 
     :param skin_cluster_name:
     :param vertex_influence_weight_dict:
     :return:
     """
+    vertex_ids, row_matrix, influence_list = tpSkinWeights.vertex_dict_to_rows(vertex_influence_weight_dict)
+    tpSkinWeights.set_weight_rows(skin_cluster_name, vertex_ids, row_matrix, influence_list)
 
-    for vertex in vertex_influence_weight_dict:
+    print('[Set Skin Weights] {} - {} vertices done'.format(skin_cluster_name, len(vertex_ids)))
 
-        mc.skinPercent(skin_cluster_name,
-                       vertex,
-                       transformValue=vertex_influence_weight_dict[vertex],
-                       zeroRemainingInfluences=True)
 
-        print('Done with {}'.format(vertex))
+def set_skin_weight_matrix_from_data(skin_cluster_name, weight_matrix, influence_list):
+    """
+    Same as set_skin_percentage_from_data, for a full (vertex_count, influence_count) matrix.
+
+    :param skin_cluster_name:
+    :param weight_matrix: columns follow influence_list
+    :param influence_list:
+    :return:
+    """
+    vertex_ids = np.arange(weight_matrix.shape[0])
+    tpSkinWeights.set_weight_rows(skin_cluster_name, vertex_ids, weight_matrix, influence_list)
+
+    print('[Set Skin Weights] {} - {} vertices done'.format(skin_cluster_name, len(vertex_ids)))
 
 
 def read_json_file(file_path):
@@ -378,7 +456,28 @@ def surface_from_position_list(position_list, scale=1, reverse=False, normal=(1,
     return loft_surface
 
 
-def extract_blend_shape_targets(blend_shape_node, adjustment_targets, model_geometry):
+def extract_blend_shape_targets(blend_shape_node, adjustment_targets, model_geometry, from_deltas=False):
+    """
+    Extracts every target but the adjustment ones as a mesh, parented under a new shapes_grp.
+    By default each target is activated and the evaluated model geometry duplicated,
+    from_deltas rebuilds the meshes from the stored deltas without evaluating the rig,
+    copying the topology and uvs of model_geometry, see tpBlendShapeData.extract_targets_from_deltas.
+
+    :param blend_shape_node:
+    :param adjustment_targets: targets left at their current weight
+    :param model_geometry:
+    :param from_deltas:
+    :return shapes_list: [[mesh], ...] one list per target, like mc.duplicate returns
+    """
+    if from_deltas:
+        mesh_list = tpBlendShapeData.extract_targets_from_deltas(blend_shape_node,
+                                                                 adjustment_target_list=adjustment_targets,
+                                                                 include_inbetweens=False,
+                                                                 group_name='shapes_grp',
+                                                                 model_geometry=model_geometry)
+
+        return [mc.ls(mesh) for mesh in mesh_list]
+
     # create shapes group
     group = mc.group(name='shapes_grp', empty=True)
     shapes_list = []
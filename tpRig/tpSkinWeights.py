@@ -1,104 +1,1800 @@
+import os
+import glob
+import json
+import collections
+from multiprocessing.pool import ThreadPool
+
 import maya.cmds as cmds
+import maya.mel as mel
+import maya.api.OpenMaya as om2
+import maya.api.OpenMayaAnim as om2Anim
+
+import numpy as np
+
+import tpRig.tpMeshData as tpMeshData
+import tpRig.tpSpatialIndex as tpSpatialIndex
+import tpRig.tpNameConvention as tpName
+
+
+SPARSE_FORMAT_VERSION = 1
+PER_MESH_FORMAT_VERSION = 1
+VERSIONED_FORMAT_VERSION = 1
+SPARSE_EXTENSION = '.npz'
+
+# quantized weights are stored as round(weight * QUANTIZATION_SCALE) in uint16
+QUANTIZATION_SCALE = 65535
+# largest absolute weight error a quantized file may carry, checked on export and on load
+QUANTIZATION_ERROR_BUDGET = 1e-4
+MANIFEST_SUFFIX = '.manifest.json'
+VERSIONS_SUFFIX = '.versions.json'
+
+# weights closer than this to the last version are not stored again
+VERSION_TOLERANCE = 1e-6
+
+# vertex ids listed per lint check, the counts cover every vertex
+LINT_SAMPLE_SIZE = 20
+LINT_REPORT_FILE_NAME = 'skin_weights_lint.json'
+
+# chains whose latest state is kept in memory, least recently used dropped first
+VERSION_STATE_CACHE_SIZE = 16
+
+# {chain_path: (last_version_file, weight_matrix, influence_list, blend_weights)}
+_version_state_cache = collections.OrderedDict()
+
+
+# SKIN CLUSTER ACCESS
+
+def get_skin_cluster(geometry):
+    """
+    Returns the skinCluster deforming geometry, or an empty string.
+    :param geometry:
+    :return skin_cluster:
+    """
+    return mel.eval('findRelatedSkinCluster "{}"'.format(geometry))
+
+
+def get_skin_cluster_fn(skin_cluster):
+    """
+    Returns the MFnSkinCluster, the deformed shape dag path and a complete
+    vertex component covering every vertex of the shape.
+    Open Maya 2 function
+    :param skin_cluster:
+    :return (fn_skin_cluster, dag_path, components):
+    """
+    selection_list = om2.MSelectionList()
+    selection_list.add(skin_cluster)
+    fn_skin_cluster = om2Anim.MFnSkinCluster(selection_list.getDependNode(0))
+
+    dag_path = fn_skin_cluster.getPathAtIndex(0)
+    vertex_count = om2.MFnMesh(dag_path).numVertices
+
+    fn_component = om2.MFnSingleIndexedComponent()
+    components = fn_component.create(om2.MFn.kMeshVertComponent)
+    fn_component.setCompleteData(vertex_count)
+
+    return fn_skin_cluster, dag_path, components
+
+
+def get_influence_list(skin_cluster):
+    """
+    Returns influence names in skinCluster index order.
+    :param skin_cluster:
+    :return influence_list:
+    """
+    fn_skin_cluster = get_skin_cluster_fn(skin_cluster)[0]
+
+    return [path.partialPathName() for path in fn_skin_cluster.influenceObjects()]
+
+
+def get_weight_matrix(skin_cluster):
+    """
+    Reads all skin weights with a single getWeights call.
+    :param skin_cluster:
+    :return (weight_matrix, influence_list): weight_matrix shape is (vertex_count, influence_count)
+    """
+    fn_skin_cluster, dag_path, components = get_skin_cluster_fn(skin_cluster)
+    weights, influence_count = fn_skin_cluster.getWeights(dag_path, components)
+    influence_list = [path.partialPathName() for path in fn_skin_cluster.influenceObjects()]
+
+    weight_matrix = np.array(weights, dtype=np.float64).reshape(-1, influence_count)
+
+    return weight_matrix, influence_list
+
+
+def get_blend_weights(skin_cluster):
+    """
+    Returns the dual quaternion blend weights as a float array, one value per vertex.
+    :param skin_cluster:
+    :return blend_weights:
+    """
+    fn_skin_cluster, dag_path, components = get_skin_cluster_fn(skin_cluster)
+
+    return np.array(fn_skin_cluster.getBlendWeights(dag_path, components), dtype=np.float64)
+
+
+def set_blend_weights(skin_cluster, blend_weights):
+    """
+    Writes the dual quaternion blend weights with a single setBlendWeights call.
+    :param skin_cluster:
+    :param blend_weights: one value per vertex
+    :return:
+    """
+    fn_skin_cluster, dag_path, components = get_skin_cluster_fn(skin_cluster)
+    fn_skin_cluster.setBlendWeights(dag_path, components, om2.MDoubleArray(np.asarray(blend_weights).tolist()))
+
+
+def set_weight_matrix(skin_cluster, weight_matrix, normalize=False):
+    """
+    Writes a full (vertex_count, influence_count) matrix with a single setWeights call.
+    Columns must follow the skinCluster influence order.
+
+    :param skin_cluster:
+    :param weight_matrix:
+    :param normalize: let Maya normalize, leave False when the matrix was normalized with normalize_weight_matrix
+    :return:
+    """
+    fn_skin_cluster, dag_path, components = get_skin_cluster_fn(skin_cluster)
+    weight_matrix = np.asarray(weight_matrix, dtype=np.float64)
+
+    influence_indices = om2.MIntArray(list(range(weight_matrix.shape[1])))
+    weights = om2.MDoubleArray(weight_matrix.ravel().tolist())
+
+    fn_skin_cluster.setWeights(dag_path, components, influence_indices, weights, normalize, False)
+
+
+def set_weight_rows(skin_cluster, vertex_ids, row_matrix, influence_list):
+    """
+    Import engine - replaces the weights of vertex_ids and writes the whole mesh back once.
+    Rows are normalized in NumPy, vertices not listed keep their current weights.
+
+    :param skin_cluster:
+    :param vertex_ids: (row_count,) vertex indices
+    :param row_matrix: (row_count, len(influence_list)) weights
+    :param influence_list: influence name of each row_matrix column
+    :return weight_matrix: the matrix written to the skinCluster
+    """
+    weight_matrix, scene_influence_list = get_weight_matrix(skin_cluster)
+    column_dict = dict((influence, column) for column, influence in enumerate(scene_influence_list))
+
+    missing_influence_list = [influence for influence in influence_list if influence not in column_dict]
+    if missing_influence_list:
+        raise RuntimeError('Influences not found in {}: {}'.format(skin_cluster, missing_influence_list))
+
+    columns = np.array([column_dict[influence] for influence in influence_list], dtype=np.int64)
+    vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+
+    weight_matrix[vertex_ids] = 0.0
+    weight_matrix[vertex_ids[:, np.newaxis], columns] = row_matrix
+    weight_matrix[vertex_ids] = normalize_weight_matrix(weight_matrix[vertex_ids])
+
+    set_weight_matrix(skin_cluster, weight_matrix)
+
+    return weight_matrix
+
+
+def import_influence_weights(skin_cluster, influence_weight_dict, blend_weights=None):
+    """
+    Shared import core for the om_import_skin_weights data structure
+    {influence: [weight per vertex], ...}.
+
+    Builds the influence name -> column index once, copies every imported
+    column into the current weight matrix and writes it back with one setWeights call.
+    Scene influences that receive nothing keep their current weights.
+
+    :param skin_cluster:
+    :param influence_weight_dict:
+    :param blend_weights: optional, one value per vertex
+    :return report: {'skin_cluster', 'imported_influences', 'unmatched_influences', 'unused_influences'}
+    """
+    weight_matrix, scene_influence_list = get_weight_matrix(skin_cluster)
+    column_dict = dict((influence, column) for column, influence in enumerate(scene_influence_list))
+
+    report = {
+        'skin_cluster': skin_cluster,
+        'imported_influences': [],
+        'unmatched_influences': [],  # in the file, not in the skinCluster
+        'unused_influences': []  # in the skinCluster, nothing imported
+    }
+
+    for imported_influence, imported_weights in influence_weight_dict.items():
+        column = column_dict.get(imported_influence)
+
+        if column is None:
+            report['unmatched_influences'].append(imported_influence)
+            continue
+
+        if len(imported_weights) != weight_matrix.shape[0]:
+            raise RuntimeError('[{}] {} has {} weights, mesh has {} vertices'.format(
+                skin_cluster, imported_influence, len(imported_weights), weight_matrix.shape[0]))
+
+        weight_matrix[:, column] = imported_weights
+        report['imported_influences'].append(imported_influence)
+
+    imported_influence_set = set(report['imported_influences'])
+    report['unused_influences'] = [influence for influence in scene_influence_list
+                                   if influence not in imported_influence_set]
+
+    set_weight_matrix(skin_cluster, weight_matrix)
+
+    if blend_weights is not None:
+        set_blend_weights(skin_cluster, blend_weights)
+
+    return report
+
+
+def bind_skin_cluster(geometry, influence_list, weight_matrix=None, blend_weights=None, name=None,
+                      **skin_cluster_flags):
+    """
+    Bind-from-data. The skinCluster is created on the first influence only, so Maya
+    has no bind weights to solve, the other influences are added at zero weight in one
+    edit and the stored matrix is written with a single setWeights call.
+
+    :param geometry:
+    :param influence_list:
+    :param weight_matrix: optional (vertex_count, len(influence_list)), columns follow influence_list
+    :param blend_weights: optional, one value per vertex
+    :param name: skinCluster name
+    :param skin_cluster_flags: extra cmds.skinCluster creation flags (skinMethod, normalizeWeights...)
+    :return skin_cluster:
+    """
+    skin_cluster_flags.setdefault('toSelectedBones', True)
+    if name:
+        skin_cluster_flags['name'] = name
+
+    skin_cluster = cmds.skinCluster(influence_list[0], geometry, **skin_cluster_flags)[0]
+    add_influences(skin_cluster, influence_list[1:], lock_weights=False)
+
+    if weight_matrix is not None:
+        scene_influence_list = get_influence_list(skin_cluster)
+        column_dict = dict((influence, column) for column, influence in enumerate(scene_influence_list))
+
+        missing_influence_list = [influence for influence in influence_list if influence not in column_dict]
+        if missing_influence_list:
+            raise RuntimeError('Influences not found in {}: {}'.format(skin_cluster, missing_influence_list))
+
+        scene_matrix = np.zeros((weight_matrix.shape[0], len(scene_influence_list)))
+        scene_matrix[:, [column_dict[influence] for influence in influence_list]] = weight_matrix
+        set_weight_matrix(skin_cluster, scene_matrix)
+
+    if blend_weights is not None:
+        set_blend_weights(skin_cluster, blend_weights)
+
+    return skin_cluster
+
+
+def bind_influence_weights(geometry, influence_weight_dict, blend_weights=None, name=None, **skin_cluster_flags):
+    """
+    bind_skin_cluster for the om_import_skin_weights data structure {influence: [weight per vertex], ...}.
+    :param geometry:
+    :param influence_weight_dict:
+    :param blend_weights: optional, one value per vertex
+    :param name: skinCluster name
+    :param skin_cluster_flags: extra cmds.skinCluster creation flags
+    :return report: same keys as import_influence_weights
+    """
+    influence_list = list(influence_weight_dict.keys())
+    weight_matrix = np.column_stack([np.asarray(influence_weight_dict[influence], dtype=np.float64)
+                                     for influence in influence_list])
+
+    skin_cluster = bind_skin_cluster(geometry, influence_list, weight_matrix, blend_weights, name,
+                                     **skin_cluster_flags)
+
+    return {
+        'skin_cluster': skin_cluster,
+        'imported_influences': influence_list,
+        'unmatched_influences': [],
+        'unused_influences': []
+    }
+
+
+# MATRIX CONVERSION
+
+def normalize_weight_matrix(weight_matrix, locked_columns=None):
+    """
+    Scales every row to sum 1. Rows summing to zero are left at zero.
+    Locked columns keep their value, the unlocked ones share what is left.
+
+    :param weight_matrix:
+    :param locked_columns: column indices that must not change
+    :return normalized weight_matrix:
+    """
+    weight_matrix = np.array(weight_matrix, dtype=np.float64)
+
+    if locked_columns is None or not len(locked_columns):
+        row_sum = weight_matrix.sum(axis=1, keepdims=True)
+        return np.divide(weight_matrix, row_sum, out=np.zeros_like(weight_matrix), where=row_sum > 0)
+
+    unlocked_mask = _unlocked_column_mask(weight_matrix.shape[1], locked_columns)
+    locked_sum = weight_matrix[:, ~unlocked_mask].sum(axis=1, keepdims=True)
+    unlocked_sum = weight_matrix[:, unlocked_mask].sum(axis=1, keepdims=True)
+
+    scale = np.divide(np.clip(1.0 - locked_sum, 0.0, None), unlocked_sum,
+                      out=np.ones_like(unlocked_sum), where=unlocked_sum > 0)
+    weight_matrix[:, unlocked_mask] *= scale
+
+    return weight_matrix
+
+
+def vertex_dict_to_rows(vertex_dict):
+    """
+    Converts the legacy {'mesh.vtx[N]': [(influence, weight), ...]} dictionary into arrays.
+    :param vertex_dict:
+    :return (vertex_ids, row_matrix, influence_list):
+    """
+    column_dict = {}
+    row_list, column_list, value_list = [], [], []
+
+    for row, vertex in enumerate(vertex_dict):
+        for influence, weight in vertex_dict[vertex]:
+            column_list.append(column_dict.setdefault(influence, len(column_dict)))
+            row_list.append(row)
+            value_list.append(weight)
+
+    vertex_ids = np.array([int(vertex[vertex.rindex('[') + 1:-1]) for vertex in vertex_dict], dtype=np.int64)
+
+    row_matrix = np.zeros((len(vertex_ids), len(column_dict)), dtype=np.float64)
+    row_matrix[row_list, column_list] = value_list
+
+    influence_list = sorted(column_dict, key=column_dict.get)
+
+    return vertex_ids, row_matrix, influence_list
+
+
+def weight_matrix_to_csr(weight_matrix, threshold_value=0.0):
+    """
+    Compresses a dense weight matrix into CSR arrays.
+    Only weights above threshold_value are kept.
+
+    :param weight_matrix: (vertex_count, influence_count) array
+    :param threshold_value:
+    :return (offsets, influence_indices, weights):
+    """
+    weight_matrix = np.asarray(weight_matrix)
+    mask = weight_matrix > threshold_value
+
+    offsets = np.zeros(weight_matrix.shape[0] + 1, dtype=np.int64)
+    np.cumsum(mask.sum(axis=1), out=offsets[1:])
+
+    influence_indices = np.nonzero(mask)[1].astype(_influence_index_dtype(weight_matrix.shape[1]))
+    weights = weight_matrix[mask].astype(np.float32)
+
+    return offsets, influence_indices, weights
+
+
+def csr_to_weight_matrix(offsets, influence_indices, weights, influence_count):
+    """
+    Expands CSR arrays back into a dense (vertex_count, influence_count) matrix.
+    :param offsets:
+    :param influence_indices:
+    :param weights:
+    :param influence_count:
+    :return weight_matrix:
+    """
+    vertex_count = len(offsets) - 1
+    vertex_ids = np.repeat(np.arange(vertex_count), np.diff(offsets))
+
+    weight_matrix = np.zeros((vertex_count, influence_count), dtype=np.float64)
+    weight_matrix[vertex_ids, influence_indices] = weights
+
+    return weight_matrix
+
+
+def weight_matrix_to_vertex_dict(geo_name, weight_matrix, influence_list, threshold_value=0.0):
+    """
+    Legacy view of a weight matrix:
+    {'mesh.vtx[N]': [(influence, weight), ...]}
+
+    :param geo_name:
+    :param weight_matrix:
+    :param influence_list:
+    :param threshold_value:
+    :return vertex_dict:
+    """
+    offsets, influence_indices, weights = weight_matrix_to_csr(weight_matrix, threshold_value)
+    influence_names = np.array(influence_list, dtype=object)[influence_indices]
+    weights = weights.astype(np.float64).tolist()
+
+    vertex_dict = {}
+    for vertex_id in range(len(offsets) - 1):
+        start, end = offsets[vertex_id], offsets[vertex_id + 1]
+        vertex_dict['{}.vtx[{}]'.format(geo_name, vertex_id)] = \
+            list(zip(influence_names[start:end], weights[start:end]))
+
+    return vertex_dict
+
+
+def _unlocked_column_mask(influence_count, locked_columns=None):
+    unlocked_mask = np.ones(influence_count, dtype=bool)
+    if locked_columns is not None:
+        unlocked_mask[np.asarray(locked_columns, dtype=np.int64)] = False
+    return unlocked_mask
+
+
+def _influence_index_dtype(influence_count):
+    if influence_count <= np.iinfo(np.uint16).max:
+        return np.uint16
+    return np.int32
+
+
+# QUANTIZATION
+
+def quantize_weight_matrix(weight_matrix):
+    """
+    Fixed-point encoding of a weight matrix. Rows are normalized, stored as uint16
+    steps of 1 / QUANTIZATION_SCALE, and the error left after dequantize_weight_matrix
+    is measured against QUANTIZATION_ERROR_BUDGET.
+
+    :param weight_matrix: (vertex_count, influence_count)
+    :return (quantized_matrix, quantization): quantization is the header stored next to the weights
+    """
+    normalized_matrix = normalize_weight_matrix(weight_matrix)
+    quantized_matrix = np.rint(np.clip(normalized_matrix, 0.0, 1.0) * QUANTIZATION_SCALE).astype(np.uint16)
+
+    restored_matrix = normalize_weight_matrix(quantized_matrix / float(QUANTIZATION_SCALE))
+    max_error = float(np.abs(restored_matrix - normalized_matrix).max()) if normalized_matrix.size else 0.0
+
+    if max_error > QUANTIZATION_ERROR_BUDGET:
+        raise RuntimeError('Quantization error {} is over the {} budget'.format(max_error, QUANTIZATION_ERROR_BUDGET))
+
+    quantization = {
+        'dtype': 'uint16',
+        'scale': QUANTIZATION_SCALE,
+        'max_error': max_error,
+        'error_budget': QUANTIZATION_ERROR_BUDGET
+    }
+
+    return quantized_matrix, quantization
+
+
+def dequantize_weight_matrix(quantized_matrix, quantization, source=''):
+    """
+    Decodes quantize_weight_matrix output and renormalizes every row to sum 1.
+    The stated error must be within QUANTIZATION_ERROR_BUDGET, and every weighted row
+    must sum to 1 within the rounding of its influences, or the data is rejected.
+
+    :param quantized_matrix: (vertex_count, influence_count) integer steps
+    :param quantization: header written by quantize_weight_matrix
+    :param source: file or mesh name used in errors
+    :return weight_matrix:
+    """
+    if quantization['max_error'] > min(quantization['error_budget'], QUANTIZATION_ERROR_BUDGET):
+        raise RuntimeError('[{}] Quantization error {} is over the {} budget'.format(
+            source, quantization['max_error'], QUANTIZATION_ERROR_BUDGET))
+
+    weight_matrix = np.asarray(quantized_matrix, dtype=np.float64) / quantization['scale']
+
+    # each stored weight is off by at most half a step
+    row_sum = weight_matrix.sum(axis=1)
+    row_tolerance = 0.5 * weight_matrix.shape[1] / quantization['scale'] + 1e-9
+    corrupt_row_count = int(np.count_nonzero((row_sum > 0) & (np.abs(row_sum - 1.0) > row_tolerance)))
+
+    if corrupt_row_count:
+        raise RuntimeError('[{}] {} rows do not sum to 1 within the quantization error'.format(
+            source, corrupt_row_count))
+
+    return normalize_weight_matrix(weight_matrix)
+
+
+# INFLUENCE SYNC
+
+def get_weighted_influence_list(skin_cluster, vertex_ids=None):
+    """
+    Influences carrying weight on vertex_ids, read with a single getWeights call.
+    :param skin_cluster:
+    :param vertex_ids: None for every vertex
+    :return influence_list: in skinCluster order
+    """
+    weight_matrix, influence_list = get_weight_matrix(skin_cluster)
+
+    if vertex_ids is not None:
+        weight_matrix = weight_matrix[np.asarray(vertex_ids, dtype=np.int64)]
+
+    return [influence_list[column] for column in np.nonzero(weight_matrix.any(axis=0))[0]]
+
+
+def add_influences(skin_cluster, influence_list, lock_weights=True):
+    """
+    Adds influences with zero weight in one skinCluster edit.
+    Influences already in the skinCluster are skipped.
+
+    :param skin_cluster:
+    :param influence_list:
+    :param lock_weights: lock the added influences, existing weights stay as they are either way
+    :return added_influence_list:
+    """
+    scene_influence_set = set(get_influence_list(skin_cluster))
+    added_influence_list = [influence for influence in influence_list if influence not in scene_influence_set]
+
+    if added_influence_list:
+        cmds.skinCluster(skin_cluster,
+                         edit=True,
+                         useGeometry=True,
+                         dropoffRate=4,
+                         polySmoothness=0,
+                         nurbsSamples=10,
+                         lockWeights=lock_weights,
+                         weight=0,
+                         addInfluence=added_influence_list)
+
+    return added_influence_list
+
+
+def sync_component_influences(target_component_list, reference_component_list):
+    """
+    Adds to the target skinCluster every influence weighting the reference components.
+    :param target_component_list: components of the mesh receiving influences
+    :param reference_component_list: components whose weighted influences are required
+    :return added_influence_list:
+    """
+    reference_mesh, reference_ids = tpMeshData.get_component_vertex_ids(reference_component_list)
+    target_mesh = tpMeshData.get_component_vertex_ids(target_component_list)[0]
+
+    weighted_influence_list = get_weighted_influence_list(get_skin_cluster(reference_mesh), reference_ids)
+
+    return add_influences(get_skin_cluster(target_mesh), weighted_influence_list)
+
+
+def sync_mesh_influences(mesh_list, reference_mesh, weighted_only=True):
+    """
+    Brings every mesh skinCluster up to the influence set of the reference mesh.
+    :param mesh_list:
+    :param reference_mesh:
+    :param weighted_only: only influences carrying weight on the reference, else its whole influence list
+    :return added_influence_dict: {mesh: added_influence_list}
+    """
+    reference_skin_cluster = get_skin_cluster(reference_mesh)
+
+    if not reference_skin_cluster:
+        raise RuntimeError('{} has no skinCluster to sync from'.format(reference_mesh))
+
+    if weighted_only:
+        reference_influence_list = get_weighted_influence_list(reference_skin_cluster)
+    else:
+        reference_influence_list = get_influence_list(reference_skin_cluster)
+
+    added_influence_dict = {}
+
+    for mesh in mesh_list:
+        skin_cluster = get_skin_cluster(mesh)
+
+        if not skin_cluster:
+            print('[Sync Influences] {} has no skinCluster'.format(mesh))
+            continue
+
+        added_influence_dict[mesh] = add_influences(skin_cluster, reference_influence_list)
+        print('[Sync Influences] {} influences added to {}'.format(len(added_influence_dict[mesh]), mesh))
+
+    return added_influence_dict
+
+
+# WEIGHT CONDITIONING
+
+def prune_weight_matrix(weight_matrix, threshold_value=0.005, locked_columns=None):
+    """
+    Zeroes unlocked weights below threshold_value. Does not renormalize.
+    :param weight_matrix:
+    :param threshold_value:
+    :param locked_columns:
+    :return pruned weight_matrix:
+    """
+    weight_matrix = np.array(weight_matrix, dtype=np.float64)
+    unlocked_mask = _unlocked_column_mask(weight_matrix.shape[1], locked_columns)
+
+    weight_matrix[(weight_matrix < threshold_value) & unlocked_mask] = 0.0
+
+    return weight_matrix
+
+
+def limit_weight_matrix_influences(weight_matrix, max_influences=4, locked_columns=None):
+    """
+    Keeps the max_influences largest weights of every row and zeroes the rest.
+    Locked columns are never removed and count towards max_influences when nonzero.
+    Does not renormalize.
+
+    :param weight_matrix:
+    :param max_influences:
+    :param locked_columns:
+    :return limited weight_matrix:
+    """
+    weight_matrix = np.array(weight_matrix, dtype=np.float64)
+    unlocked_mask = _unlocked_column_mask(weight_matrix.shape[1], locked_columns)
+
+    locked_count = (weight_matrix[:, ~unlocked_mask] > 0).sum(axis=1)
+    budget = np.clip(max_influences - locked_count, 0, None)
+
+    # only rows over their budget need ranking
+    over_rows = np.nonzero((weight_matrix[:, unlocked_mask] > 0).sum(axis=1) > budget)[0]
+    if not len(over_rows):
+        return weight_matrix
+
+    ranked = np.where(unlocked_mask, weight_matrix[over_rows], -np.inf)
+    keep = np.zeros(ranked.shape, dtype=bool)
+
+    # keep weights at or above the budget-th largest, rows share few distinct budgets
+    for row_budget in np.unique(budget[over_rows]):
+        if not row_budget:
+            continue
+
+        budget_rows = np.nonzero(budget[over_rows] == row_budget)[0]
+        cutoff = -np.partition(-ranked[budget_rows], row_budget - 1, axis=1)[:, row_budget - 1]
+        keep[budget_rows] = ranked[budget_rows] >= cutoff[:, np.newaxis]
+
+    # rows tied at the cutoff keep the first ones in column order
+    tied_rows = np.nonzero(keep.sum(axis=1) > budget[over_rows])[0]
+    if len(tied_rows):
+        order = np.argsort(-ranked[tied_rows], axis=1, kind='stable')
+        rank = np.empty_like(order)
+        np.put_along_axis(rank, order, np.arange(weight_matrix.shape[1])[np.newaxis, :], axis=1)
+        keep[tied_rows] = rank < budget[over_rows][tied_rows, np.newaxis]
+
+    limited_rows = weight_matrix[over_rows]
+    limited_rows[~keep & unlocked_mask] = 0.0
+    weight_matrix[over_rows] = limited_rows
+
+    return weight_matrix
+
+
+def condition_weight_matrix(weight_matrix, max_influences=None, threshold_value=None, locked_columns=None):
+    """
+    Prune, limit influences and renormalize, in that order.
+    Any step whose argument is None is skipped.
+
+    :param weight_matrix:
+    :param max_influences:
+    :param threshold_value:
+    :param locked_columns:
+    :return conditioned weight_matrix:
+    """
+    if threshold_value is not None:
+        weight_matrix = prune_weight_matrix(weight_matrix, threshold_value, locked_columns)
+
+    if max_influences is not None:
+        weight_matrix = limit_weight_matrix_influences(weight_matrix, max_influences, locked_columns)
+
+    return normalize_weight_matrix(weight_matrix, locked_columns)
+
+
+def get_locked_influence_list(skin_cluster):
+    """
+    Returns the influences with lockInfluenceWeights on.
+    :param skin_cluster:
+    :return locked_influence_list:
+    """
+    return [influence for influence in get_influence_list(skin_cluster)
+            if cmds.attributeQuery('lockInfluenceWeights', node=influence, exists=True)
+            and cmds.getAttr('{}.lockInfluenceWeights'.format(influence))]
+
+
+def condition_skin_cluster(skin_cluster,
+                           max_influences=4,
+                           threshold_value=0.005,
+                           locked_influence_list=None,
+                           maintain_max_influences=True):
+    """
+    Runs condition_weight_matrix over the whole mesh, one read and one write.
+    If no locked_influence_list is given, influences locked in the scene are kept.
+
+    :param skin_cluster:
+    :param max_influences: game engines usually take 4 or 8
+    :param threshold_value:
+    :param locked_influence_list:
+    :param maintain_max_influences: also sets the skinCluster maxInfluences so painting keeps the limit
+    :return weight_matrix: the matrix written to the skinCluster
+    """
+    weight_matrix, influence_list = get_weight_matrix(skin_cluster)
+
+    if locked_influence_list is None:
+        locked_influence_list = get_locked_influence_list(skin_cluster)
+
+    locked_columns = [influence_list.index(influence) for influence in locked_influence_list]
+    weight_matrix = condition_weight_matrix(weight_matrix, max_influences, threshold_value, locked_columns)
+
+    set_weight_matrix(skin_cluster, weight_matrix)
+
+    if maintain_max_influences and max_influences is not None:
+        cmds.setAttr('{}.maxInfluences'.format(skin_cluster), max_influences)
+        cmds.setAttr('{}.maintainMaxInfluences'.format(skin_cluster), True)
+
+    print('[Condition Skin Weights] {} - max {} influences, pruned below {}'.format(
+        skin_cluster, max_influences, threshold_value))
+
+    return weight_matrix
+
+
+# WEIGHT SMOOTHING
+
+def smooth_weight_matrix(weight_matrix, offsets, neighbour_ids, vertex_ids=None, iterations=5, strength=0.5,
+                         locked_columns=None, max_influences=None):
+    """
+    Laplacian relax - every iteration moves the rows of vertex_ids towards the
+    average of their neighbours. Neighbours outside vertex_ids are read, never changed.
+    Only unlocked influences carrying weight around vertex_ids are smoothed, the
+    rows are then limited to max_influences and renormalized around locked columns.
+
+    :param weight_matrix: (vertex_count, influence_count)
+    :param offsets: vertex adjacency, see tpMeshData.get_vertex_adjacency
+    :param neighbour_ids:
+    :param vertex_ids: vertices to smooth, None for the whole mesh
+    :param iterations:
+    :param strength: 0 keeps the weights, 1 replaces them by the neighbour average
+    :param locked_columns:
+    :param max_influences: None for no limit
+    :return weight_matrix: new matrix
+    """
+    weight_matrix = np.array(weight_matrix, dtype=np.float64)
+
+    if vertex_ids is None:
+        vertex_ids = np.arange(weight_matrix.shape[0])
+
+    vertex_ids = np.unique(np.asarray(vertex_ids, dtype=np.int64))
+    start = offsets[vertex_ids]
+    count = offsets[vertex_ids + 1] - start
+
+    # vertices without neighbours have nothing to relax to
+    connected = count > 0
+    vertex_ids, start, count = vertex_ids[connected], start[connected], count[connected]
+
+    group_start = np.zeros(len(count) + 1, dtype=np.int64)
+    np.cumsum(count, out=group_start[1:])
+    gathered_ids = neighbour_ids[np.repeat(start - group_start[:-1], count) + np.arange(group_start[-1])]
+
+    if not len(vertex_ids):
+        return weight_matrix
+
+    # work on the rows and columns involved only, smoothed vertices first
+    region_ids = np.concatenate([vertex_ids, np.setdiff1d(gathered_ids, vertex_ids)])
+    local_ids = np.empty(weight_matrix.shape[0], dtype=np.int64)
+    local_ids[region_ids] = np.arange(len(region_ids))
+
+    unlocked_mask = _unlocked_column_mask(weight_matrix.shape[1], locked_columns)
+    region_rows = weight_matrix[region_ids]
+    columns = np.nonzero(unlocked_mask & region_rows.any(axis=0))[0]
+
+    # influence major float32 copy with a trailing zero vertex, so every
+    # neighbour slot is one contiguous np.take over all influences
+    region_matrix = np.zeros((len(columns), len(region_ids) + 1), dtype=np.float32)
+    region_matrix[:, :-1] = region_rows[:, columns].T
+
+    # neighbour slots padded to the highest valence with the zero vertex
+    neighbour_slots = np.full((len(vertex_ids), count.max()), len(region_ids), dtype=np.int64)
+    slot_index = np.arange(group_start[-1]) - np.repeat(group_start[:-1], count)
+    neighbour_slots[np.repeat(np.arange(len(vertex_ids)), count), slot_index] = local_ids[gathered_ids]
+    inverse_count = (1.0 / count).astype(np.float32)
+
+    smoothed = region_matrix[:, :len(vertex_ids)]
+    for _ in range(iterations):
+        neighbour_sum = np.take(region_matrix, neighbour_slots[:, 0], axis=1)
+        for slot in range(1, neighbour_slots.shape[1]):
+            neighbour_sum += np.take(region_matrix, neighbour_slots[:, slot], axis=1)
+
+        smoothed += strength * (neighbour_sum * inverse_count - smoothed)
+
+    vertex_rows = region_rows[:len(vertex_ids)]
+    vertex_rows[:, columns] = smoothed.T
+    weight_matrix[vertex_ids] = condition_weight_matrix(vertex_rows,
+                                                        max_influences=max_influences,
+                                                        locked_columns=locked_columns)
+
+    return weight_matrix
+
+
+def smooth_skin_weights(component_list, iterations=5, strength=0.5, max_influences=4, locked_influence_list=None):
+    """
+    Smooths the skin weights of a mesh or of its components, one read and one write.
+    If no locked_influence_list is given, influences locked in the scene are kept.
+
+    :param component_list: mesh or components of a single mesh
+    :param iterations:
+    :param strength:
+    :param max_influences: None for no limit
+    :param locked_influence_list:
+    :return weight_matrix: the matrix written to the skinCluster
+    """
+    mesh, vertex_ids = tpMeshData.get_component_vertex_ids(component_list)
+    skin_cluster = get_skin_cluster(mesh)
+
+    if not skin_cluster:
+        raise RuntimeError('{} has no skinCluster to smooth'.format(mesh))
+
+    offsets, neighbour_ids = tpMeshData.get_vertex_adjacency(mesh)
+    weight_matrix, influence_list = get_weight_matrix(skin_cluster)
+
+    if locked_influence_list is None:
+        locked_influence_list = get_locked_influence_list(skin_cluster)
+
+    locked_columns = [influence_list.index(influence) for influence in locked_influence_list]
+    weight_matrix = smooth_weight_matrix(weight_matrix, offsets, neighbour_ids, vertex_ids,
+                                         iterations, strength, locked_columns, max_influences)
+
+    set_weight_matrix(skin_cluster, weight_matrix)
+
+    print('[Smooth Skin Weights] {} - {} vertices, {} iterations'.format(skin_cluster, len(vertex_ids), iterations))
+
+    return weight_matrix
+
+
+# WEIGHT TRANSFER
+
+def transfer_closest_vertex_weights(target_vertex_list, source_vertex_list):
+    """
+    Copies to every target vertex the weights of the closest source vertex.
+    Points of both sets are read in bulk, every closest vertex is found in one
+    batched PointGrid query and the target skinCluster is written once.
+    Source and target may be on different meshes, the influences carrying
+    weight must exist on the target skinCluster.
+
+    :param target_vertex_list: components receiving weights
+    :param source_vertex_list: components providing weights
+    :return weight_matrix: the target matrix written to the skinCluster
+    """
+    target_mesh, target_ids = tpMeshData.get_component_vertex_ids(target_vertex_list)
+    target_points = tpMeshData.get_mesh_points(target_mesh)[target_ids]
+    source_mesh, closest_source_ids = tpMeshData.get_closest_component_vertex_ids(source_vertex_list, target_points,
+                                                                                  check_points=True)[:2]
+
+    source_matrix, source_influence_list = get_weight_matrix(get_skin_cluster(source_mesh))
+    row_matrix = source_matrix[closest_source_ids]
+
+    used_columns = np.nonzero(row_matrix.any(axis=0))[0]
+    weight_matrix = set_weight_rows(get_skin_cluster(target_mesh),
+                                    target_ids,
+                                    row_matrix[:, used_columns],
+                                    [source_influence_list[column] for column in used_columns])
+
+    print('[Transfer Closest Weights] {} vertices from {}'.format(len(target_ids), source_mesh))
+
+    return weight_matrix
+
+
+def transfer_barycentric_weights(target_mesh, source_mesh):
+    """
+    Transfers skin weights between meshes of different topology. Every target
+    vertex is projected on the closest source triangle and receives the weights
+    of its three corners blended by barycentric coordinates.
+    Points and triangles are read in bulk, projections run as one batched
+    TriangleGrid query and the target skinCluster is written once.
+    A target without skinCluster is bound to the influences carrying weight.
+
+    :param target_mesh:
+    :param source_mesh:
+    :return weight_matrix: the target matrix written to the skinCluster
+    """
+    source_skin_cluster = get_skin_cluster(source_mesh)
+
+    if not source_skin_cluster:
+        raise RuntimeError('{} has no skinCluster to transfer from'.format(source_mesh))
+
+    triangle_grid = tpSpatialIndex.TriangleGrid(tpMeshData.get_mesh_points(source_mesh),
+                                                tpMeshData.get_mesh_triangles(source_mesh))
+    target_points = tpMeshData.get_mesh_points(target_mesh)
+    triangle_index, barycentric = triangle_grid.closest_points(target_points)[:2]
+
+    source_matrix, source_influence_list = get_weight_matrix(source_skin_cluster)
+    used_columns = np.nonzero(source_matrix.any(axis=0))[0]
+    used_influence_list = [source_influence_list[column] for column in used_columns]
+    source_matrix = source_matrix[:, used_columns]
+
+    # blend corner by corner, keeps the temporaries at (vertex_count, influence_count)
+    corner_ids = triangle_grid.triangles[triangle_index]
+    row_matrix = np.zeros((len(target_points), len(used_columns)))
+    for corner in range(3):
+        row_matrix += barycentric[:, corner, np.newaxis] * source_matrix[corner_ids[:, corner]]
+
+    target_skin_cluster = get_skin_cluster(target_mesh)
+    if not target_skin_cluster:
+        target_skin_cluster = cmds.skinCluster(used_influence_list, target_mesh, toSelectedBones=True,
+                                               name='{}_skinCluster'.format(target_mesh))[0]
+
+    weight_matrix = set_weight_rows(target_skin_cluster,
+                                    np.arange(len(target_points)),
+                                    row_matrix,
+                                    used_influence_list)
+
+    print('[Transfer Barycentric Weights] {} vertices from {} to {}'.format(len(target_points), source_mesh,
+                                                                             target_mesh))
+
+    return weight_matrix
+
+
+# WEIGHT MIRROR
+
+def get_influence_mirror_columns(influence_list):
+    """
+    Column of the opposite side influence for every influence, found through
+    the NameConvention left/right tokens. Center influences, and sided ones
+    whose mirror is not in the list, map to their own column.
+
+    :param influence_list:
+    :return (mirror_columns, unmatched_influence_list):
+    """
+    name_convention = tpName.NameConvention()
+    column_dict = dict((influence, column) for column, influence in enumerate(influence_list))
+
+    mirror_columns = np.arange(len(influence_list))
+    unmatched_influence_list = []
+
+    for column, influence in enumerate(influence_list):
+        mirror_influence = name_convention.mirror_side(influence)
+
+        if mirror_influence == influence:
+            continue
+
+        if mirror_influence in column_dict:
+            mirror_columns[column] = column_dict[mirror_influence]
+        else:
+            unmatched_influence_list.append(influence)
+
+    return mirror_columns, unmatched_influence_list
+
+
+def mirror_weight_matrix(weight_matrix, mirror_ids, mirror_columns, vertex_mask):
+    """
+    Rows of vertex_mask take the weights of their mirror vertex, with every
+    influence swapped for its mirror influence. Other rows are left as they are.
+
+    :param weight_matrix: (vertex_count, influence_count)
+    :param mirror_ids: mirror vertex id of every vertex
+    :param mirror_columns: mirror influence column of every column, a permutation
+    :param vertex_mask: (vertex_count,) bool, vertices receiving weights
+    :return weight_matrix: new matrix
+    """
+    mirror_matrix = weight_matrix.copy()
+    destination_ids = np.nonzero(vertex_mask)[0]
+
+    # row permutation then column swap - column j of the source lands in mirror_columns[j]
+    mirrored_rows = np.empty((len(destination_ids), weight_matrix.shape[1]))
+    mirrored_rows[:, mirror_columns] = weight_matrix[mirror_ids[destination_ids]]
+    mirror_matrix[destination_ids] = mirrored_rows
+
+    return mirror_matrix
+
+
+def mirror_skin_weights(mesh, axis=0, positive_to_negative=True):
+    """
+    Mirrors the skin weights of a symmetric mesh from one side to the other.
+    The vertex symmetry table is cached per mesh, the skinCluster is read once
+    and written once.
+
+    :param mesh:
+    :param axis: 0, 1 or 2 for the x, y or z object space axis
+    :param positive_to_negative: copy the positive side onto the negative side, or the other way
+    :return report_dict:
+    """
+    skin_cluster = get_skin_cluster(mesh)
+
+    if not skin_cluster:
+        raise RuntimeError('{} has no skinCluster to mirror'.format(mesh))
+
+    mirror_ids, matched = tpMeshData.get_symmetry_table(mesh, axis=axis)
+    axis_values = tpMeshData.get_mesh_points(mesh, world_space=False)[:, axis]
+    destination_side = axis_values < 0.0 if positive_to_negative else axis_values > 0.0
+
+    # vertices on the mirror plane are their own mirror and keep their weights
+    vertex_mask = destination_side & matched & (mirror_ids != np.arange(len(mirror_ids)))
+
+    weight_matrix, influence_list = get_weight_matrix(skin_cluster)
+    mirror_columns, unmatched_influence_list = get_influence_mirror_columns(influence_list)
+
+    set_weight_matrix(skin_cluster, mirror_weight_matrix(weight_matrix, mirror_ids, mirror_columns, vertex_mask))
+
+    report_dict = {
+        'skin_cluster': skin_cluster,
+        'mirrored_vertex_count': int(vertex_mask.sum()),
+        'unmatched_vertex_count': int((destination_side & ~matched).sum()),
+        'unmatched_influences': unmatched_influence_list
+    }
+
+    print('[Mirror Skin Weights] {} vertices on {}'.format(report_dict['mirrored_vertex_count'], mesh))
+
+    if report_dict['unmatched_vertex_count']:
+        print('[Mirror Skin Weights] {} vertices have no mirror vertex, kept as they were'.format(
+            report_dict['unmatched_vertex_count']))
+
+    if unmatched_influence_list:
+        print('[Mirror Skin Weights] No mirror influence for {}'.format(unmatched_influence_list))
+
+    return report_dict
+
+
+# FILE DECODING
+
+def read_influence_weights_file(file_path):
+    """
+    Decodes and validates a file written by om_export_skin_weights.
+    Weight lists are converted to float arrays here, so the thread applying
+    the data does not have to. Quantized files are decoded and their error checked.
+
+    Version chains (see export_versioned_skin_weights) are replayed to their latest version,
+    a manifest reads every file it lists.
+
+    :param file_path:
+    :return skin_weights_file_data: {geo: {'name', 'weights': {influence: array}, 'blendWeights': array}}
+    """
+    if file_path.endswith(VERSIONS_SUFFIX):
+        return read_versioned_skin_weights(file_path)
+
+    if file_path.endswith(MANIFEST_SUFFIX):
+        skin_weights_file_data = {}
+        for listed_file_path in read_manifest_file_list(file_path):
+            skin_weights_file_data.update(read_influence_weights_file(listed_file_path))
+
+        return skin_weights_file_data
+
+    with open(file_path, 'r') as json_file:
+        skin_weights_file_data = json.load(json_file)
+
+    for geo_name, geo_skin_data in skin_weights_file_data.items():
+        missing_key_list = [key for key in ('name', 'weights', 'blendWeights') if key not in geo_skin_data]
+        if missing_key_list:
+            raise RuntimeError('[{}] {} is missing {}'.format(file_path, geo_name, missing_key_list))
+
+        geo_skin_data['blendWeights'] = np.asarray(geo_skin_data['blendWeights'], dtype=np.float64)
+        vertex_count = len(geo_skin_data['blendWeights'])
+
+        for influence in geo_skin_data['weights']:
+            influence_weights = np.asarray(geo_skin_data['weights'][influence], dtype=np.float64)
+
+            if len(influence_weights) != vertex_count:
+                raise RuntimeError('[{}] {} - {} has {} weights, expected {}'.format(
+                    file_path, geo_name, influence, len(influence_weights), vertex_count))
+
+            geo_skin_data['weights'][influence] = influence_weights
+
+        if 'quantization' in geo_skin_data and geo_skin_data['weights']:
+            influence_list = list(geo_skin_data['weights'].keys())
+            weight_matrix = dequantize_weight_matrix(
+                np.column_stack([geo_skin_data['weights'][influence] for influence in influence_list]),
+                geo_skin_data['quantization'],
+                '{} {}'.format(file_path, geo_name))
+
+            geo_skin_data['weights'] = dict((influence, weight_matrix[:, column])
+                                            for column, influence in enumerate(influence_list))
+
+    return skin_weights_file_data
+
+
+def iter_decoded_files(file_path_list, reader=read_influence_weights_file, worker_count=2):
+    """
+    Decodes files on a thread pool while the caller consumes them.
+    Yields (file_path, data) in file_path_list order, keeping at most
+    worker_count files decoded ahead of the one being applied.
+    Decoding errors are raised when the failing file is reached.
+
+    Threads are used rather than processes - Maya can not spawn
+    worker interpreters reliably, and zlib/file reads release the GIL.
+
+    :param file_path_list:
+    :param reader: function(file_path) -> data
+    :param worker_count:
+    :return generator:
+    """
+    pool = ThreadPool(max(1, worker_count))
+    pending = collections.deque()
+
+    try:
+        for file_path in file_path_list:
+            pending.append((file_path, pool.apply_async(reader, (file_path,))))
+
+            if len(pending) > worker_count:
+                decoded_path, result = pending.popleft()
+                yield decoded_path, result.get()
+
+        while pending:
+            decoded_path, result = pending.popleft()
+            yield decoded_path, result.get()
+
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def list_export_files(dir_path, file_name):
+    """
+    Files written by one om_export_skin_weights call, resolved through its manifest.
+    Falls back to the legacy single {file_name}.json export.
+
+    :param dir_path:
+    :param file_name:
+    :return file_path_list:
+    """
+    manifest_path = os.path.join(dir_path, file_name + MANIFEST_SUFFIX)
+    if os.path.isfile(manifest_path):
+        return read_manifest_file_list(manifest_path)
+
+    legacy_file_path = os.path.join(dir_path, file_name + '.json')
+    if os.path.isfile(legacy_file_path):
+        return [legacy_file_path]
+
+    raise RuntimeError('No skin weights export named {} in {}'.format(file_name, dir_path))
+
+
+def read_manifest_file_list(manifest_path):
+    """
+    :param manifest_path: per-mesh or versioned om_export_skin_weights manifest
+    :return file_path_list: the per-mesh files or version chains it lists
+    """
+    with open(manifest_path, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if manifest.get('format') not in ('per_mesh', 'versioned'):
+        raise RuntimeError('{} is not a skin weights export manifest, format {}'.format(
+            manifest_path, manifest.get('format')))
+
+    return [os.path.join(os.path.dirname(manifest_path), mesh_data['file']) for mesh_data in manifest['meshes']]
+
+
+def list_skin_weights_files(dir_path):
+    """
+    Lists the om_export_skin_weights files in dir_path, in import order.
+    Files tied together by a per-mesh or versioned manifest are taken from the manifest,
+    per-mesh files not listed in their manifest (stale meshes) are skipped,
+    any other .json file is treated as a legacy single file export.
+
+    :param dir_path:
+    :return file_path_list:
+    """
+    file_path_list = []
+    manifest_prefix_list = []
+
+    for manifest_path in sorted(glob.glob(os.path.join(dir_path, '*' + MANIFEST_SUFFIX))):
+        with open(manifest_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+
+        if manifest.get('format') not in ('per_mesh', 'versioned'):
+            continue
+
+        manifest_prefix_list.append('{}.'.format(manifest['file_name']))
+        file_path_list.extend(os.path.join(dir_path, mesh_data['file']) for mesh_data in manifest['meshes'])
+
+    for file_path in sorted(glob.glob(os.path.join(dir_path, '*.json'))):
+        file_name = os.path.basename(file_path)
+
+        if file_name.endswith(MANIFEST_SUFFIX):
+            continue
+        if any(file_name.startswith(prefix) for prefix in manifest_prefix_list):
+            continue
+
+        file_path_list.append(file_path)
+
+    return file_path_list
+
+
+def list_sparse_skin_weights_files(dir_path):
+    """
+    Lists the export_sparse_skin_weights files in dir_path - .npz files with a csr manifest next to them.
+    Version files of export_versioned_skin_weights are .npz too, they are read through their chain.
+
+    :param dir_path:
+    :return file_path_list:
+    """
+    file_path_list = []
+
+    for file_path in sorted(glob.glob(os.path.join(dir_path, '*' + SPARSE_EXTENSION))):
+        manifest_path = get_manifest_path(file_path)
+
+        if not os.path.isfile(manifest_path):
+            continue
+
+        with open(manifest_path, 'r') as manifest_file:
+            if json.load(manifest_file).get('format') == 'csr':
+                file_path_list.append(file_path)
+
+    return file_path_list
+
+
+# WEIGHT LINT
+
+def lint_weight_matrix(weight_matrix, influence_list, max_influences=4, normalize_tolerance=1e-3,
+                       noise_threshold=1e-3):
+    """
+    Runs the skin weight health checks on a (verts x influences) matrix.
+    Non-normalized, over influence and zero-weight vertices fail the mesh,
+    noise weights and unused influences are reported as warnings.
+
+    :param weight_matrix:
+    :param influence_list:
+    :param max_influences:
+    :param normalize_tolerance: allowed |row sum - 1|
+    :param noise_threshold: non-zero weights below it are noise
+    :return lint_dict: {check: {'count', 'vertex_ids', ...}, 'unused_influences', 'passed'}
+    """
+    weight_matrix = np.asarray(weight_matrix)
+
+    nonzero_mask = weight_matrix != 0.0
+    influence_counts = np.count_nonzero(nonzero_mask, axis=1)
+    normalize_error = np.abs(weight_matrix.sum(axis=1) - 1.0)
+    noise_counts = np.count_nonzero(nonzero_mask & (np.abs(weight_matrix) < noise_threshold), axis=1)
+
+    zero_rows = influence_counts == 0
+    non_normalized_rows = ~zero_rows & (normalize_error > normalize_tolerance)
+    over_rows = influence_counts > max_influences
+    noise_rows = noise_counts > 0
+
+    max_error = normalize_error[non_normalized_rows].max() if non_normalized_rows.any() else 0.0
+    max_count = influence_counts.max() if len(influence_counts) else 0
+
+    lint_dict = {
+        'vertex_count': int(weight_matrix.shape[0]),
+        'influence_count': int(weight_matrix.shape[1]),
+        'non_normalized': _lint_entry(non_normalized_rows, max_error=float(max_error)),
+        'over_influences': _lint_entry(over_rows, max_influences=int(max_count)),
+        'zero_weight': _lint_entry(zero_rows),
+        'noise_weights': _lint_entry(noise_rows, weight_count=int(noise_counts.sum())),
+        'unused_influences': [influence for influence, used in zip(influence_list, nonzero_mask.any(axis=0))
+                              if not used]
+    }
+    lint_dict['passed'] = not (lint_dict['non_normalized']['count'] or
+                               lint_dict['over_influences']['count'] or
+                               lint_dict['zero_weight']['count'])
+
+    return lint_dict
+
+
+def lint_skin_weights_dirs(dir_path_list, report_path=None, max_influences=4, normalize_tolerance=1e-3,
+                           noise_threshold=1e-3, worker_count=2):
+    """
+    Lints every mesh exported to dir_path_list (om_export_skin_weights files, version chains
+    replayed through their .versions.json, and sparse .npz files).
+    Files are decoded on a thread pool, see iter_decoded_files.
+    Files that fail to decode are reported and fail the lint.
+
+    :param dir_path_list: ie. the project skin_clusters_model/template/system dirs
+    :param report_path: writes the report as json if given
+    :param max_influences:
+    :param normalize_tolerance:
+    :param noise_threshold:
+    :param worker_count:
+    :return report: {'passed', 'mesh_count', 'failed_mesh_list', 'file_error_list', 'meshes': [lint_dict]}
+    """
+    file_path_list = []
+    for dir_path in dir_path_list:
+        if not os.path.isdir(dir_path):
+            continue
+
+        file_path_list.extend(list_skin_weights_files(dir_path))
+        file_path_list.extend(list_sparse_skin_weights_files(dir_path))
+
+    mesh_lint_list = []
+    file_error_list = []
+
+    for file_path, skin_data_list in iter_decoded_files(file_path_list, _read_lint_skin_data, worker_count):
+        if isinstance(skin_data_list, Exception):
+            file_error_list.append({'file': file_path, 'error': str(skin_data_list)})
+            continue
+
+        for mesh, skin_cluster_name, influence_list, weight_matrix in skin_data_list:
+            lint_dict = lint_weight_matrix(weight_matrix, influence_list, max_influences,
+                                           normalize_tolerance, noise_threshold)
+            lint_dict.update({'mesh': mesh, 'skin_cluster': skin_cluster_name, 'file': file_path})
+            mesh_lint_list.append(lint_dict)
+
+    failed_mesh_list = [lint_dict['mesh'] for lint_dict in mesh_lint_list if not lint_dict['passed']]
+
+    report = {
+        'passed': not (failed_mesh_list or file_error_list),
+        'settings': {'max_influences': max_influences,
+                     'normalize_tolerance': normalize_tolerance,
+                     'noise_threshold': noise_threshold},
+        'file_count': len(file_path_list),
+        'mesh_count': len(mesh_lint_list),
+        'failed_mesh_list': failed_mesh_list,
+        'file_error_list': file_error_list,
+        'meshes': mesh_lint_list
+    }
+
+    if report_path:
+        with open(report_path, 'w') as file_for_write:
+            json.dump(report, file_for_write, indent=4)
+
+    print('[Skin Weights Lint] {} meshes, {} failed, {} unreadable files'.format(
+        len(mesh_lint_list), len(failed_mesh_list), len(file_error_list)))
+
+    return report
+
+
+def _lint_entry(row_mask, **extra_data):
+    vertex_ids = np.flatnonzero(row_mask)
+
+    lint_entry = {'count': int(len(vertex_ids)), 'vertex_ids': vertex_ids[:LINT_SAMPLE_SIZE].tolist()}
+    lint_entry.update(extra_data)
+
+    return lint_entry
+
+
+def _read_lint_skin_data(file_path):
+    """
+    Decodes any skin weights file to [(mesh, skin_cluster_name, influence_list, weight_matrix)],
+    returning the exception instead of raising so one bad file does not stop the lint.
+    """
+    try:
+        if file_path.endswith(SPARSE_EXTENSION):
+            return [(mesh, skin_data['skin_cluster_name'], skin_data['influence_list'], skin_data['weight_matrix'])
+                    for mesh, skin_data in read_sparse_skin_weights(file_path).items()]
+
+        skin_data_list = []
+        for geo_name, geo_skin_data in read_influence_weights_file(file_path).items():
+            influence_list = list(geo_skin_data['weights'].keys())
+            vertex_count = len(geo_skin_data['blendWeights'])
+            weight_matrix = np.zeros((vertex_count, len(influence_list)))
+
+            for column, influence in enumerate(influence_list):
+                weight_matrix[:, column] = geo_skin_data['weights'][influence]
+
+            skin_data_list.append((geo_name, geo_skin_data['name'], influence_list, weight_matrix))
+
+        return skin_data_list
+
+    except Exception as decode_error:
+        return decode_error
+
+
+# FILE ENCODING
+
+def export_influence_weights(geo_list, dir_path, file_name, worker_count=2, quantize=False):
+    """
+    Exports skin weights in the om_export_skin_weights format, one file per mesh.
+    Weights are read on the calling (main) thread, one mesh at a time, and handed
+    to a thread pool that serializes and writes them while the next mesh is read.
+    At most worker_count meshes wait in memory for their writer.
+
+    Writes {file_name}.{geo}.json for each skinned geometry and
+    {file_name}.manifest.json listing them. A previous single file
+    export {file_name}.json is removed, as it would be imported twice.
+
+    :param geo_list:
+    :param dir_path:
+    :param file_name:
+    :param worker_count:
+    :param quantize: store uint16 fixed-point weights, see quantize_weight_matrix
+    :return manifest_path:
+    """
+    manifest = {'format': 'per_mesh', 'version': PER_MESH_FORMAT_VERSION, 'file_name': file_name, 'meshes': []}
+
+    pool = ThreadPool(max(1, worker_count))
+    pending = collections.deque()
+
+    try:
+        for geometry in geo_list:
+            skin_cluster = get_skin_cluster(geometry)
+
+            if not skin_cluster:
+                continue
+
+            weight_matrix, influence_list = get_weight_matrix(skin_cluster)
+            blend_weights = get_blend_weights(skin_cluster)
+
+            mesh_file_name = '{}.{}.json'.format(file_name, geometry.replace('|', '_').replace(':', '_'))
+            pending.append(pool.apply_async(
+                _write_influence_weights_file,
+                (os.path.join(dir_path, mesh_file_name), geometry, skin_cluster,
+                 influence_list, weight_matrix, blend_weights, quantize)))
+
+            manifest['meshes'].append({
+                'mesh': geometry,
+                'skin_cluster_name': skin_cluster,
+                'file': mesh_file_name,
+                'vertex_count': weight_matrix.shape[0],
+                'influence_count': weight_matrix.shape[1]
+            })
+
+            if len(pending) > worker_count:
+                pending.popleft().get()
+
+        while pending:
+            pending.popleft().get()
+
+    finally:
+        pool.close()
+        pool.join()
+
+    manifest_path = os.path.join(dir_path, file_name + MANIFEST_SUFFIX)
+    with open(manifest_path, 'w') as file_for_write:
+        json.dump(manifest, file_for_write, indent=4)
+
+    single_file_path = os.path.join(dir_path, file_name + '.json')
+    if os.path.exists(single_file_path):
+        os.remove(single_file_path)
+
+    print('[OM Export Skin Weights] {} meshes - {}'.format(len(manifest['meshes']), manifest_path))
+
+    return manifest_path
+
+
+def _write_influence_weights_file(file_path, geometry, skin_cluster, influence_list, weight_matrix, blend_weights,
+                                  quantize=False):
+    geo_skin_data = {'blendWeights': blend_weights.tolist(), 'name': skin_cluster}
+
+    if quantize:
+        weight_matrix, geo_skin_data['quantization'] = quantize_weight_matrix(weight_matrix)
+
+    geo_skin_data['weights'] = dict((influence, weight_matrix[:, column].tolist())
+                                    for column, influence in enumerate(influence_list))
+
+    with open(file_path, 'w') as file_for_write:
+        json.dump({geometry: geo_skin_data}, file_for_write, separators=(',', ':'))
+
+
+# SPARSE FILE FORMAT
+
+def export_sparse_skin_weights(skin_data_list, file_path, quantize=False):
+    """
+    Writes skin weights as CSR arrays in one compressed .npz file, plus a
+    JSON manifest next to it holding mesh, skinCluster and influence names.
+
+    skin_data_list structure
+    [{'mesh': 'name',
+      'skin_cluster_name': 'name',
+      'influence_list': ['joint1', 'joint2', ...],
+      'weight_matrix': array(vertex_count, influence_count),
+      'blend_weights': array(vertex_count)}, ...]
+
+    :param skin_data_list:
+    :param file_path: path ending in .npz
+    :param quantize: store uint16 fixed-point weights, see quantize_weight_matrix
+    :return manifest_path:
+    """
+    arrays = {}
+    manifest = {'format': 'csr', 'version': SPARSE_FORMAT_VERSION, 'meshes': []}
+
+    for index, skin_data in enumerate(skin_data_list):
+        key = 'mesh_{:03d}'.format(index)
+        weight_matrix = skin_data['weight_matrix']
+        mesh_data = {
+            'key': key,
+            'mesh': skin_data['mesh'],
+            'skin_cluster_name': skin_data['skin_cluster_name'],
+            'influence_list': list(skin_data['influence_list']),
+            'vertex_count': weight_matrix.shape[0]
+        }
+
+        if quantize:
+            weight_matrix, mesh_data['quantization'] = quantize_weight_matrix(weight_matrix)
+
+        offsets, influence_indices, weights = weight_matrix_to_csr(weight_matrix)
+
+        arrays['{}_offsets'.format(key)] = offsets
+        arrays['{}_influence_indices'.format(key)] = influence_indices
+        arrays['{}_weights'.format(key)] = weights.astype(np.uint16) if quantize else weights
+        arrays['{}_blend_weights'.format(key)] = np.asarray(skin_data['blend_weights'], dtype=np.float32)
+
+        manifest['meshes'].append(mesh_data)
+
+    np.savez_compressed(file_path, **arrays)
+
+    manifest_path = get_manifest_path(file_path)
+    with open(manifest_path, 'w') as file_for_write:
+        json.dump(manifest, file_for_write, indent=4)
+
+    return manifest_path
+
+
+def read_sparse_skin_weights(file_path):
+    """
+    Reads a file written by export_sparse_skin_weights.
+    :param file_path: path ending in .npz
+    :return skin_data_dict: {mesh: {'skin_cluster_name', 'influence_list', 'weight_matrix', 'blend_weights'}}
+    """
+    with open(get_manifest_path(file_path), 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if manifest.get('version', 0) > SPARSE_FORMAT_VERSION:
+        raise RuntimeError('Unsupported skin weights format version {} in {}'.format(manifest['version'], file_path))
+
+    skin_data_dict = {}
+    with np.load(file_path) as arrays:
+        for mesh_data in manifest['meshes']:
+            key = mesh_data['key']
+            weight_matrix = csr_to_weight_matrix(
+                arrays['{}_offsets'.format(key)],
+                arrays['{}_influence_indices'.format(key)],
+                arrays['{}_weights'.format(key)],
+                len(mesh_data['influence_list']))
+
+            if 'quantization' in mesh_data:
+                weight_matrix = dequantize_weight_matrix(weight_matrix, mesh_data['quantization'],
+                                                         '{} {}'.format(file_path, mesh_data['mesh']))
+
+            skin_data_dict[mesh_data['mesh']] = {
+                'skin_cluster_name': mesh_data['skin_cluster_name'],
+                'influence_list': mesh_data['influence_list'],
+                'weight_matrix': weight_matrix,
+                'blend_weights': arrays['{}_blend_weights'.format(key)].astype(np.float64)
+            }
+
+    return skin_data_dict
+
+
+def get_manifest_path(file_path):
+    return os.path.splitext(file_path)[0] + MANIFEST_SUFFIX
+
+
+# WEIGHT VERSIONS
+
+def export_versioned_skin_weights(geo_list, dir_path, file_name, rebase_interval=20, rebase_ratio=0.5,
+                                  worker_count=2):
+    """
+    Exports skin weights as a version chain per mesh, a full base snapshot followed
+    by deltas holding only the vertex rows that changed since the previous version.
+    A new base is written, and the previous chain removed, every rebase_interval
+    deltas, once the deltas cover rebase_ratio of the vertices, or when the vertex
+    count changes. Meshes without changes get no new version.
+
+    The last exported state is kept in memory, so only the skinCluster read and
+    the comparison run over the whole mesh, writing scales with the edited vertices.
+
+    Writes {file_name}.{geo}.versions.json chains, their .npz versions and
+    {file_name}.manifest.json listing the chains. Files of a previous per-mesh
+    or single file export under the same name are removed.
+
+    :param geo_list:
+    :param dir_path:
+    :param file_name:
+    :param rebase_interval: deltas allowed on top of a base
+    :param rebase_ratio: fraction of the vertices the deltas may cover before re-basing
+    :param worker_count:
+    :return manifest_path:
+    """
+    manifest_path = os.path.join(dir_path, file_name + MANIFEST_SUFFIX)
+    _remove_previous_export_files(dir_path, file_name, manifest_path)
+
+    manifest = {'format': 'versioned', 'version': VERSIONED_FORMAT_VERSION, 'file_name': file_name, 'meshes': []}
+
+    pool = ThreadPool(max(1, worker_count))
+    pending = collections.deque()
+
+    try:
+        for geometry in geo_list:
+            skin_cluster = get_skin_cluster(geometry)
+
+            if not skin_cluster:
+                continue
+
+            mesh_file_name = '{}.{}'.format(file_name, geometry.replace('|', '_').replace(':', '_'))
+            chain_path = os.path.join(dir_path, mesh_file_name + VERSIONS_SUFFIX)
+
+            weight_matrix, influence_list = get_weight_matrix(skin_cluster)
+            blend_weights = get_blend_weights(skin_cluster)
+
+            write_args = _build_weight_version(chain_path, mesh_file_name, geometry, skin_cluster,
+                                               weight_matrix, influence_list, blend_weights,
+                                               rebase_interval, rebase_ratio)
+
+            if write_args:
+                pending.append(pool.apply_async(_write_weight_version, write_args))
+
+            manifest['meshes'].append({
+                'mesh': geometry,
+                'skin_cluster_name': skin_cluster,
+                'file': os.path.basename(chain_path),
+                'vertex_count': weight_matrix.shape[0],
+                'influence_count': weight_matrix.shape[1]
+            })
+
+            if len(pending) > worker_count:
+                pending.popleft().get()
+
+        while pending:
+            pending.popleft().get()
+
+    finally:
+        pool.close()
+        pool.join()
+
+    with open(manifest_path, 'w') as file_for_write:
+        json.dump(manifest, file_for_write, indent=4)
+
+    print('[OM Export Skin Weights] {} meshes - {}'.format(len(manifest['meshes']), manifest_path))
+
+    return manifest_path
+
+
+def read_versioned_skin_weights(chain_path):
+    """
+    Rebuilds the latest version of a chain written by export_versioned_skin_weights.
+    :param chain_path: {file_name}.{geo}.versions.json
+    :return skin_weights_file_data: same structure as read_influence_weights_file
+    """
+    chain = _read_version_chain(chain_path)
+
+    if chain is None:
+        raise RuntimeError('Skin weights version chain not found: {}'.format(chain_path))
+
+    weight_matrix, influence_list, blend_weights = _get_version_state(chain_path, chain)
+
+    return {
+        chain['mesh']: {
+            'name': chain['skin_cluster_name'],
+            'weights': dict((influence, weight_matrix[:, column].astype(np.float64))
+                            for column, influence in enumerate(influence_list)),
+            'blendWeights': blend_weights.astype(np.float64)
+        }
+    }
+
+
+def _build_weight_version(chain_path, mesh_file_name, geometry, skin_cluster,
+                          weight_matrix, influence_list, blend_weights, rebase_interval, rebase_ratio):
+    """
+    Compares the scene weights with the last version and prepares the next one.
+    :return write_args: _write_weight_version arguments, None when nothing changed
+    """
+    chain = _read_version_chain(chain_path)
+    vertex_count = weight_matrix.shape[0]
+    stored_matrix = weight_matrix.astype(np.float32)
+    stored_blend_weights = blend_weights.astype(np.float32)
+
+    rebase = chain is None or chain['vertex_count'] != vertex_count
+
+    if not rebase:
+        previous_matrix, previous_influence_list, previous_blend_weights = _get_version_state(chain_path, chain)
+        aligned_matrix = _align_influence_columns(previous_matrix, previous_influence_list, influence_list)
+
+        # weight left on influences removed since the last version also counts as a change
+        removed_weight = previous_matrix.sum(axis=1) - aligned_matrix.sum(axis=1)
+        changed_rows = (np.abs(weight_matrix - aligned_matrix).max(axis=1) > VERSION_TOLERANCE) | \
+                       (removed_weight > VERSION_TOLERANCE)
+        changed_blend = np.abs(blend_weights - previous_blend_weights) > VERSION_TOLERANCE
+
+        vertex_ids = np.nonzero(changed_rows)[0]
+        blend_ids = np.nonzero(changed_blend)[0]
+
+        if not len(vertex_ids) and not len(blend_ids) and previous_influence_list == influence_list:
+            print('[OM Export Skin Weights] {} unchanged'.format(geometry))
+            return None
+
+        delta_list = chain['versions'][1:]
+        changed_since_base = sum(version['changed_vertex_count'] for version in delta_list) + len(vertex_ids)
+        rebase = len(delta_list) >= rebase_interval or changed_since_base >= rebase_ratio * vertex_count
+
+    if rebase:
+        removed_file_list = [version['file'] for version in chain['versions']] if chain else []
+        chain = {
+            'format': 'weight_versions',
+            'version': VERSIONED_FORMAT_VERSION,
+            'mesh': geometry,
+            'skin_cluster_name': skin_cluster,
+            'vertex_count': vertex_count,
+            'next_index': chain['next_index'] if chain else 1,
+            'versions': []
+        }
+        vertex_ids = blend_ids = np.arange(vertex_count)
+    else:
+        removed_file_list = []
+        # the stored state is the previous one with the changed rows replaced
+        aligned_matrix[vertex_ids] = stored_matrix[vertex_ids]
+        previous_blend_weights[blend_ids] = stored_blend_weights[blend_ids]
+        stored_matrix, stored_blend_weights = aligned_matrix, previous_blend_weights
+
+    version_file = '{}.v{:04d}{}'.format(mesh_file_name, chain['next_index'], SPARSE_EXTENSION)
+    chain['next_index'] += 1
+    chain['skin_cluster_name'] = skin_cluster
+    chain['versions'].append({
+        'file': version_file,
+        'type': 'base' if rebase else 'delta',
+        'influence_list': list(influence_list),
+        'changed_vertex_count': int(len(vertex_ids)),
+        'changed_blend_count': int(len(blend_ids))
+    })
+
+    offsets, influence_indices, weights = weight_matrix_to_csr(weight_matrix[vertex_ids])
+    arrays = {
+        'vertex_ids': vertex_ids.astype(np.int32),
+        'offsets': offsets,
+        'influence_indices': influence_indices,
+        'weights': weights,
+        'blend_ids': blend_ids.astype(np.int32),
+        'blend_weights': blend_weights[blend_ids].astype(np.float32)
+    }
+
+    _store_version_state(chain_path, (version_file, stored_matrix, list(influence_list), stored_blend_weights))
+
+    return chain_path, chain, arrays, removed_file_list
+
+
+def _write_weight_version(chain_path, chain, arrays, removed_file_list):
+    """
+    Writes the version arrays first and the chain last, an interrupted
+    export leaves the chain pointing at complete versions only.
+    """
+    dir_path = os.path.dirname(chain_path)
+    np.savez_compressed(os.path.join(dir_path, chain['versions'][-1]['file']), **arrays)
+
+    with open(chain_path, 'w') as file_for_write:
+        json.dump(chain, file_for_write, indent=4)
+
+    for removed_file in removed_file_list:
+        removed_path = os.path.join(dir_path, removed_file)
+        if os.path.exists(removed_path):
+            os.remove(removed_path)
+
+
+def _read_version_chain(chain_path):
+    if not os.path.exists(chain_path):
+        return None
+
+    with open(chain_path, 'r') as chain_file:
+        chain = json.load(chain_file)
+
+    if chain.get('version', 0) > VERSIONED_FORMAT_VERSION:
+        raise RuntimeError('Unsupported skin weights format version {} in {}'.format(chain['version'], chain_path))
+
+    return chain
+
+
+def _get_version_state(chain_path, chain):
+    """
+    Latest (weight_matrix, influence_list, blend_weights) of the chain, float32.
+    Taken from memory when the chain was last written by this session, else replayed from disk.
+    """
+    cached_state = _version_state_cache.get(chain_path)
+
+    if cached_state and cached_state[0] == chain['versions'][-1]['file']:
+        _store_version_state(chain_path, cached_state)
+        return cached_state[1].copy(), list(cached_state[2]), cached_state[3].copy()
+
+    dir_path = os.path.dirname(chain_path)
+    weight_matrix = np.zeros((chain['vertex_count'], 0), dtype=np.float32)
+    blend_weights = np.zeros(chain['vertex_count'], dtype=np.float32)
+    influence_list = []
+
+    for version in chain['versions']:
+        weight_matrix = _align_influence_columns(weight_matrix, influence_list, version['influence_list'])
+        influence_list = version['influence_list']
+
+        with np.load(os.path.join(dir_path, version['file'])) as arrays:
+            vertex_ids = arrays['vertex_ids'].astype(np.int64)
+            weight_matrix[vertex_ids] = csr_to_weight_matrix(arrays['offsets'],
+                                                             arrays['influence_indices'],
+                                                             arrays['weights'],
+                                                             len(influence_list))
+            blend_weights[arrays['blend_ids'].astype(np.int64)] = arrays['blend_weights']
+
+    _store_version_state(chain_path, (chain['versions'][-1]['file'], weight_matrix, list(influence_list),
+                                      blend_weights))
+
+    return weight_matrix.copy(), list(influence_list), blend_weights.copy()
+
+
+def _store_version_state(chain_path, version_state):
+    _version_state_cache.pop(chain_path, None)
+    _version_state_cache[chain_path] = version_state
+
+    while len(_version_state_cache) > VERSION_STATE_CACHE_SIZE:
+        _version_state_cache.popitem(last=False)
+
+
+def _align_influence_columns(weight_matrix, influence_list, target_influence_list):
+    """
+    Reorders the columns of weight_matrix to target_influence_list.
+    New influences get zero weight, influences not in the target are dropped.
+    """
+    column_dict = dict((influence, column) for column, influence in enumerate(influence_list))
+    aligned_matrix = np.zeros((weight_matrix.shape[0], len(target_influence_list)), dtype=np.float32)
+
+    for target_column, influence in enumerate(target_influence_list):
+        if influence in column_dict:
+            aligned_matrix[:, target_column] = weight_matrix[:, column_dict[influence]]
+
+    return aligned_matrix
 
 
-# # getting the selection
-# original_sel = om.MSelectionList()
-# om.MGlobal.getActiveSelectionList(original_sel)
-#
-#
-# # getting selected mesh and components
-# cmds.select(cmds.polyListComponentConversion(toVertex=True))
-#
-# # get the selected mesh and components
-# sel = om.MSelectionList()
-# om.MGlobal.getActiveSelectionList(sel)
-#
-# if not sel.length():
-#     return
-#
-# selected_components = om.MObject()
-# dag = om.MDagPath()
-# sel.getDagPath(0, dag, selected_components)
-#
-# dag.extendToShape()
-#
-# if dag.apiType() != 296:
-#     om.MGlobal.displayError("Selection must be a polygon mesh.")
-#     return
-#
-# # getting skinclisters name and mobject
-# def getSkinCluster(self, dag):
-#     """A convenience function for finding the skinCluster deforming a mesh.
-#
-#     params:
-#       dag (MDagPath): A MDagPath for the mesh we want to investigate.
-#     """
-#
-#     # useful one-liner for finding a skinCluster on a mesh
-#     skin_cluster = cmds.ls(cmds.listHistory(dag.fullPathName()), type="skinCluster")
-#
-#     if len(skin_cluster) > 0:
-#         # get the MObject for that skinCluster node if there is one
-#         sel = om.MSelectionList()
-#         sel.add(skin_cluster[0])
-#         skin_cluster_obj = om.MObject()
-#         sel.getDependNode(0, skin_cluster_obj)
-#
-#         return skin_cluster[0], skin_cluster_obj
-#
-#     else:
-#         raise RuntimeError("Selected mesh has no skinCluster")
-#
-#     # part something of the post
-#     # doing this can speed up iteration and also allows you to undo all of this
-#     cmds.skinPercent(skin_cluster, pruneWeights=0.005)
-#
-#     mFnSkinCluster = omAnim.MFnSkinCluster(skin_cluster_obj)
-#
-#     inf_objects = om.MDagPathArray()
-#     # returns a list of the DagPaths of the joints affecting the mesh
-#     mFnSkinCluster.influenceObjects(inf_objects)
-#     inf_count_util = om.MScriptUtil(inf_objects.length())
-#
-#     # c++ utility needed for the get/set weights functions
-#     inf_count_ptr = inf_count_util.asUintPtr()
-#     inf_count = inf_count_util.asInt()
-#     influence_indices = om.MIntArray()
-#
-#     # create an MIntArray that just counts from 0 to inf_count
-#     for i in range(0, inf_count):
-#       influence_indices.append(i)
-#
-#     old_weights = om.MDoubleArray()
-#     # don't use the selected_components MObject we made since we want to get the weights for each vertex
-#     # on this mesh, not just the selected one
-#     empty_object = om.MObject()
-#     mFnSkinCluster.getWeights(dag, empty_object, old_weights, inf_count_ptr)
-#
-#     # new_weights just starts as a copy of old_weights
-#     new_weights = om.MDoubleArray(old_weights)
-#
-#
-#     #____________________
-#     # iterate over the selected verts
-#     itVerts = om.MItMeshVertex(dag, selected_components)
-#
-#     while not itVerts.isDone():
-#         this_vert_weight_index = itVerts.index() * inf_count
-#         vert_weights = list(new_weights[this_vert_weight_index: this_vert_weight_index + inf_count])
-#
-#         # makes the weights for the closest vertex equal to the outer vertex
-#         new_weights[this_vert_weight_index: this_vert_weight_index + inf_count] = SOME
-#         AWESOME
-#         FUNCTION
-#
-#         itVerts.next()
-#
-#     # set weights all at once
-#     mFnSkinCluster.setWeights(dag, empty_object, influence_indices, new_weights, True, old_weights)
-#
-#     om.MGlobal.setActiveSelectionList(original_sel)
+def _remove_previous_export_files(dir_path, file_name, manifest_path):
+    """
+    Removes a previous single file or per-mesh export of file_name, a version chain replaces them.
+    """
+    single_file_path = os.path.join(dir_path, file_name + '.json')
+    if os.path.exists(single_file_path):
+        os.remove(single_file_path)
 
+    if not os.path.exists(manifest_path):
+        return
 
+    with open(manifest_path, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
 
+    if manifest.get('format') != 'per_mesh':
+        return
 
+    for mesh_data in manifest['meshes']:
+        mesh_file_path = os.path.join(dir_path, mesh_data['file'])
+        if os.path.exists(mesh_file_path):
+            os.remove(mesh_file_path)
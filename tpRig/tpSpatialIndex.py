@@ -0,0 +1,549 @@
+"""
+Spatial queries over point sets and triangle meshes, pure NumPy so it runs
+without a Maya session.
+
+Items (points or triangles) are bucketed in a uniform grid, sorted by cell key.
+A batch of queries looks up whole shells of neighbour cells at once, and a query
+is resolved as soon as its best distance is within the radius already covered.
+"""
+from __future__ import division
+
+import numpy as np
+
+
+# largest cell table allocated densely, bigger grids look cells up by binary search
+DENSE_CELL_LIMIT = 1 << 24
+
+
+class _UniformGrid(object):
+    """
+    Shared cell bookkeeping. Subclasses register their items with _build_cells
+    and implement _item_distance.
+    """
+
+    def _build_cells(self, origin, cell_size, extent, cell_key_array, item_id_array):
+        """
+        :param origin: grid minimum corner
+        :param cell_size:
+        :param extent: grid size along each axis
+        :param cell_key_array: cell key of every (cell, item) entry
+        :param item_id_array: item of every (cell, item) entry
+        """
+        self.origin = origin
+        self.cell_size = cell_size
+        self.cell_count = np.floor(extent / cell_size).astype(np.int64) + 1
+
+        order = np.argsort(cell_key_array, kind='stable')
+        self._item_ids = item_id_array[order]
+        sorted_key_array = cell_key_array[order]
+        total_cell_count = int(np.prod(self.cell_count))
+
+        # items of a cell are self._item_ids[start:end]
+        if total_cell_count <= DENSE_CELL_LIMIT:
+            self._unique_keys = None
+            self._cell_start = np.zeros(total_cell_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(sorted_key_array, minlength=total_cell_count), out=self._cell_start[1:])
+        else:
+            self._unique_keys, first = np.unique(sorted_key_array, return_index=True)
+            self._cell_start = np.append(first, len(sorted_key_array)).astype(np.int64)
+
+    def _nearest_items(self, query_points, chunk_size=20000, max_ring=4):
+        """
+        Nearest item for every query point.
+        :return (index_array, distance_array):
+        """
+        query_points = np.asarray(query_points, dtype=np.float64)[:, :3]
+        index_array = np.empty(len(query_points), dtype=np.int64)
+        distance_array = np.empty(len(query_points), dtype=np.float64)
+
+        for start in range(0, len(query_points), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            index_array[chunk], distance_array[chunk] = self._nearest_chunk(query_points[chunk], max_ring)
+
+        return index_array, distance_array
+
+    def _nearest_chunk(self, query_points, max_ring):
+        best_index, best_distance = self._initial_guess(query_points)
+
+        query_cells = self._cell_coordinates(query_points)
+        pending = np.arange(len(query_points))
+
+        for ring in range(max_ring + 1):
+            for offset in _shell_offsets(ring):
+                # skip cells lying further than the best candidate so far
+                cell_ids = query_cells[pending] + offset
+                reachable = self._cell_distance(cell_ids, query_points[pending]) < best_distance[pending]
+                query_ids, item_ids, group_start = self._offset_candidates(cell_ids[reachable])
+
+                if not len(query_ids):
+                    continue
+
+                query_ids = pending[reachable][query_ids]
+                self._update_best(query_points, query_ids, item_ids, group_start, best_index, best_distance)
+
+            # anything not looked at yet is further than ring * cell_size
+            pending = pending[best_distance[pending] > ring * self.cell_size]
+
+            if not len(pending):
+                return best_index, best_distance
+
+        # far away queries - brute force the few that are left
+        all_item_ids = np.arange(self.item_count)
+        group_start = np.array([0, self.item_count], dtype=np.int64)
+        for query_id in pending:
+            self._update_best(query_points, np.array([query_id]), all_item_ids, group_start,
+                              best_index, best_distance)
+
+        return best_index, best_distance
+
+    def _update_best(self, query_points, query_ids, item_ids, group_start, best_index, best_distance):
+        """
+        Keeps the closest of the grouped candidates when it beats the current best.
+        The items of query_ids[i] are item_ids[group_start[i]:group_start[i + 1]].
+        """
+        group_count = np.diff(group_start)
+        candidate_points = np.repeat(query_points[query_ids], group_count, axis=0)
+
+        # cheap bound first, exact distances only for candidates that can still win
+        distance = np.full(len(item_ids), np.inf)
+        viable = self._item_lower_bound(item_ids, candidate_points) < np.repeat(best_distance[query_ids], group_count)
+        distance[viable] = self._item_distance(item_ids[viable], candidate_points[viable])
+
+        group_min = np.minimum.reduceat(distance, group_start[:-1])
+        position = np.where(distance == np.repeat(group_min, group_count), np.arange(len(distance)), -1)
+        group_arg = np.maximum.reduceat(position, group_start[:-1])
+
+        closer = group_min < best_distance[query_ids]
+        best_index[query_ids[closer]] = item_ids[group_arg[closer]]
+        best_distance[query_ids[closer]] = group_min[closer]
+
+    def _initial_guess(self, query_points):
+        """
+        Upper bound to start the search from, nothing by default.
+        """
+        return np.full(len(query_points), -1, dtype=np.int64), np.full(len(query_points), np.inf)
+
+    def _cell_distance(self, cells, points):
+        """
+        Distance from each point to the box of its cell, 0 inside.
+        """
+        cell_min = self.origin + cells * self.cell_size
+        gap = np.maximum(np.maximum(cell_min - points, points - cell_min - self.cell_size), 0.0)
+
+        return np.sqrt(_dot(gap, gap))
+
+    def _offset_candidates(self, cells):
+        """
+        Items registered in cells, grouped per query.
+        :param cells: (query_count, 3) cell coordinates, one per query
+        :return (query_ids, item_ids, group_start): the items of query_ids[i] are
+                item_ids[group_start[i]:group_start[i + 1]], empty cells are dropped
+        """
+        inside = np.all((cells >= 0) & (cells < self.cell_count), axis=1)
+        query_ids = np.nonzero(inside)[0]
+        start, count = self._cell_range(self._cell_key(cells[inside]))
+
+        occupied = count > 0
+        query_ids, start, count = query_ids[occupied], start[occupied], count[occupied]
+
+        group_start = np.zeros(len(count) + 1, dtype=np.int64)
+        np.cumsum(count, out=group_start[1:])
+
+        # expand [start, start + count) ranges into flat sorted positions
+        position = np.repeat(start - group_start[:-1], count) + np.arange(group_start[-1])
+
+        return query_ids, self._item_ids[position], group_start
+
+    def _cell_range(self, keys):
+        if self._unique_keys is None:
+            start = self._cell_start[keys]
+            return start, self._cell_start[keys + 1] - start
+
+        slot = np.clip(np.searchsorted(self._unique_keys, keys), 0, len(self._unique_keys) - 1)
+        start = self._cell_start[slot]
+        count = np.where(self._unique_keys[slot] == keys, self._cell_start[slot + 1] - start, 0)
+
+        return start, count
+
+    def _cell_coordinates(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def _cell_key(self, cells):
+        return (cells[:, 0] * self.cell_count[1] + cells[:, 1]) * self.cell_count[2] + cells[:, 2]
+
+    def _item_lower_bound(self, item_ids, query_points):
+        """
+        Distance no greater than _item_distance, -inf when there is no cheaper bound.
+        """
+        return np.full(len(item_ids), -np.inf)
+
+    def _item_distance(self, item_ids, query_points):
+        raise NotImplementedError
+
+
+class PointGrid(_UniformGrid):
+
+    def __init__(self, points, points_per_cell=2.0):
+        """
+        :param points: (point_count, 3) array, extra columns (MPoint w) are ignored
+        :param points_per_cell: average occupancy of non-empty cells
+        """
+        self.points = np.asarray(points, dtype=np.float64)[:, :3]
+        self.item_count = len(self.points)
+
+        if not self.item_count:
+            raise RuntimeError('PointGrid needs at least one point')
+
+        origin, extent = _padded_bounds(self.points)
+        cell_size = _fit_cell_size(self.points, origin, extent, points_per_cell)
+
+        self._build_cells(origin, cell_size, extent,
+                          _grid_keys(self.points, origin, extent, cell_size),
+                          np.arange(self.item_count))
+
+    def nearest(self, query_points, chunk_size=20000):
+        """
+        Nearest point for every query point.
+        :param query_points: (query_count, 3) array
+        :param chunk_size: queries processed together, bounds memory use
+        :return (index_array, distance_array): indices into self.points
+        """
+        return self._nearest_items(query_points, chunk_size)
+
+    def k_nearest(self, query_points, k, chunk_size=20000, max_ring=4):
+        """
+        k nearest points of every query point, closest first.
+        :param query_points: (query_count, 3) array
+        :param k: capped to the point count
+        :param chunk_size:
+        :param max_ring: rings searched before the queries left are brute forced
+        :return (index_array, distance_array): (query_count, k) arrays
+        """
+        query_points = np.asarray(query_points, dtype=np.float64)[:, :3]
+        k = min(k, self.item_count)
+        index_array = np.empty((len(query_points), k), dtype=np.int64)
+        distance_array = np.empty((len(query_points), k), dtype=np.float64)
+
+        for start in range(0, len(query_points), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            index_array[chunk], distance_array[chunk] = self._k_nearest_chunk(query_points[chunk], k, max_ring)
+
+        return index_array, distance_array
+
+    def within_radius(self, query_points, radius, chunk_size=20000):
+        """
+        Every point within radius of each query point, closest first, in CSR form.
+        :param query_points: (query_count, 3) array
+        :param radius:
+        :param chunk_size:
+        :return (offsets, index_array, distance_array): the points of query q are
+                index_array[offsets[q]:offsets[q + 1]]
+        """
+        query_points = np.asarray(query_points, dtype=np.float64)[:, :3]
+        query_id_list, index_list, distance_list = [], [], []
+
+        for start in range(0, len(query_points), chunk_size):
+            query_ids, index_array, distance_array = self._within_radius_chunk(
+                query_points[start:start + chunk_size], radius)
+            query_id_list.append(query_ids + start)
+            index_list.append(index_array)
+            distance_list.append(distance_array)
+
+        query_ids = np.concatenate(query_id_list) if query_id_list else np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(len(query_points) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(query_ids, minlength=len(query_points)), out=offsets[1:])
+
+        if not query_id_list:
+            return offsets, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        return offsets, np.concatenate(index_list), np.concatenate(distance_list)
+
+    def _k_nearest_chunk(self, query_points, k, max_ring):
+        best_index = np.full((len(query_points), k), -1, dtype=np.int64)
+        best_distance = np.full((len(query_points), k), np.inf)
+
+        query_cells = self._cell_coordinates(query_points)
+        pending = np.arange(len(query_points))
+
+        for ring in range(max_ring + 1):
+            query_id_list, item_id_list = [], []
+
+            for offset in _shell_offsets(ring):
+                # skip cells lying further than the current k-th candidate
+                cell_ids = query_cells[pending] + offset
+                reachable = self._cell_distance(cell_ids, query_points[pending]) < best_distance[pending, -1]
+                query_ids, item_ids, group_start = self._offset_candidates(cell_ids[reachable])
+
+                query_id_list.append(np.repeat(pending[reachable][query_ids], np.diff(group_start)))
+                item_id_list.append(item_ids)
+
+            self._merge_k_best(query_points, np.concatenate(query_id_list), np.concatenate(item_id_list),
+                               best_index, best_distance)
+
+            # anything not looked at yet is further than ring * cell_size
+            pending = pending[best_distance[pending, -1] > ring * self.cell_size]
+
+            if not len(pending):
+                return best_index, best_distance
+
+        # far away queries - brute force the few that are left
+        for query_id in pending:
+            distance = np.linalg.norm(self.points - query_points[query_id], axis=1)
+            nearest = np.argsort(distance, kind='stable')[:k]
+            best_index[query_id], best_distance[query_id] = nearest, distance[nearest]
+
+        return best_index, best_distance
+
+    def _merge_k_best(self, query_points, query_ids, item_ids, best_index, best_distance):
+        """
+        Merges the candidates with the current k best of their query, rings never repeat an item.
+        """
+        if not len(query_ids):
+            return
+
+        k = best_index.shape[1]
+        touched = np.unique(query_ids)
+
+        all_query_ids = np.concatenate([np.repeat(touched, k), query_ids])
+        all_item_ids = np.concatenate([best_index[touched].ravel(), item_ids])
+        all_distance = np.concatenate([best_distance[touched].ravel(),
+                                       self._item_distance(item_ids, query_points[query_ids])])
+
+        order = np.lexsort((all_distance, all_query_ids))
+        sorted_query_ids = all_query_ids[order]
+        group_start = np.searchsorted(sorted_query_ids, touched)
+        rank = np.arange(len(order)) - np.repeat(group_start, np.diff(np.append(group_start, len(order))))
+
+        keep = rank < k
+        best_index[sorted_query_ids[keep], rank[keep]] = all_item_ids[order][keep]
+        best_distance[sorted_query_ids[keep], rank[keep]] = all_distance[order][keep]
+
+    def _within_radius_chunk(self, query_points, radius):
+        query_cells = self._cell_coordinates(query_points)
+        query_id_list, item_id_list, distance_list = [], [], []
+
+        for ring in range(int(np.ceil(radius / self.cell_size)) + 1):
+            for offset in _shell_offsets(ring):
+                cell_ids = query_cells + offset
+                reachable = np.nonzero(self._cell_distance(cell_ids, query_points) <= radius)[0]
+                query_ids, item_ids, group_start = self._offset_candidates(cell_ids[reachable])
+
+                query_ids = np.repeat(reachable[query_ids], np.diff(group_start))
+                distance = self._item_distance(item_ids, query_points[query_ids])
+                inside = distance <= radius
+
+                query_id_list.append(query_ids[inside])
+                item_id_list.append(item_ids[inside])
+                distance_list.append(distance[inside])
+
+        query_ids = np.concatenate(query_id_list)
+        distance = np.concatenate(distance_list)
+        order = np.lexsort((distance, query_ids))
+
+        return query_ids[order], np.concatenate(item_id_list)[order], distance[order]
+
+    def _item_distance(self, item_ids, query_points):
+        return np.linalg.norm(self.points[item_ids] - query_points, axis=1)
+
+
+class TriangleGrid(_UniformGrid):
+
+    def __init__(self, points, triangles):
+        """
+        Each triangle is registered in every cell its bounding box overlaps.
+        :param points: (point_count, 3) array
+        :param triangles: (triangle_count, 3) point indices
+        """
+        self.points = np.asarray(points, dtype=np.float64)[:, :3]
+        self.triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        self.item_count = len(self.triangles)
+
+        if not self.item_count:
+            raise RuntimeError('TriangleGrid needs at least one triangle')
+
+        corners = self.points[self.triangles]
+        self._triangle_min = triangle_min = corners.min(axis=1)
+        self._triangle_max = triangle_max = corners.max(axis=1)
+
+        origin, extent = _padded_bounds(self.points)
+        cell_size = max(np.mean((triangle_max - triangle_min).max(axis=1)), extent.max() * 1e-4)
+        cell_count = np.floor(extent / cell_size).astype(np.int64) + 1
+
+        cell_min = np.floor((triangle_min - origin) / cell_size).astype(np.int64)
+        span = np.floor((triangle_max - origin) / cell_size).astype(np.int64) - cell_min + 1
+        entry_count = np.prod(span, axis=1)
+
+        # one entry per (triangle, overlapped cell)
+        triangle_ids = np.repeat(np.arange(self.item_count), entry_count)
+        local = np.arange(entry_count.sum()) - np.repeat(np.cumsum(entry_count) - entry_count, entry_count)
+        span_yz = (span[:, 1] * span[:, 2])[triangle_ids]
+        span_z = span[triangle_ids, 2]
+        cells = cell_min[triangle_ids] + np.stack([local // span_yz, (local % span_yz) // span_z, local % span_z],
+                                                  axis=1)
+        cell_key_array = (cells[:, 0] * cell_count[1] + cells[:, 1]) * cell_count[2] + cells[:, 2]
+
+        self._build_cells(origin, cell_size, extent, cell_key_array, triangle_ids)
+
+        # triangles around each point, seeds the search from the nearest point
+        corner_order = np.argsort(self.triangles.ravel(), kind='stable')
+        self._point_triangles = corner_order // 3
+        self._point_triangle_start = np.zeros(len(self.points) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.triangles.ravel(), minlength=len(self.points)), out=self._point_triangle_start[1:])
+        self._point_grid = PointGrid(self.points)
+
+    def nearest(self, query_points, chunk_size=20000):
+        """
+        Closest triangle for every query point.
+        :param query_points: (query_count, 3) array
+        :param chunk_size:
+        :return (triangle_index_array, distance_array):
+        """
+        return self._nearest_items(query_points, chunk_size)
+
+    def closest_points(self, query_points, chunk_size=20000):
+        """
+        Projects every query point on the mesh.
+        :param query_points: (query_count, 3) array
+        :param chunk_size:
+        :return (triangle_index_array, barycentric_array, distance_array): barycentric_array
+                is (query_count, 3), one weight per corner of the closest triangle
+        """
+        query_points = np.asarray(query_points, dtype=np.float64)[:, :3]
+        triangle_index_array, distance_array = self._nearest_items(query_points, chunk_size)
+
+        corners = self.points[self.triangles[triangle_index_array]]
+        barycentric_array = closest_point_on_triangles(query_points, corners[:, 0], corners[:, 1], corners[:, 2])[1]
+
+        return triangle_index_array, barycentric_array, distance_array
+
+    def _initial_guess(self, query_points):
+        best_index, best_distance = _UniformGrid._initial_guess(self, query_points)
+
+        point_ids = self._point_grid.nearest(query_points)[0]
+        start = self._point_triangle_start[point_ids]
+        count = self._point_triangle_start[point_ids + 1] - start
+
+        # loose points belong to no triangle and give no bound
+        query_ids = np.nonzero(count)[0]
+        start, count = start[query_ids], count[query_ids]
+        group_start = np.zeros(len(count) + 1, dtype=np.int64)
+        np.cumsum(count, out=group_start[1:])
+        position = np.repeat(start - group_start[:-1], count) + np.arange(group_start[-1])
+
+        if len(query_ids):
+            self._update_best(query_points, query_ids, self._point_triangles[position], group_start,
+                              best_index, best_distance)
+
+        return best_index, best_distance
+
+    def _item_lower_bound(self, item_ids, query_points):
+        # distance to the triangle bounding box
+        gap = np.maximum(np.maximum(self._triangle_min[item_ids] - query_points,
+                                    query_points - self._triangle_max[item_ids]), 0.0)
+
+        return np.sqrt(_dot(gap, gap))
+
+    def _item_distance(self, item_ids, query_points):
+        corners = self.points[self.triangles[item_ids]]
+        closest = closest_point_on_triangles(query_points, corners[:, 0], corners[:, 1], corners[:, 2])[0]
+
+        return np.linalg.norm(closest - query_points, axis=1)
+
+
+def closest_point_on_triangles(points, a, b, c):
+    """
+    Closest point on triangle (a, b, c) for each point, all arrays (n, 3).
+    Vectorized Voronoi region test from Ericson, Real-Time Collision Detection 5.1.5.
+
+    :return (closest_points, barycentric): barycentric is (n, 3) weights of a, b, c
+    """
+    ab, ac = b - a, c - a
+    ap, bp, cp = points - a, points - b, points - c
+
+    d1, d2 = _dot(ab, ap), _dot(ac, ap)
+    d3, d4 = _dot(ab, bp), _dot(ac, bp)
+    d5, d6 = _dot(ab, cp), _dot(ac, cp)
+
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    # face region first, then the regions taking precedence over it, lowest priority first
+    denominator = va + vb + vc
+    v = _safe_divide(vb, denominator)
+    w = _safe_divide(vc, denominator)
+    barycentric = np.stack([1.0 - v - w, v, w], axis=1)
+
+    edge_bc = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+    t = _safe_divide(d4 - d3, (d4 - d3) + (d5 - d6))
+    barycentric[edge_bc] = np.stack([np.zeros_like(t), 1.0 - t, t], axis=1)[edge_bc]
+
+    edge_ac = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+    t = _safe_divide(d2, d2 - d6)
+    barycentric[edge_ac] = np.stack([1.0 - t, np.zeros_like(t), t], axis=1)[edge_ac]
+
+    barycentric[(d6 >= 0) & (d5 <= d6)] = (0.0, 0.0, 1.0)
+
+    edge_ab = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+    t = _safe_divide(d1, d1 - d3)
+    barycentric[edge_ab] = np.stack([1.0 - t, t, np.zeros_like(t)], axis=1)[edge_ab]
+
+    barycentric[(d3 >= 0) & (d4 <= d3)] = (0.0, 1.0, 0.0)
+    barycentric[(d1 <= 0) & (d2 <= 0)] = (1.0, 0.0, 0.0)
+
+    closest_points = a * barycentric[:, 0:1] + b * barycentric[:, 1:2] + c * barycentric[:, 2:3]
+
+    return closest_points, barycentric
+
+
+def _shell_offsets(ring):
+    """
+    Cell offsets at Chebyshev distance ring from the centre cell.
+    """
+    axis = np.arange(-ring, ring + 1)
+    offset_array = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1).reshape(-1, 3)
+
+    return offset_array[np.abs(offset_array).max(axis=1) == ring]
+
+
+def _padded_bounds(points):
+    origin = points.min(axis=0)
+    extent = points.max(axis=0) - origin
+    # flat or single point sets still need a volume to size the cells
+    extent = np.maximum(extent, max(extent.max() * 1e-3, 1e-6))
+
+    return origin, extent
+
+
+def _fit_cell_size(points, origin, extent, points_per_cell, iterations=4):
+    """
+    Cell size giving about points_per_cell points per non-empty cell. Starts from
+    the volume estimate and refines it, mesh vertices lie on a surface and fill
+    far fewer cells than points spread through the bounding box would.
+    """
+    cell_size = (np.prod(extent) * points_per_cell / len(points)) ** (1.0 / 3.0)
+
+    for _ in range(iterations):
+        occupancy = len(points) / len(np.unique(_grid_keys(points, origin, extent, cell_size)))
+
+        if 0.5 * points_per_cell <= occupancy <= 2.0 * points_per_cell:
+            break
+
+        cell_size *= (points_per_cell / occupancy) ** 0.5
+
+    return cell_size
+
+
+def _grid_keys(points, origin, extent, cell_size):
+    cell_count = np.floor(extent / cell_size).astype(np.int64) + 1
+    cells = np.floor((points - origin) / cell_size).astype(np.int64)
+
+    return (cells[:, 0] * cell_count[1] + cells[:, 1]) * cell_count[2] + cells[:, 2]
+
+
+def _dot(vector_a, vector_b):
+    return np.einsum('ij,ij->i', vector_a, vector_b)
+
+
+def _safe_divide(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
@@ -2,7 +2,6 @@ from __future__ import division
 import maya.cmds as mc
 import maya.cmds as cmds
 import maya.OpenMaya as om
-import maya.api.OpenMaya as om2
 import maya.OpenMayaUI as OpenMayaUI
 import importlib
 import json
@@ -11,6 +10,9 @@ import glob
 import math
 import os
 
+import tpRig.tpBlendShapeData as tpBlendShapeData
+import tpRig.tpMeshData as tpMeshData
+
 
 # -------------------------------------------------------------------------------
 # Name:        tp_utilityTools v4
@@ -773,15 +775,15 @@ def get_image_size(file_path):
 
 def mirror_vertex_selection(vert_list, mesh):
     """
-    Mirror selection translation values and feeds to getClosest function
+    Mirror selection translation values and finds the nearest vertex of the closest face to each
     """
     vert_list = cmds.filterExpand(vert_list, sm=31)
-    mirror_vert_list = []
+    vert_pos_list = cmds.xform(vert_list, q=1, t=1)
+    mirror_pos_list = [[vert_pos_list[i] * -1, vert_pos_list[i + 1], vert_pos_list[i + 2]]
+                       for i in range(0, len(vert_pos_list), 3)]
 
-    for vert in vert_list:
-        vert_pos = cmds.xform(vert, q=1, t=1)
-        mirror_pos = [(vert_pos[0] * -1), vert_pos[1], vert_pos[2]]
-        mirror_vert_list.append(get_closest_vertex_v2(mesh, mirror_pos))
+    vertex_ids = tpMeshData.get_closest_face_vertex_ids(mesh, mirror_pos_list)
+    mirror_vert_list = ['{}.vtx[{}]'.format(mesh, vertex_id) for vertex_id in vertex_ids.tolist()]
 
     # cmds.select(mirror_vert_list, r=1)
 
@@ -791,74 +793,20 @@ def mirror_vertex_selection(vert_list, mesh):
 def get_closest_vertex_v2(maya_mesh, pos=(0, 0, 0)):
     """
     Returns the closest vertex given a mesh and a position [x,y,z] in world space.
-    Uses om2.MfnMesh.getClosestPoint() returned face ID and iterates through face's vertices
+    Nearest vertex of the closest face, see tpMeshData.get_closest_face_vertex_ids
     """
+    vertex_id = tpMeshData.get_closest_face_vertex_ids(maya_mesh, [pos])[0]
 
-    # Using MVector type to represent position
-    m_vector = om2.MVector(pos)
-    selection_list = om2.MSelectionList()
-    selection_list.add(maya_mesh)
-    d_path = selection_list.getDagPath(0)
-    m_mesh = om2.MFnMesh(d_path)
-    # Getting closest face ID
-    face_id = m_mesh.getClosestPoint(om2.MPoint(m_vector), space=om2.MSpace.kWorld)[1]
-    # Face's vertices list
-    vert_list = cmds.ls(cmds.polyListComponentConversion('{}.f[{}]'.format(maya_mesh, face_id), ff=True, tv=True),
-                        flatten=True)
-
-    # Setting vertex [0] as the closest one
-    dist_01 = om2.MVector(cmds.xform(vert_list[0], t=True, ws=True, q=True))
-    smallest_dist = math.sqrt((dist_01.x - pos[0])**2 + (dist_01.y - pos[1])**2 + (dist_01.z - pos[2])**2)
-    # Using distance squared to compare distance
-    closest = vert_list[0]
-
-    # Iterating from vertex [1]
-    for i in range(1, len(vert_list)):
-        dist_02 = om2.MVector(cmds.xform(vert_list[i], t=True, ws=True, q=True))
-        euc_dist = math.sqrt((dist_02.x - pos[0])**2 + (dist_02.y - pos[1])**2 + (dist_02.z - pos[2])**2)
-
-        if euc_dist <= smallest_dist:
-            smallest_dist = euc_dist
-            closest = vert_list[i]
-
-    return closest
+    return '{}.vtx[{}]'.format(maya_mesh, vertex_id)
 
 
 # Not in use
 def get_closest_vertex(maya_mesh, pos=(0, 0, 0)):
     """
     Returns the closest vertex given a mesh and a position [x,y,z] in world space.
-    Uses om2.MfnMesh.getClosestPoint() returned face ID and iterates through face's vertices
+    Same as get_closest_vertex_v2
     """
-
-    # Using MVector type to represent position
-    m_vector = om2.MVector(pos)
-    selection_list = om2.MSelectionList()
-    selection_list.add(maya_mesh)
-    d_path = selection_list.getDagPath(0)
-    m_mesh = om2.MFnMesh(d_path)
-    # Getting closest face ID
-    face_id = m_mesh.getClosestPoint(om2.MPoint(m_vector), space=om2.MSpace.kWorld)[1]
-    # Face's vertices list
-    vert_list = cmds.ls(cmds.polyListComponentConversion('{}.f[{}]'.format(maya_mesh, face_id), ff=True, tv=True),
-                        flatten=True)
-
-    # Setting vertex [0] as the closest one
-    d = m_vector - om2.MVector(cmds.xform(vert_list[0], t=True, ws=True, q=True))
-    # Using distance squared to compare distance
-    smallest_dist_02 = d.x * d.x + d.y * d.y + d.z * d.z
-    closest = vert_list[0]
-
-    # Iterating from vertex [1]
-    for i in range(1, len(vert_list)):
-        d = m_vector - om2.MVector(cmds.xform(vert_list[i], t=True, ws=True, q=True))
-        d2 = d.x * d.x + d.y * d.y + d.z * d.z
-
-        if d2 < smallest_dist_02:
-            smallest_dist_02 = d2
-            closest = vert_list[i]
-
-    return closest
+    return get_closest_vertex_v2(maya_mesh, pos)
 
 
 def x_direction_positive(curve):
@@ -1409,28 +1357,18 @@ def split_list_in_n_chunks(item_list, amount):
     return chunks_list
 
 
-# import maya.cmds as cmds
-# import maya.OpenMaya as om
-# import csv
-# import os
-#
-# filepath =  "E:/tpaulino_projects/015_Itsme_Aakash/Female_Shapes/assets/BlendshapeTracks/blendshape_data_1.txt"
-# meshName = 'blendShape4'
-# meshName1 = 'blendShape1'
-# meshName2 = 'blendShape2'
-# prefix = 'exp_'
-#
-# with open(filepath, 'rt') as csvfile:
-#     reader = csv.reader(csvfile, delimiter=',')
-#     header = next(reader)
-#     rowIndex = 0
-#     for row in reader:
-#         cmds.currentTime(int(rowIndex), update=True)
-#         for x in range(0,51):
-#             value = float(row[x])
-#             blendShapeName = header[x]
-#             cmds.setKeyframe(meshName, at=prefix + blendShapeName + "_Mesh", value=value, time=rowIndex)
-#         rowIndex += 1
+# BLENDSHAPE CAPTURE SECTION ________________________________________________________
+def import_blend_shape_capture(file_path, blend_shape_node_list, prefix='exp_', suffix='_Mesh'):
+    """
+    Keys a per-frame blendShape capture file (csv, header of channel names, one row per frame)
+    on the targets named prefix + channel + suffix, see tpBlendShapeData.import_capture_csv.
+    :param file_path:
+    :param blend_shape_node_list:
+    :param prefix:
+    :param suffix:
+    :return import_report:
+    """
+    return tpBlendShapeData.import_capture_csv(file_path, blend_shape_node_list, prefix=prefix, suffix=suffix)
 
 
 def export_each_selection(folder='', file_name='', extension='obj'):